@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Time the round trips between the multi-agent backend and a local bui-agent
+(with both engines when available) serving the fake burp-1 status server.
+
+Usage::
+
+    python benchmarks/agent.py [--clients 100] [--backups 10] [--files 100] [--running 1] [--repeat 20] [--concurrency 8] [--json]
+"""
+import os
+import sys
+import socket
+import logging
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from suite import Environment, add_arguments, fleet_from, measure, report  # noqa
+
+AGENT_CONF = u"""[Global]
+port: {port}
+bind: 127.0.0.1
+ssl: false
+version: 1
+password: benchmark
+threads: {threads}
+engine: {engine}
+
+"""
+
+
+class App(object):
+    """The bare minimum the agent client expects from the application"""
+    logger = logging.getLogger('burpui.benchmark')
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_agent(env, engine, threads):
+    """Starts a bui-agent in a background thread and returns its port"""
+    from burpui.agent import BUIAgent
+    port = free_port()
+    conf = env.burp1_conf(AGENT_CONF.format(port=port, threads=threads, engine=engine))
+    agent = BUIAgent(conf)
+    thread = threading.Thread(target=agent.run, name='agent-{}'.format(engine))
+    thread.daemon = True
+    thread.start()
+    return agent, port
+
+
+def stop_agent(agent):
+    loop = getattr(agent.server, 'loop', None)
+    if loop is not None:
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def concurrent(client, func, count):
+    """Returns a function running *count* calls at once"""
+    def run():
+        workers = [threading.Thread(target=func, args=(client(),)) for _ in range(count)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    return run
+
+
+def run(fleet, options):
+    from burpui.misc.backend.multi import NClient
+
+    engines = ['threaded']
+    if sys.version_info >= (3, 5):
+        engines.append('asyncio')
+    concurrency = getattr(options, 'concurrency', 8)
+    idle = [x for x in fleet.names if x not in fleet.running]
+    name = idle[0] if idle else fleet.names[0]
+    results = []
+    with Environment(fleet) as env:
+        for engine in engines:
+            agent, port = start_agent(env, engine, concurrency)
+
+            def client():
+                return NClient(App(), '127.0.0.1', port, 'benchmark', False, 30)
+
+            cli = client()
+            # wait for the agent to be up
+            measure(lambda: cli.get_all_clients(), 1)
+            cases = [
+                ('get_all_clients', lambda: cli.get_all_clients()),
+                ('get_client', lambda: cli.get_client(name)),
+                ('get_tree', lambda: cli.get_tree(name, fleet.backups)),
+                ('get_all_clients x{}'.format(concurrency), concurrent(client, lambda x: x.get_all_clients(), concurrency)),
+            ]
+            try:
+                for (case, func) in cases:
+                    res = measure(func, options.repeat)
+                    res['case'] = '{}.{}'.format(engine, case)
+                    results.append(res)
+            finally:
+                stop_agent(agent)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    add_arguments(parser)
+    parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent requests (and agent threads)')
+    options = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    fleet = fleet_from(options)
+    report('agent', fleet, run(fleet, options), options.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Time the main API endpoints of a standalone burp-ui using the fake burp-1
+status server, with a cold and a warm cache.
+
+Usage::
+
+    python benchmarks/api.py [--clients 100] [--backups 10] [--files 100] [--running 1] [--repeat 20] [--json]
+"""
+import os
+import sys
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from suite import Environment, add_arguments, fleet_from, measure, report  # noqa
+
+BUI_CONF = u"""[Global]
+port: 5000
+bind: 127.0.0.1
+ssl: false
+version: 1
+standalone: true
+auth: none
+
+[UI]
+refresh: 15
+
+"""
+
+
+def application(env):
+    """Returns a burp-ui application using the fake burp server"""
+    from burpui import init as BUIinit
+    conf = env.burp1_conf(BUI_CONF)
+    app = BUIinit(gunicorn=False, unittest=True)
+    app.config['TESTING'] = True
+    app.config['LOGIN_DISABLED'] = True
+    app.config['CFG'] = conf
+    app.setup(conf)
+    app.login_manager.init_app(app)
+    return app
+
+
+def endpoints(fleet):
+    """Returns the (endpoint, arguments) to time"""
+    idle = [x for x in fleet.names if x not in fleet.running]
+    name = idle[0] if idle else fleet.names[0]
+    ret = [
+        ('api.clients_stats', {}),
+        ('api.running_backup', {}),
+        ('api.client_stats', {'name': name}),
+        ('api.client_tree', {'name': name, 'backup': fleet.backups}),
+        ('api.summary', {}),
+    ]
+    if fleet.running:
+        ret.append(('api.counters', {'name': sorted(fleet.running)[0]}))
+    return ret
+
+
+def request(app, client, url, cold):
+    """Returns a function requesting *url*"""
+    from burpui.api import api
+
+    def run():
+        if cold:
+            with app.app_context():
+                api.cache.clear()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise Exception('{} returned {}'.format(url, response.status_code))
+    return run
+
+
+def run(fleet, options):
+    from flask import url_for
+
+    results = []
+    with Environment(fleet) as env:
+        app = application(env)
+        client = app.test_client()
+        for (endpoint, args) in endpoints(fleet):
+            with app.test_request_context():
+                url = url_for(endpoint, **args)
+            for cold in [True, False]:
+                res = measure(request(app, client, url, cold), options.repeat)
+                res['case'] = '{}[{}]'.format(endpoint, 'cold' if cold else 'warm')
+                results.append(res)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    add_arguments(parser)
+    options = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    fleet = fleet_from(options)
+    report('api', fleet, run(fleet, options), options.json)
+
+
+if __name__ == '__main__':
+    main()
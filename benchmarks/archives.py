@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Compare the time needed to generate restoration archives in every supported
+format on a synthetic set of files mixing text, binary, random (already
+compressed-like) and sparse data.
+
+Usage::
+
+    python benchmarks/archives.py [--size 64] [--files 200] [--json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from burpui.utils import BUIstream  # noqa
+
+
+def generate(root, size, files):
+    """Generate about *size* MB of data split in *files* files"""
+    rand = random.Random(42)
+    words = [u'backup', u'restore', u'client', u'server', u'burp', u'error',
+             u'warning', u'file', u'directory', u'size', u'time', u'ok']
+    per_file = max(1, size * 1024 * 1024 // files)
+    kinds = ['log', 'bin', 'jpg', 'img', 'rnd']
+    for i in range(files):
+        kind = kinds[i % len(kinds)]
+        dirname = os.path.join(root, kind, str(i % 10))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        path = os.path.join(dirname, 'file{}.{}'.format(i, kind))
+        with open(path, 'wb') as fileobj:
+            if kind == 'log':
+                # highly compressible text
+                lines = []
+                length = 0
+                while length < per_file:
+                    line = u' '.join(rand.choice(words) for _ in range(12)) + u'\n'
+                    lines.append(line)
+                    length += len(line)
+                fileobj.write(u''.join(lines).encode('utf-8')[:per_file])
+            elif kind == 'bin':
+                # somewhat compressible binary data
+                fileobj.write(bytes(bytearray(rand.randint(0, 15) for _ in range(per_file // 16))) * 16)
+            elif kind == 'img':
+                # sparse data (think of a VM image)
+                fileobj.write(b'\0' * (per_file - 4096) + os.urandom(4096))
+            else:
+                # random data behaves like already compressed files
+                fileobj.write(os.urandom(per_file))
+
+
+def walk(root):
+    for dirname, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(dirname, filename)
+            yield path, path[len(root) + 1:]
+
+
+def bench(root, archive, level=None):
+    start = time.time()
+    arch = BUIstream(archive, level=level)
+    size = 0
+    for path, arcname in walk(root):
+        for chunk in arch.add(path, arcname):
+            size += len(chunk)
+    for chunk in arch.close():
+        size += len(chunk)
+    return time.time() - start, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=64, help='amount of data to generate in MB')
+    parser.add_argument('--files', type=int, default=200, help='number of files to generate')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    options = parser.parse_args()
+
+    cases = [
+        ('zip', None),
+        ('zip', 1),
+        ('zip', 9),
+        ('zip-stored', None),
+        ('tar', None),
+        ('tar.gz', 1),
+        ('tar.gz', None),
+        ('tar.bz2', 1),
+        ('tar.bz2', None),
+    ]
+    root = tempfile.mkdtemp(prefix='bui-bench-')
+    results = []
+    try:
+        generate(root, options.size, options.files)
+        total = sum(os.path.getsize(path) for path, _ in walk(root))
+        for archive, level in cases:
+            elapsed, size = bench(root, archive, level)
+            results.append({
+                'format': archive,
+                'level': level,
+                'seconds': round(elapsed, 3),
+                'size': size,
+                'ratio': round(float(size) / total, 3),
+                'throughput': round(total / elapsed / 1024 / 1024, 1),
+            })
+    finally:
+        shutil.rmtree(root)
+
+    if options.json:
+        print(json.dumps({'input': total, 'results': results}, indent=2))
+        return
+
+    print('{} files, {:.1f} MB of input data'.format(options.files, total / 1024.0 / 1024))
+    print('{:<12}{:>7}{:>10}{:>14}{:>8}{:>10}'.format('format', 'level', 'seconds', 'size', 'ratio', 'MB/s'))
+    for res in results:
+        print('{:<12}{:>7}{:>10.3f}{:>14}{:>8.3f}{:>10.1f}'.format(
+            res['format'],
+            res['level'] if res['level'] is not None else '-',
+            res['seconds'],
+            res['size'],
+            res['ratio'],
+            res['throughput'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Time the main methods of the burp-1 and burp-2 backends against the fake
+burp servers.
+
+Usage::
+
+    python benchmarks/backends.py [--clients 100] [--backups 10] [--files 100] [--running 1] [--repeat 20] [--json]
+"""
+import os
+import sys
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from suite import Environment, add_arguments, fleet_from, measure, report  # noqa
+
+
+def cases(cli, fleet):
+    """Returns the (name, callable) of the backend methods to time"""
+    idle = [x for x in fleet.names if x not in fleet.running]
+    name = idle[0] if idle else fleet.names[0]
+    ret = [
+        ('get_all_clients', lambda: cli.get_all_clients()),
+        ('is_one_backup_running', lambda: cli.is_one_backup_running()),
+        ('get_client', lambda: cli.get_client(name)),
+        ('get_backup_logs', lambda: cli.get_backup_logs(fleet.backups, name)),
+        ('get_tree', lambda: cli.get_tree(name, fleet.backups)),
+        # the report of every client needs the logs of all their backups
+        ('get_clients_report[10]', lambda: cli.get_clients_report([{'name': x} for x in fleet.names[:10]])),
+    ]
+    if fleet.running:
+        running = sorted(fleet.running)[0]
+        ret.append(('get_counters', lambda: cli.get_counters(running)))
+    return ret
+
+
+def backend(env, version):
+    """Instantiate a backend using the fake servers"""
+    if version == 1:
+        from burpui.misc.backend.burp1 import Burp
+        return Burp(conf=env.burp1_conf())
+    from burpui.misc.backend.burp2 import Burp
+    return Burp(conf=env.burp2_conf())
+
+
+def run(fleet, options):
+    results = []
+    with Environment(fleet) as env:
+        for version in [1, 2]:
+            cli = backend(env, version)
+            try:
+                for (name, func) in cases(cli, fleet):
+                    res = measure(func, options.repeat)
+                    res['case'] = 'burp{}.{}'.format(version, name)
+                    results.append(res)
+            finally:
+                if version == 2:
+                    cli._kill_burp()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    add_arguments(parser)
+    options = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    fleet = fleet_from(options)
+    report('backends', fleet, run(fleet, options), options.json)
+
+
+if __name__ == '__main__':
+    main()
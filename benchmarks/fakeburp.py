@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Stand-ins for a burp server used by the benchmarks: a local TCP server
+speaking the burp-1 status protocol and a fake ``burp -a m`` executable
+speaking the burp-2 JSON monitor protocol. Both serve a generated fleet of
+clients.
+
+Usage::
+
+    # burp-1 status server
+    python benchmarks/fakeburp.py --port 4972 [--clients 100] [--backups 10] [--files 100] [--running 1]
+    # burp-2 monitor (the fleet is read from the BUI_FAKE_FLEET environment
+    # variable, ie. "clients=100,backups=10,files=100,running=1")
+    python benchmarks/fakeburp.py -c /etc/burp/burp.conf -a m
+"""
+import os
+import sys
+import json
+import stat
+import time
+import zlib
+import argparse
+import threading
+
+from six.moves import socketserver
+
+VERSION = '2.0.54'
+DAY = 24 * 3600
+
+
+class Fleet(object):
+    """A generated set of clients.
+
+    :param clients: Number of clients
+    :type clients: int
+
+    :param backups: Number of backups per client
+    :type backups: int
+
+    :param files: Number of entries per directory
+    :type files: int
+
+    :param running: Number of clients currently running a backup
+    :type running: int
+    """
+
+    def __init__(self, clients=10, backups=5, files=100, running=0, now=None):
+        self.clients = clients
+        self.backups = backups
+        self.files = files
+        self.names = ['client{:05d}'.format(i) for i in range(clients)]
+        self.running = set(self.names[:running])
+        self.now = int(now or time.time())
+
+    @classmethod
+    def from_string(cls, spec):
+        """Builds a fleet from a "clients=100,backups=10" like string"""
+        kwargs = {}
+        for item in (spec or '').split(','):
+            if '=' in item:
+                key, val = item.split('=', 1)
+                kwargs[key.strip()] = int(val)
+        return cls(**kwargs)
+
+    def to_string(self):
+        return 'clients={},backups={},files={},running={}'.format(
+            self.clients, self.backups, self.files, len(self.running)
+        )
+
+    def history(self, name):
+        """Returns the (number, timestamp) of the backups of a client, the most
+        recent first"""
+        if name not in self.names:
+            return []
+        return [(num, self.now - (self.backups - num + 1) * DAY) for num in range(self.backups, 0, -1)]
+
+    def entries(self, name, number, path):
+        """Returns the (name, is_dir, size, mtime) of the entries of a
+        directory. A tenth of them are directories."""
+        seed = zlib.crc32('{}:{}:{}'.format(name, number, path).encode('utf-8')) & 0xffff
+        dirs = self.files // 10
+        ret = []
+        for i in range(self.files):
+            if i < dirs:
+                ret.append(('dir{}'.format(i), True, 4096, self.now - seed))
+            else:
+                ret.append(('file{}.dat'.format(i), False, (seed * (i + 1)) % (64 * 1024 * 1024), self.now - seed - i))
+        return ret
+
+    def stats(self, name, number):
+        """Returns the counters of a backup"""
+        seed = zlib.crc32('{}:{}'.format(name, number).encode('utf-8')) & 0xffff
+        files = 1000 + seed
+        return {
+            'start': self.now - (self.backups - number + 1) * DAY,
+            'taken': 60 + seed % 3600,
+            'bytes': files * 4096,
+            'received': (seed % 100) * 4096,
+            'files': [seed % 100, seed % 50, files, seed % 10, files],
+            'dirs': [seed % 10, 0, files // 10, 0, files // 10],
+            'total': [seed % 110, seed % 50, files + files // 10, seed % 10, files + files // 10],
+        }
+
+    def progress(self, name):
+        """Returns the counters of a running backup"""
+        seed = zlib.crc32(name.encode('utf-8')) & 0xffff
+        estimated = (1000 + seed) * 4096 * 4
+        return {
+            'files': [seed % 100, seed % 50, 1000 + seed, seed % 10, 1000 + seed],
+            'estimated': estimated,
+            'bytes': estimated // 3,
+            'start': self.now - 600,
+        }
+
+
+def _mode(is_dir):
+    if is_dir:
+        return stat.S_IFDIR | 0o755
+    return stat.S_IFREG | 0o644
+
+
+def _ls_mode(is_dir):
+    return 'drwxr-xr-x' if is_dir else '-rw-r--r--'
+
+
+def parse_query(query):
+    """Splits a status query in a dict: 'c:client:b:1' -> {'c': 'client', 'b': '1'}"""
+    query = query.strip()
+    parts = query.split(':')
+    ret = {}
+    i = 0
+    while i < len(parts) - 1:
+        if parts[i] == 'p':
+            # paths may contain ':'
+            ret['p'] = ':'.join(parts[i + 1:])
+            break
+        ret[parts[i]] = parts[i + 1]
+        i += 2
+    return ret
+
+
+def burp1_answer(fleet, query):
+    """Returns the lines a burp-1 server would answer to a status query"""
+    qry = parse_query(query)
+    name = qry.get('c')
+    if not name:
+        lines = []
+        for cli in fleet.names:
+            history = fleet.history(cli)
+            if cli in fleet.running:
+                lines.append('{}\t1\tr\t2'.format(cli))
+            elif not history:
+                lines.append('{}\t1\ti\t0'.format(cli))
+            else:
+                lines.append('{}\t1\ti\t{} 0 {}'.format(cli, *history[0]))
+        return lines
+    history = fleet.history(name)
+    if not history:
+        return []
+    if 'b' not in qry:
+        if name in fleet.running:
+            prog = fleet.progress(name)
+            counters = ['2'] + ['/'.join(str(x) for x in prog['files'][:4])] * 14
+            counters += ['0', str(prog['estimated']), str(prog['bytes']), str(prog['bytes']), '0', str(prog['start']), '/home']
+            return ['{}\t2\tr\t{}'.format(name, '\t'.join(counters))]
+        backups = '\t'.join('{} {} {}'.format(num, int(num != history[0][0]), stamp) for (num, stamp) in history)
+        return ['{}\t2\ti\t{}'.format(name, backups)]
+    number = int(qry['b'])
+    if 'f' in qry:
+        if qry['f'] != 'backup_stats':
+            return []
+        stats = fleet.stats(name, number)
+        lines = ['client_is_windows:0']
+        lines.append('time_start:{}'.format(stats['start']))
+        lines.append('time_end:{}'.format(stats['start'] + stats['taken']))
+        lines.append('time_taken:{}'.format(stats['taken']))
+        lines.append('bytes_in_backup:{}'.format(stats['bytes']))
+        lines.append('bytes_received:{}'.format(stats['received']))
+        for (prefix, key) in [('files', 'files'), ('directories', 'dirs'), ('total', 'total')]:
+            for (suffix, val) in zip(['', '_changed', '_same', '_deleted', '_total'], stats[key]):
+                lines.append('{}{}:{}'.format(prefix, suffix, val))
+        for suffix in ['', '_changed', '_same', '_deleted', '_total']:
+            lines.append('files_encrypted{}:0'.format(suffix))
+        return lines
+    if 'p' in qry:
+        lines = ['-list begin-']
+        for (entry, is_dir, size, mtime) in fleet.entries(name, number, qry['p']):
+            lines.append('{} 1 0 0 {} {} {}'.format(
+                _ls_mode(is_dir),
+                size,
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime)),
+                entry
+            ))
+        lines.append('-list end-')
+        return lines
+    return ['backup_stats', 'log.gz', 'manifest.gz']
+
+
+def burp2_answer(fleet, query):
+    """Returns the document the burp-2 monitor would answer to a query"""
+    if query.startswith('j:'):
+        return {'warning': 'Unknown command: {}'.format(query.strip())}
+    qry = parse_query(query)
+    name = qry.get('c')
+    if not name:
+        clients = []
+        for cli in fleet.names:
+            history = fleet.history(cli)
+            client = {
+                'name': cli,
+                'run_status': 'running' if cli in fleet.running else 'idle',
+                'protocol': 2,
+                'backups': [],
+            }
+            if cli in fleet.running:
+                client['phase'] = 'backup'
+            if history:
+                client['backups'].append({'number': history[0][0], 'timestamp': history[0][1], 'flags': ['current']})
+            clients.append(client)
+        return {'clients': clients}
+    history = fleet.history(name)
+    if not history:
+        return {'clients': []}
+    client = {'name': name, 'run_status': 'running' if name in fleet.running else 'idle', 'protocol': 2}
+    if 'b' not in qry:
+        backups = []
+        if name in fleet.running:
+            prog = fleet.progress(name)
+            files = prog['files']
+            backups.append({
+                'number': history[0][0] + 1,
+                'timestamp': prog['start'],
+                'flags': ['working'],
+                'counters': [
+                    {'name': 'files', 'type': 'f', 'count': files[0], 'changed': files[1], 'same': files[2], 'deleted': files[3], 'scanned': files[4]},
+                    {'name': 'bytes_estimated', 'type': 'G', 'count': prog['estimated']},
+                    {'name': 'bytes', 'type': 'O', 'count': prog['bytes']},
+                    {'name': 'time_start', 'type': 'b', 'count': prog['start']},
+                ],
+            })
+        for (num, stamp) in history:
+            flags = ['deletable']
+            if num == history[0][0]:
+                flags = ['current']
+            backups.append({'number': num, 'timestamp': stamp, 'flags': flags})
+        client['backups'] = backups
+        return {'clients': [client]}
+    number = int(qry['b'])
+    stamp = dict(history).get(number)
+    if stamp is None:
+        return {'clients': [dict(client, backups=[])]}
+    backup = {'number': number, 'timestamp': stamp, 'flags': [], 'logs': {'list': ['backup', 'backup_stats']}}
+    if qry.get('l') == 'backup_stats':
+        stats = fleet.stats(name, number)
+        counters = [
+            {'name': 'time_start', 'count': stats['start']},
+            {'name': 'time_end', 'count': stats['start'] + stats['taken']},
+            {'name': 'time_taken', 'count': stats['taken']},
+            {'name': 'bytes', 'count': stats['bytes']},
+            {'name': 'bytes_received', 'count': stats['received']},
+            {'name': 'files_encrypted', 'count': 0, 'changed': 0, 'same': 0, 'deleted': 0, 'scanned': 0},
+        ]
+        for (key, vals) in [('files', stats['files']), ('directories', stats['dirs']), ('total', stats['total'])]:
+            counters.append(dict(zip(['count', 'changed', 'same', 'deleted', 'scanned'], vals), name=key))
+        backup['logs']['backup_stats'] = [json.dumps({'counters': counters})]
+    elif 'p' in qry:
+        entries = [{'name': '.', 'mode': _mode(True), 'nlink': 1, 'uid': 0, 'gid': 0, 'size': 4096, 'mtime': stamp}]
+        for (entry, is_dir, size, mtime) in fleet.entries(name, number, qry['p']):
+            entries.append({'name': entry, 'mode': _mode(is_dir), 'nlink': 1, 'uid': 0, 'gid': 0, 'size': size, 'mtime': mtime})
+        backup['browse'] = {'directory': qry['p'], 'entries': entries}
+    client['backups'] = [backup]
+    return {'clients': [client]}
+
+
+class StatusHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        query = self.rfile.readline().decode('utf-8')
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        lines = self.server.answer(query)
+        self.wfile.write(''.join(x + '\n' for x in lines).encode('utf-8'))
+
+
+class StatusServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """A local TCP server speaking the burp-1 status protocol.
+
+    :param answer: Callable returning the lines to send back for a query
+                   (:func:`burp1_answer` bound to a fleet by default)
+    :type answer: callable
+
+    :param latency: Number of seconds to wait before answering
+    :type latency: float
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, fleet, port=0, answer=None, latency=0):
+        self.fleet = fleet
+        self.answer = answer or (lambda query: burp1_answer(fleet, query))
+        self.latency = latency
+        socketserver.TCPServer.__init__(self, ('127.0.0.1', port), StatusHandler)
+        self.port = self.server_address[1]
+
+    def start(self):
+        """Serve the requests from a background thread"""
+        thread = threading.Thread(target=self.serve_forever, name='fake-burp1')
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def monitor(fleet, stdin=None, stdout=None):
+    """Speaks the burp-2 monitor protocol on stdin/stdout"""
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    stdout.write(json.dumps({'logline': 'Server version: {}'.format(VERSION)}) + '\n')
+    stdout.flush()
+    while True:
+        query = stdin.readline()
+        if not query:
+            break
+        stdout.write(json.dumps(burp2_answer(fleet, query), separators=(',', ':')) + '\n')
+        stdout.flush()
+
+
+def executable(directory):
+    """Writes a ``burp`` executable running this module in *directory* and
+    returns its path"""
+    path = os.path.join(directory, 'burp')
+    with open(path, 'w') as script:
+        script.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, os.path.realpath(__file__)))
+    os.chmod(path, 0o755)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('-v', dest='version', action='store_true', help='print the burp version')
+    parser.add_argument('-a', dest='action', help='burp action (only "m" and "l" are supported)')
+    parser.add_argument('-c', dest='conf', help='burp configuration file (ignored)')
+    parser.add_argument('--port', type=int, default=4972, help='port of the burp-1 status server')
+    parser.add_argument('--clients', type=int, default=10, help='number of clients')
+    parser.add_argument('--backups', type=int, default=5, help='number of backups per client')
+    parser.add_argument('--files', type=int, default=100, help='number of entries per directory')
+    parser.add_argument('--running', type=int, default=0, help='number of running backups')
+    parser.add_argument('--latency', type=float, default=0, help='seconds to wait before answering a status query')
+    options = parser.parse_args()
+
+    if options.version:
+        print('burp-{}'.format(VERSION))
+        return
+    if options.action == 'l':
+        print('Server version: {}'.format(VERSION))
+        return
+    if options.action == 'm':
+        monitor(Fleet.from_string(os.environ.get('BUI_FAKE_FLEET')))
+        return
+
+    fleet = Fleet(options.clients, options.backups, options.files, options.running)
+    server = StatusServer(fleet, options.port, latency=options.latency)
+    print('serving {} on 127.0.0.1:{}'.format(fleet.to_string(), server.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Measure the number of log calls per second going through
+BUIlogging._logger, for filtered out and emitted records, directly and
+through an agent-like wrapper. The former implementation (patching the
+makeRecord method of the logger and inspecting the whole stack) is measured
+too for comparison.
+
+Usage::
+
+    python benchmarks/logs.py [--calls 20000] [--threads 1] [--json]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+
+from inspect import currentframe, getouterframes
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from burpui.utils import BUIlogging  # noqa
+
+
+class Agent(BUIlogging):
+    """Mimics bui-agent which wraps the _logger method"""
+    padding = 1
+
+    def _logger(self, level, msg, *args):
+        super(Agent, self)._logger(level, msg, *args)
+
+
+class Legacy(BUIlogging):
+    """The former implementation"""
+
+    def _logger(self, level, msg, *args):
+        if self.logger and self.logger.getEffectiveLevel() <= logging.getLevelName(level.upper()):
+            logger = self.logger
+            padding = self.padding
+
+            def makeRecord(name, lvl, fn, lno, msg, args, exc_info, func=None, extra=None, sinfo=None):
+                caller = getouterframes(currentframe())
+                cpt = 0
+                while cpt < len(caller) - 1:
+                    if caller[cpt][3] == '_logger' and caller[cpt][1] == __file__:
+                        cpt += 1
+                        break
+                    cpt += 1
+                (_, filename, line_number, function_name, _, _) = caller[cpt + padding]
+                return logging.Logger.makeRecord(logger, name, lvl, filename, line_number, msg, args, exc_info, func=function_name, extra=extra)
+
+            sav = logger.makeRecord
+            logger.makeRecord = makeRecord
+            logger.log(logging.getLevelName(level.upper()), msg, *args)
+            logger.makeRecord = sav
+
+
+def make_logger():
+    logger = logging.getLogger('burpui.bench')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler(open(os.devnull, 'w'))
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(pathname)s:%(lineno)d %(funcName)s] %(message)s'))
+    logger.handlers = [handler]
+    return logger
+
+
+def run(obj, level, calls):
+    for i in range(calls):
+        obj._logger(level, 'chunk %d sent', i)
+
+
+def bench(obj, level, calls, threads):
+    workers = [threading.Thread(target=run, args=(obj, level, calls)) for _ in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--calls', type=int, default=20000, help='number of log calls per thread')
+    parser.add_argument('--threads', type=int, default=1, help='number of threads logging concurrently')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    options = parser.parse_args()
+
+    logger = make_logger()
+    cases = [
+        ('filtered', BUIlogging, 'debug'),
+        ('emitted', BUIlogging, 'info'),
+        ('agent', Agent, 'info'),
+        ('legacy-filtered', Legacy, 'debug'),
+        ('legacy-emitted', Legacy, 'info'),
+    ]
+    results = []
+    total = options.calls * options.threads
+    for (name, cls, level) in cases:
+        obj = cls()
+        obj.logger = logger
+        # the legacy implementation is way too slow to run every call
+        calls = options.calls if not name.startswith('legacy') else max(1, options.calls // 20)
+        elapsed = bench(obj, level, calls, options.threads)
+        results.append({
+            'case': name,
+            'calls': calls * options.threads,
+            'seconds': round(elapsed, 3),
+            'calls_per_second': int(calls * options.threads / elapsed) if elapsed else None,
+        })
+
+    if options.json:
+        print(json.dumps({'calls': total, 'threads': options.threads, 'results': results}, indent=2))
+        return
+
+    print('{} threads'.format(options.threads))
+    print('{:<18}{:>10}{:>10}{:>14}'.format('case', 'calls', 'seconds', 'calls/s'))
+    for res in results:
+        print('{:<18}{:>10}{:>10.3f}{:>14}'.format(
+            res['case'],
+            res['calls'],
+            res['seconds'],
+            res['calls_per_second'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
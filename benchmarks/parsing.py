@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Measure the time spent parsing a generated burp server configuration with
+thousands of include/exclude lines, for the server and client modes. The
+former implementation of the tokenizer (regular expressions looked up per
+line, list membership checks and linear scans of the multi-valued keys) is
+measured too for comparison.
+
+The lines are parsed directly, bypassing the parse cache, except for the
+last case which measures a cached read of the file.
+
+Usage::
+
+    python benchmarks/parsing.py [--lines 20000] [--repeat 10] [--json]
+"""
+import os
+import re
+import sys
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from suite import Environment, measure, report  # noqa
+from burpui.misc.parser.burp1 import Parser  # noqa
+
+HEADER = u"""# generated by benchmarks/parsing.py
+mode = server
+directory = {tmp}/spool
+clientconfdir = {tmp}/clientconfdir
+hardlinked_archive = 0
+max_children = 5
+keep = 7
+keep = 4
+"""
+KEYS = [u'include', u'exclude', u'exclude_regex', u'include_ext', u'exclude_ext']
+
+
+class Generated(object):
+    """Describes the generated configuration in the reports"""
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def to_string(self):
+        return 'lines={}'.format(self.lines)
+
+    def generate(self, tmp):
+        lines = HEADER.format(tmp=tmp).splitlines()
+        for i in range(self.lines):
+            key = KEYS[i % len(KEYS)]
+            if i % 50 == 0:
+                lines.append(u'# {} {}'.format(key, i))
+            lines.append(u'{} = /srv/data/{}/{}'.format(key, i // 100, i))
+        return lines
+
+
+class Legacy(Parser):
+    """The former implementation of the tokenizer"""
+
+    def _parse_lines(self, fi, mode='srv', deps=None):
+        dic = []
+        boolean = []
+        multi = []
+        integer = []
+        includes = []
+        includes_ext = []
+        for l in fi:
+            if re.match(r'^\s*#', l):
+                continue
+            r = re.search(r'\s*([^=\s]+)\s*=?\s*(.*)$', l)
+            if r:
+                key = r.group(1)
+                val = r.group(2)
+                if mode == 'srv' and key == u'directory':
+                    self.workingdir = val
+                if key in getattr(self, 'boolean_{}'.format(mode)):
+                    boolean.append({'name': key, 'value': int(val) == 1})
+                    continue
+                elif key in getattr(self, 'integer_{}'.format(mode)):
+                    integer.append({'name': key, 'value': int(val)})
+                    continue
+                if key == u'.':
+                    includes.append(val)
+                    continue
+                if key in getattr(self, 'multi_{}'.format(mode)):
+                    found = False
+                    for m in multi:
+                        if m['name'] == key:
+                            m['value'].append(val)
+                            found = True
+                            break
+                    if not found:
+                        multi.append({'name': key, 'value': [val]})
+                    continue
+                if key == u'clientconfdir':
+                    if mode != 'srv':
+                        continue
+                    if not val.startswith('/'):
+                        self.clientconfdir = os.path.join(self.root, val)
+                    else:
+                        self.clientconfdir = val
+                dic.append({'name': key, 'value': val})
+
+        return dic, boolean, multi, integer, includes, includes_ext
+
+
+def run(generated, options):
+    results = []
+    with Environment(generated) as env:
+        lines = generated.generate(env.tmp)
+        conf = env.write('burp-server.conf', u'\n'.join(lines) + u'\n')
+        parsers = [('tokenizer', Parser(None, conf)), ('legacy', Legacy(None, conf))]
+        for mode in ['srv', 'cli']:
+            for (name, parser) in parsers:
+                res = measure(lambda: parser._parse_lines(lines, mode), options.repeat)
+                res['case'] = '{} {}'.format(name, mode)
+                results.append(res)
+        # both implementations must agree
+        for mode in ['srv', 'cli']:
+            assert parsers[0][1]._parse_lines(lines, mode) == parsers[1][1]._parse_lines(lines, mode)
+        res = measure(lambda: parsers[0][1]._parse_file(conf), options.repeat)
+        res['case'] = 'cached srv'
+        results.append(res)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--lines', type=int, default=20000, help='number of include/exclude lines')
+    parser.add_argument('--repeat', type=int, default=10, help='number of times every case is run')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    options = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    generated = Generated(options.lines)
+    report('parsing', generated, run(generated, options), options.json)
+
+
+if __name__ == '__main__':
+    main()
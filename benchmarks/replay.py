@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Replay the status queries of a capture file (see burpui.capture) through the
+matching backend and report the time spent per kind of query.
+
+The queries are sent in the captured order, paced like the original traffic
+divided by --pace (0 sends them back to back). The answers are served
+without waiting for the original duration of the queries unless --speed is
+given, so only the time spent by burp-ui itself is measured.
+
+Usage::
+
+    python benchmarks/replay.py capture.gz [--pace 0] [--speed 0] [--json]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from suite import Environment, report  # noqa
+
+REPLAY_CONF = u"""[Burp{version}]
+burpbin: /dev/null
+stripbin: /dev/null
+bconfcli: /dev/null
+bconfsrv: /dev/null
+tmpdir: {tmp}
+replay: {capture}
+replayspeed: {speed}
+"""
+
+
+class Capture(object):
+    """Describes the replayed capture in the reports"""
+
+    def __init__(self, path, header, queries):
+        self.path = path
+        self.header = header
+        self.queries = queries
+
+    def to_string(self):
+        return '{},backend=burp{},queries={}'.format(
+            os.path.basename(self.path),
+            self.header.get('backend'),
+            len(self.queries)
+        )
+
+
+def backend(env, capture, speed):
+    """Instantiate the backend replaying the capture"""
+    version = capture.header.get('backend')
+    conf = env.write('replay.cfg', REPLAY_CONF.format(
+        version=version,
+        tmp=env.tmp,
+        capture=os.path.realpath(capture.path),
+        speed=speed
+    ))
+    if version == 1:
+        from burpui.misc.backend.burp1 import Burp
+    else:
+        from burpui.misc.backend.burp2 import Burp
+    return Burp(conf=conf)
+
+
+def run(path, options):
+    from burpui.capture import read
+    from burpui.metrics import query_shape
+
+    header, queries = read(path)
+    capture = Capture(path, header, [(x[0], x[2]) for x in queries])
+    shapes = {}
+    with Environment(capture) as env:
+        cli = backend(env, capture, options.speed)
+        begin = time.time()
+        for (offset, query) in capture.queries:
+            if options.pace:
+                wait = offset / options.pace - (time.time() - begin)
+                if wait > 0:
+                    time.sleep(wait)
+            start = time.time()
+            cli.status(query)
+            shapes.setdefault(query_shape(query), []).append(time.time() - start)
+    results = []
+    for (shape, timings) in sorted(shapes.items(), key=lambda x: sum(x[1]), reverse=True):
+        timings.sort()
+        results.append({
+            'case': shape,
+            'runs': len(timings),
+            'min': round(timings[0] * 1000, 3),
+            'median': round(timings[len(timings) // 2] * 1000, 3),
+            'max': round(timings[-1] * 1000, 3),
+            'per_second': round(len(timings) / sum(timings), 1) if sum(timings) else None,
+        })
+    return capture, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('capture', help='capture file')
+    parser.add_argument('--pace', type=float, default=0, help='divides the delays between the queries (0 sends them back to back)')
+    parser.add_argument('--speed', type=float, default=0, help='divides the original duration of the queries (0 does not wait)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    options = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    capture, results = run(options.capture, options)
+    report('replay', capture, results, options.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Run the backends, agent and API benchmarks against the fake burp servers
+and report the results, as JSON for regression tracking.
+
+Usage::
+
+    python benchmarks/suite.py [--clients 100] [--backups 10] [--files 100] [--running 1] [--repeat 20] [--json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from fakeburp import Fleet, StatusServer, executable  # noqa
+
+BURP1_CONF = u"""[Burp1]
+bhost: 127.0.0.1
+bport: {port}
+burpbin: /dev/null
+stripbin: /dev/null
+bconfcli: /dev/null
+bconfsrv: /dev/null
+tmpdir: {tmp}
+"""
+
+BURP2_CONF = u"""[Burp2]
+burpbin: {burp}
+stripbin: /dev/null
+bconfcli: {cli}
+bconfsrv: /dev/null
+tmpdir: {tmp}
+timeout: 15
+"""
+
+
+def add_arguments(parser):
+    """Options shared by every benchmark"""
+    parser.add_argument('--clients', type=int, default=100, help='number of clients of the fleet')
+    parser.add_argument('--backups', type=int, default=10, help='number of backups per client')
+    parser.add_argument('--files', type=int, default=100, help='number of entries per directory')
+    parser.add_argument('--running', type=int, default=1, help='number of running backups')
+    parser.add_argument('--repeat', type=int, default=20, help='number of times every case is run')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+
+
+def fleet_from(options):
+    return Fleet(options.clients, options.backups, options.files, options.running)
+
+
+def measure(func, repeat):
+    """Run *func* *repeat* times and returns the timings in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    timings.sort()
+    return {
+        'runs': repeat,
+        'min': round(timings[0] * 1000, 3),
+        'median': round(timings[len(timings) // 2] * 1000, 3),
+        'max': round(timings[-1] * 1000, 3),
+        'per_second': round(repeat / sum(timings), 1) if sum(timings) else None,
+    }
+
+
+class Environment(object):
+    """Temporary configuration files and fake servers of a benchmark"""
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.tmp = tempfile.mkdtemp(prefix='bui-bench-')
+        self.server = None
+        os.environ['BUI_FAKE_FLEET'] = fleet.to_string()
+
+    def burp1_conf(self, extra=u''):
+        """Starts the burp-1 status server and returns a configuration file
+        pointing to it"""
+        if not self.server:
+            self.server = StatusServer(self.fleet).start()
+        return self.write('burp1.cfg', extra + BURP1_CONF.format(port=self.server.port, tmp=self.tmp))
+
+    def burp2_conf(self, extra=u''):
+        """Returns a configuration file using the fake burp-2 monitor"""
+        burp = executable(self.tmp)
+        cli = self.write('burp.conf', u'')
+        return self.write('burp2.cfg', extra + BURP2_CONF.format(burp=burp, cli=cli, tmp=self.tmp))
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as conf:
+            conf.write(content)
+        return path
+
+    def close(self):
+        if self.server:
+            self.server.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def report(name, fleet, results, as_json):
+    """Prints the results of a benchmark"""
+    if as_json:
+        print(json.dumps({'benchmark': name, 'fleet': fleet.to_string(), 'results': results}, indent=2))
+        return
+    print('{} ({})'.format(name, fleet.to_string()))
+    print('{:<40}{:>10}{:>10}{:>10}{:>10}'.format('case', 'min ms', 'median', 'max', 'per s'))
+    for res in results:
+        print('{:<40}{:>10.2f}{:>10.2f}{:>10.2f}{:>10}'.format(
+            res['case'][:40],
+            res['min'],
+            res['median'],
+            res['max'],
+            res['per_second'],
+        ))
+    print('')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    add_arguments(parser)
+    options = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    import backends
+    import agent
+    import api
+
+    fleet = fleet_from(options)
+    results = {}
+    for mod in [backends, agent, api]:
+        name = mod.__name__
+        results[name] = mod.run(fleet, options)
+        if not options.json:
+            report(name, fleet, results[name], False)
+    if options.json:
+        print(json.dumps({'fleet': fleet.to_string(), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -87,6 +87,7 @@ def init(conf=None, debug=0, logfile=None, gunicorn=True, unittest=False):
     from .server import BUIServer as BurpUI
     from .routes import view
     from .api import api, apibp
+    from .profiling import profiler
 
     if not unittest:
         from ._compat import patch_json
@@ -163,6 +164,12 @@ def init(conf=None, debug=0, logfile=None, gunicorn=True, unittest=False):
 
     app.setup(app.config['CFG'])
 
+    # in-process cache used unless a shared storage is configured
+    cache_config = {
+        'CACHE_TYPE': 'burpui.cache.memory',
+        'CACHE_MAXSIZE': (app.cachesize or 0) * 1024 * 1024
+    }
+
     if gunicorn:  # pragma: no cover
         from werkzeug.contrib.fixers import ProxyFix
         if app.storage and app.storage.lower() == 'redis':
@@ -199,11 +206,11 @@ def init(conf=None, debug=0, logfile=None, gunicorn=True, unittest=False):
             with app.app_context():
                 api.cache.clear()
         else:
-            api.cache.init_app(app)
+            api.cache.init_app(app, config=cache_config)
 
         app.wsgi_app = ProxyFix(app.wsgi_app)
     else:
-        api.cache.init_app(app)
+        api.cache.init_app(app, config=cache_config)
 
     # Then we load our routes
     view.init_bui(app)
@@ -219,6 +226,9 @@ def init(conf=None, debug=0, logfile=None, gunicorn=True, unittest=False):
     api.__doc__ = __doc__
     app.register_blueprint(apibp)
 
+    # The requests can be profiled (see burpui.profiling)
+    profiler.init_app(app)
+
     # And the login_manager
     app.login_manager = LoginManager()
     app.login_manager.login_view = 'view.login'
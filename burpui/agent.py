@@ -15,11 +15,18 @@ except ImportError:
     import socketserver as SocketServer
 
 from logging.handlers import RotatingFileHandler
+from .utils import FRAME_PROGRESS
 from .exceptions import BUIserverException
+from .metrics import registry, instrument_backend
+from .tracing import tracer
+from .profiling import profiler
 from .misc.backend.interface import BUIbackend
 from ._compat import ConfigParser, pickle
 
-from Queue import Queue
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
 
 g_port = u'10000'
 g_bind = u'::'
@@ -29,6 +36,10 @@ g_sslcert = u''
 g_sslkey = u''
 g_password = u'password'
 g_threads = u'5'
+g_engine = u'threaded'
+g_profiledir = u''
+g_profilesampling = u'0'
+g_profilekeep = u'100'
 
 DISCLOSURE = 5
 
@@ -38,7 +49,16 @@ class BurpHandler(BUIbackend):
     # The hack here is to get the list of the functions and let the interpreter
     # think we don't have to implement them.
     # Thanks to this list, we know what function are implemented by our backend.
-    foreign = BUIbackend.__abstractmethods__
+    # Note: python 3 ignores the __metaclass__ attribute so we have to look for
+    # the abstract methods ourselves
+    foreign = getattr(
+        BUIbackend,
+        '__abstractmethods__',
+        frozenset(
+            k for k, v in vars(BUIbackend).items()
+            if getattr(v, '__isabstractmethod__', False)
+        )
+    )
     BUIbackend.__abstractmethods__ = frozenset()
 
     def __init__(self, vers=1, logger=None, conf=None):
@@ -52,10 +72,15 @@ class BurpHandler(BUIbackend):
             Client = mod.Burp
             self.backend = Client(conf=conf)
             self.backend.set_logger(self.logger)
+            instrument_backend(self.backend)
         except Exception as e:
             self._logger('error', '{}\n\nFailed loading backend for Burp version {}: {}'.format(traceback.format_exc(), self.vers, str(e)))
             sys.exit(2)
 
+    def metrics(self):
+        """Returns the metrics of the agent in the Prometheus text format"""
+        return registry.render()
+
     def __getattribute__(self, name):
         # always return this value because we need it and if we don't do that
         # we'll end up with an infinite loop
@@ -73,7 +98,9 @@ class BUIAgent(BUIbackend):
     defaults = {
         'port': g_port, 'bind': g_bind,
         'ssl': g_ssl, 'sslcert': g_sslcert, 'sslkey': g_sslkey,
-        'version': g_version, 'password': g_password, 'threads': g_threads
+        'version': g_version, 'password': g_password, 'threads': g_threads,
+        'engine': g_engine, 'directory': g_profiledir,
+        'sampling': g_profilesampling, 'keep': g_profilekeep
     }
 
     def __init__(self, conf=None, debug=False, logfile=None):
@@ -112,7 +139,9 @@ class BUIAgent(BUIbackend):
         config = ConfigParser.ConfigParser({
             'port': g_port, 'bind': g_bind,
             'ssl': g_ssl, 'sslcert': g_sslcert, 'sslkey': g_sslkey,
-            'version': g_version, 'password': g_password, 'threads': g_threads
+            'version': g_version, 'password': g_password, 'threads': g_threads,
+            'engine': g_engine, 'directory': g_profiledir,
+            'sampling': g_profilesampling, 'keep': g_profilekeep
         })
         with open(self.conf) as fp:
             config.readfp(fp)
@@ -129,10 +158,26 @@ class BUIAgent(BUIbackend):
                 self.sslkey = self._safe_config_get(config.get, 'sslkey', 'Global')
                 self.password = self._safe_config_get(config.get, 'password', 'Global')
                 self.threads = self._safe_config_get(config.getint, 'threads', 'Global', cast=int)
+                self.engine = self._safe_config_get(config.get, 'engine', 'Global')
+                self.profiledir = self._safe_config_get(config.get, 'directory', 'Profiling')
+                self.profilesampling = self._safe_config_get(config.getfloat, 'sampling', 'Profiling', cast=float)
+                self.profilekeep = self._safe_config_get(config.getint, 'keep', 'Profiling', cast=int)
             except ConfigParser.NoOptionError as e:
                 raise e
 
-        self.server = AgentServer((self.bind, self.port), AgentTCPHandler, self)
+        # the server decides which requests are traced, we log all of them
+        tracer.configure(slow=0, logger=self._logger)
+        # the server asks for the profile of its profiled requests
+        profiler.configure(self.profiledir, self.profilesampling, self.profilekeep, self._logger)
+
+        if self.engine and self.engine.lower() == 'asyncio':
+            try:
+                from .async_agent import AsyncAgentServer
+            except (ImportError, SyntaxError) as e:
+                raise IOError('The asyncio engine requires python >= 3.5: {}'.format(str(e)))
+            self.server = AsyncAgentServer(self)
+        else:
+            self.server = AgentServer((self.bind, self.port), AgentTCPHandler, self)
 
     def run(self):
         try:
@@ -155,14 +200,17 @@ class AgentTCPHandler(SocketServer.BaseRequestHandler):
 
     def handle(self):
         """self.request is the client connection"""
+        stream = None
         try:
             self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            waiting = time.time()
             # try to pick the first available client
             self.idx = -1
             for (i, l) in enumerate(self.server.locks):
                 if l.acquire(False):
                     self.cli = self.server.clients[i]
                     self.idx = i
+                    break
 
             # if none of them are available pick one randomly and wait for it
             if self.idx == -1:
@@ -170,6 +218,7 @@ class AgentTCPHandler(SocketServer.BaseRequestHandler):
                 self.idx = randint(0, len(self.server.locks) - 1)
                 self.server.locks[self.idx].acquire()
                 self.cli = self.server.clients[self.idx]
+            acquired = time.time()
 
             err = None
             lengthbuf = self.request.recv(8)
@@ -184,9 +233,16 @@ class AgentTCPHandler(SocketServer.BaseRequestHandler):
                 self.server.agent._logger('warning', '-----> Wrong Password <-----')
                 self.request.sendall(b'KO')
                 return
+            if j.get('trace'):
+                # the server traces this request, so do we
+                trace = tracer.begin(j['trace'], j['func'], force=True, start=waiting)
+                trace.add('agent.wait', waiting, acquired - waiting)
+            profiler.start(j['func'], force=bool(j.get('profile')))
             try:
-                if j['func'] == 'restore_files':
+                if j['func'] in ['restore_files', 'restore_stream']:
                     res, err = getattr(self.cli, j['func'])(**j['args'])
+                    if j['func'] == 'restore_stream':
+                        stream = res
                 else:
                     if j['args']:
                         if 'pickled' in j and j['pickled']:
@@ -204,7 +260,32 @@ class AgentTCPHandler(SocketServer.BaseRequestHandler):
                 self.request.sendall(struct.pack('!Q', len(res)))
                 self.request.sendall(res.encode('UTF-8'))
                 return
-            if j['func'] == 'restore_files':
+            if j['func'] == 'restore_stream':
+                if err:
+                    err = err.encode('UTF-8')
+                    self.request.sendall(b'KO')
+                    self.request.sendall(struct.pack('!Q', len(err)))
+                    self.request.sendall(err)
+                    self.server.agent._logger('error', 'Restoration failed')
+                    return
+                self.request.sendall(b'OK')
+                # every chunk of the archive is sent as soon as it is ready,
+                # along with the number of files archived so far. An empty
+                # frame marks the end of the archive
+                size = 0
+                files = 0
+                for chunk in res:
+                    if getattr(res, 'files', files) != files:
+                        files = res.files
+                        self.request.sendall(struct.pack('!Q', FRAME_PROGRESS | files))
+                    self.request.sendall(struct.pack('!Q', len(chunk)))
+                    self.request.sendall(chunk)
+                    size += len(chunk)
+                if getattr(res, 'files', files) != files:
+                    self.request.sendall(struct.pack('!Q', FRAME_PROGRESS | res.files))
+                self.request.sendall(struct.pack('!Q', 0))
+                self.server.agent._logger('info', 'sent {} Bytes'.format(size))
+            elif j['func'] == 'restore_files':
                 if err:
                     self.request.sendall(b'KO')
                     self.request.sendall(struct.pack('!Q', len(err)))
@@ -231,7 +312,12 @@ class AgentTCPHandler(SocketServer.BaseRequestHandler):
         except Exception as e:
             self.server.agent._logger('error', '!!! {} !!!\n{}'.format(str(e), traceback.format_exc()))
         finally:
+            if stream is not None:
+                # cleans the restored files up, even if nothing was sent
+                stream.close()
             self.server.locks[self.idx].release()
+            tracer.end()
+            profiler.stop()
             try:
                 self.request.close()
             except Exception as e:
@@ -272,6 +358,16 @@ class AgentServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
             self.clients.append(cli)
             self.locks.append(lock)
 
+        self.requests = None
+        registry.gauge(
+            'burpui_agent_queue_depth',
+            lambda: self.requests.qsize() if self.requests else 0
+        )
+        registry.gauge(
+            'burpui_agent_busy_workers',
+            lambda: len([x for x in self.locks if x.locked()])
+        )
+
         SocketServer.TCPServer.__init__(self, server_address, RequestHandlerClass)
         if self.agent.ssl:
             import ssl
@@ -11,8 +11,10 @@
 import os
 import sys
 import json
+import time
+import hashlib
 
-from flask import Blueprint, Response, request
+from flask import Blueprint, Response, request, g, has_request_context
 from flask.ext.restplus import Api
 from flask.ext.login import current_user
 from flask.ext.cache import Cache
@@ -20,6 +22,8 @@ from importlib import import_module
 from functools import wraps
 
 from .._compat import IS_GUNICORN
+from ..metrics import registry
+from ..tracing import tracer
 
 if sys.version_info >= (3, 0):  # pragma: no cover
     basestring = str
@@ -128,6 +132,8 @@ class ApiWrapper(Api):
     __doc__ = None
     __url__ = None
     LOGIN_NOT_REQUIRED = []
+    # cached resources per endpoint
+    cached_endpoints = {}
 
     def init_bui(self, bui):
         """Loads the right context.
@@ -136,6 +142,134 @@ class ApiWrapper(Api):
         """
         self.bui = bui
         self.load_all()
+        # apply the timeouts set in the configuration
+        for (endpoint, func) in self.cached_endpoints.items():
+            func.cache_timeout = getattr(bui, 'cachettl', {}).get(endpoint, func.default_timeout)
+        self.bui.cli.add_listener(self.invalidate)
+
+    def cached(self, endpoint, timeout=None):
+        """Decorator caching the result of a resource. The *timeout* can be
+        overridden in the ``[Cache]`` section of the configuration using the
+        *endpoint* name. A timeout of 0 disables the cache of the resource.
+
+        :param endpoint: Name of the endpoint
+        :type endpoint: str
+
+        :param timeout: Default timeout in seconds
+        :type timeout: int
+        """
+        def decorator(func):
+            wrapped = self.cache.cached(
+                timeout=timeout,
+                key_prefix=cache_key,
+                unless=lambda: not wrapped.cache_timeout
+            )(func)
+            wrapped.default_timeout = timeout
+            self.cached_endpoints[endpoint] = wrapped
+            return wrapped
+        return decorator
+
+    def call(self, endpoint, timeout, method, *args, **kwargs):
+        """Call a backend method and cache its raw result. The result only
+        depends on the method and its arguments so it is shared by every
+        user: the ACL must be applied on the returned data.
+
+        :param endpoint: Name of the endpoint used to look for a custom timeout
+                         in the ``[Cache]`` section of the configuration
+        :type endpoint: str
+
+        :param timeout: Default timeout in seconds
+        :type timeout: int
+
+        :param method: Name of the backend method to call
+        :type method: str
+
+        :returns: The result of the backend call
+        """
+        func = getattr(self.bui.cli, method)
+        timeout = getattr(self.bui, 'cachettl', {}).get(endpoint, timeout)
+        if not timeout:
+            return func(*args, **kwargs)
+        key = 'backend-{}'.format(json.dumps([method, args, kwargs], sort_keys=True, default=str))
+        entry = self.cache.get(key)
+        if entry is None:
+            registry.inc('burpui_cache_requests_total', {'endpoint': endpoint, 'result': 'miss'})
+            entry = (func(*args, **kwargs), time.time() + timeout)
+            self.cache.set(key, entry, timeout=timeout)
+        else:
+            registry.inc('burpui_cache_requests_total', {'endpoint': endpoint, 'result': 'hit'})
+        rv, expires = entry
+        if has_request_context():
+            # remember when the data of the current request becomes stale
+            g.cache_expires = min(expires, getattr(g, 'cache_expires', None) or expires)
+        return rv
+
+    def etag(self, version=None):
+        """Decorator adding ``ETag`` and ``If-None-Match`` support to a
+        resource.
+
+        The tag of a response is kept until the backend results it was built
+        from (see :func:`burpui.api.ApiWrapper.call`) expire. In the meantime,
+        a client sending the same tag gets a *304* answer without querying the
+        backend nor serializing anything.
+
+        :param version: Optional callable returning some cheap state the
+                        response also depends on. The tag is not reused if
+                        this state changes
+        :type version: callable
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapped(*args, **kwargs):
+                key = 'etag-{}'.format(cache_key())
+                state = version() if version else None
+                known = self.cache.get(key)
+                if (known and known[1] == state and
+                        request.if_none_match.contains(known[0])):
+                    return self._not_modified(known[0])
+                g.cache_expires = None
+                data, code, headers = self._unpack(func(*args, **kwargs))
+                if code != 200:
+                    return data, code, headers
+                tag = hashlib.sha1(
+                    json.dumps(data, sort_keys=True).encode('utf-8')
+                ).hexdigest()
+                if g.cache_expires:
+                    timeout = int(g.cache_expires - time.time())
+                    if timeout > 0:
+                        self.cache.set(key, (tag, state), timeout=timeout)
+                if request.if_none_match.contains(tag):
+                    return self._not_modified(tag)
+                headers = dict(headers or {})
+                headers['ETag'] = '"{}"'.format(tag)
+                # make the browsers ask us before reusing their copy
+                headers['Cache-Control'] = 'no-cache'
+                return data, code, headers
+            return wrapped
+        return decorator
+
+    @staticmethod
+    def _unpack(rv):
+        """Split the value returned by a resource in data, code and headers"""
+        if not isinstance(rv, tuple):
+            return rv, 200, {}
+        if len(rv) == 2:
+            return rv[0], rv[1], {}
+        return rv
+
+    @staticmethod
+    def _not_modified(tag):
+        return Response(status=304, headers={
+            'ETag': '"{}"'.format(tag),
+            'Cache-Control': 'no-cache'
+        })
+
+    def invalidate(self, started=None, finished=None, agent=None):
+        """Clear the cache when a backup starts or finishes so we do not
+        serve stale data"""
+        self.bui.cli._logger('debug', 'Clearing the cache')
+        with self.bui.app_context():
+            self.cache.clear()
 
     def abort(self, code=500, message=None, **kwargs):
         """Override :func:`flask.ext.restplus.Api.abort` in order to raise
@@ -163,4 +297,35 @@ class ApiWrapper(Api):
 
 
 apibp = Blueprint('api', __name__, url_prefix='/api')
+
+
+@apibp.before_request
+def start_timer():
+    g.request_start = time.time()
+    tid = request.headers.get('X-Trace-Id')
+    # in debug mode, the clients can ask for a trace of their request
+    tracer.begin(tid, request.path, force=bool(tid and api.bui.debug))
+
+
+@apibp.after_request
+def record_timer(response):
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unknown'
+        registry.observe('burpui_api_request_seconds', time.time() - start, {'endpoint': endpoint})
+        registry.inc('burpui_api_requests_total', {'endpoint': endpoint, 'code': response.status_code})
+    trace = tracer.end()
+    if trace:
+        response.headers['X-Trace-Id'] = trace.id
+        if api.bui.debug:
+            response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+
+@apibp.teardown_request
+def end_trace(exc):
+    # the request failed before reaching after_request
+    tracer.end()
+
+
 api = ApiWrapper(apibp, title='Burp-UI API', description='Burp-UI API to interact with burp', doc='/doc', decorators=[api_login_required])
@@ -8,7 +8,7 @@
 
 """
 # This is a submodule we can also use "from ..api import api"
-from . import api, cache_key
+from . import api
 from ..exceptions import BUIserverException
 from flask.ext.restplus import Resource, fields
 from flask.ext.login import current_user
@@ -45,7 +45,6 @@ class ClientTree(Resource):
         'uid': fields.Integer(required=True, description='uid owner of the node'),
     })
 
-    @api.cache.cached(timeout=3600, key_prefix=cache_key)
     @api.marshal_list_with(node_fields, code=200, description='Success')
     @api.doc(
         params={
@@ -110,7 +109,7 @@ class ClientTree(Resource):
                                                    name,
                                                    server))):
                 api.abort(403, 'Sorry, you are not allowed to view this client')
-            j = api.bui.cli.get_tree(name, backup, root, agent=server)
+            j = api.call('client_tree', 3600, 'get_tree', name, backup, root, agent=server)
         except BUIserverException as e:
             api.abort(500, str(e))
         return j
@@ -164,7 +163,6 @@ class ClientStats(Resource):
         'windows': fields.Boolean(required=True, description='Is the client a windows system'),
     })
 
-    @api.cache.cached(timeout=1800, key_prefix=cache_key)
     @api.marshal_with(stats_fields, code=200, description='Success')
     @api.doc(
         params={
@@ -336,18 +334,18 @@ class ClientStats(Resource):
             api.abort(403, 'You don\'t have rights to view this client stats')
         if backup:
             try:
-                j = api.bui.cli.get_backup_logs(backup, name, agent=server)
+                j = api.call('client_stats', 1800, 'get_backup_logs', backup, name, agent=server)
             except BUIserverException as e:
                 api.abort(500, str(e))
         else:
             try:
-                cl = api.bui.cli.get_client(name, agent=server)
+                cl = api.call('client_stats', 1800, 'get_client', name, agent=server)
             except BUIserverException as e:
                 api.abort(500, str(e))
             err = []
             for c in cl:
                 try:
-                    j.append(api.bui.cli.get_backup_logs(c['number'], name, agent=server))
+                    j.append(api.call('client_stats', 1800, 'get_backup_logs', c['number'], name, agent=server))
                 except BUIserverException as e:
                     temp = [2, str(e)]
                     if temp not in err:
@@ -380,7 +378,7 @@ class ClientReport(Resource):
         'date': fields.String(required=True, description='Human representation of the backup date'),
     })
 
-    @api.cache.cached(timeout=1800, key_prefix=cache_key)
+    @api.etag()
     @api.marshal_list_with(client_fields, code=200, description='Success')
     @api.doc(
         params={
@@ -432,7 +430,7 @@ class ClientReport(Resource):
                                                       name,
                                                       server))):
                 api.abort(403, 'Sorry, you cannot access this client')
-            j = api.bui.cli.get_client(name, agent=server)
+            j = api.call('client_report', 1800, 'get_client', name, agent=server)
         except BUIserverException as e:
             api.abort(500, str(e))
         return j
@@ -8,7 +8,8 @@
 
 """
 # This is a submodule we can also use "from ..api import api"
-from . import api, cache_key
+from . import api
+from .misc import clients_index
 from ..exceptions import BUIserverException
 
 from six import iteritems
@@ -111,6 +112,7 @@ class RunningBackup(Resource):
         'running': fields.Boolean(required=True, description='Is there a backup running right now'),
     })
 
+    @api.etag()
     @api.marshal_with(running_fields, code=200, description='Success')
     @api.doc(
         params={
@@ -138,7 +140,7 @@ class RunningBackup(Resource):
 
         :returns: The *JSON* described above.
         """
-        j = api.bui.cli.is_one_backup_running(server)
+        j = api.call('running_backup', 5, 'is_one_backup_running', server)
         # Manage ACL
         if (api.bui.acl and not
                 api.bui.acl.is_admin(current_user.get_id())):
@@ -194,7 +196,6 @@ class ClientsReport(Resource):
         'clients': fields.Nested(client_fields, as_list=True, required=True),
     })
 
-    @api.cache.cached(timeout=1800, key_prefix=cache_key)
     @api.marshal_with(report_fields, code=200, description='Success')
     @api.doc(
         params={
@@ -265,22 +266,21 @@ class ClientsReport(Resource):
                      server not in
                      api.bui.acl.servers(current_user.get_id()))):
                 api.abort(403, 'Sorry, you don\'t have any rights on this server')
-            clients = api.bui.cli.get_all_clients(agent=server)
+            clients = api.call('clients_report', 1800, 'get_all_clients', agent=server)
+            # the report of every client is shared by all the users, it only
+            # depends on the client names
+            clients = [{'name': x['name']} for x in clients]
+            j = api.call('clients_report', 1800, 'get_clients_report', clients, server)
         except BUIserverException as e:
             api.abort(500, str(e))
         # Filter only allowed clients
-        allowed = []
-        check = False
         if (api.bui.acl and not
                 api.bui.acl.is_admin(current_user.get_id())):
-            check = True
             allowed = api.bui.acl.clients(current_user.get_id(), server)
-        aclients = []
-        for c in clients:
-            if check and c['name'] not in allowed:
-                continue
-            aclients.append(c)
-        j = api.bui.cli.get_clients_report(aclients, server)
+            j = {
+                'clients': [x for x in j['clients'] if x['name'] in allowed],
+                'backups': [x for x in j['backups'] if x['name'] in allowed],
+            }
         return j
 
 
@@ -306,7 +306,7 @@ class ClientsStats(Resource):
         'percent': fields.Integer(description='Percentage done'),
     })
 
-    @api.cache.cached(timeout=1800, key_prefix=cache_key)
+    @api.etag()
     @api.marshal_list_with(client_fields, code=200, description='Success')
     @api.doc(
         params={
@@ -364,10 +364,114 @@ class ClientsStats(Resource):
                      server not in
                      api.bui.acl.servers(current_user.get_id()))):
                 api.abort(403, 'Sorry, you don\'t have any rights on this server')
-            j = api.bui.cli.get_all_clients(agent=server)
+            j = clients_index(server)
             if (api.bui.acl and not
                     api.bui.acl.is_admin(current_user.get_id())):
                 j = [x for x in j if x['name'] in api.bui.acl.clients(current_user.get_id(), server)]
         except BUIserverException as e:
             api.abort(500, str(e))
         return j
+
+
+@ns.route('/changes.json',
+          '/<server>/changes.json',
+          endpoint='clients_changes')
+class ClientsChanges(Resource):
+    """The :class:`burpui.api.clients.ClientsChanges` resource allows you to
+    retrieve only the clients whose state changed since your last request.
+
+    This resource is part of the :mod:`burpui.api.clients` module.
+
+    An optional ``GET`` parameter called ``server`` is supported when running
+    in multi-agent mode.
+    An optional ``GET`` parameter called ``since`` is supported to only
+    retrieve the changes that happened after the given version.
+    """
+    parser = api.parser()
+    parser.add_argument('server', type=str, help='Which server to collect data from when in multi-agent mode')
+    parser.add_argument('since', type=int, help='Version returned by the previous request')
+    client_fields = api.model('ClientsChangesSingle', {
+        'last': fields.String(required=True, description='Date of last backup'),
+        'name': fields.String(required=True, description='Client name'),
+        'state': fields.String(required=True, description='Current state of the client (idle, backup, etc.)'),
+        'phase': fields.String(description='Phase of the current running backup'),
+        'percent': fields.Integer(description='Percentage done'),
+    })
+    changes_fields = api.model('ClientsChanges', {
+        'version': fields.Integer(required=True, description='Version to send with the next request'),
+        'full': fields.Boolean(required=True, description='Whether the whole list of clients is returned'),
+        'clients': fields.Nested(client_fields, as_list=True, description='Changed clients'),
+        'removed': fields.List(fields.String, description='Removed clients'),
+    })
+
+    @api.marshal_with(changes_fields, code=200, description='Success')
+    @api.doc(
+        params={
+            'server': 'Which server to collect data from when in multi-agent mode',
+            'since': 'Version returned by the previous request',
+        },
+        responses={
+            403: 'Insufficient permissions',
+            500: 'Internal failure',
+        },
+        parser=parser
+    )
+    def get(self, server=None):
+        """Returns the clients whose state changed since a given version
+
+        **GET** method provided by the webservice.
+
+        The *JSON* returned is:
+        ::
+
+            {
+              "version": 1452158132042,
+              "full": false,
+              "clients": [
+                {
+                  "last": "2015-05-17 11:40:02",
+                  "name": "client1",
+                  "state": "running",
+                  "phase": "backup",
+                  "percent": 12,
+                }
+              ],
+              "removed": [
+                "client2"
+              ]
+            }
+
+
+        When ``full`` is true (no ``since`` parameter, or an unknown version
+        because the server restarted for instance), ``clients`` contains the
+        whole list of clients and you should discard what you already have.
+
+        The output is filtered by the :mod:`burpui.misc.acl` module so that you
+        only see stats about the clients you are authorized to.
+
+        :param server: Which server to collect data from when in multi-agent mode
+        :type server: str
+
+        :returns: The *JSON* described above
+        """
+        args = self.parser.parse_args()
+        if not server:
+            server = args['server']
+        try:
+            if (not api.bui.standalone and
+                    api.bui.acl and
+                    (not api.bui.acl.is_admin(current_user.get_id()) and
+                     server not in
+                     api.bui.acl.servers(current_user.get_id()))):
+                api.abort(403, 'Sorry, you don\'t have any rights on this server')
+            # refreshes the change log every liverefresh interval
+            clients_index(server)
+            j = api.bui.cli.get_changes(args['since'], agent=server)
+            if (api.bui.acl and not
+                    api.bui.acl.is_admin(current_user.get_id())):
+                allowed = api.bui.acl.clients(current_user.get_id(), server)
+                j['clients'] = [x for x in j['clients'] if x['name'] in allowed]
+                j['removed'] = [x for x in j['removed'] if x in allowed]
+        except BUIserverException as e:
+            api.abort(500, str(e))
+        return j
@@ -0,0 +1,144 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.api.metrics
+    :platform: Unix
+    :synopsis: Burp-UI metrics api module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+"""
+# This is a submodule we can also use "from ..api import api"
+from . import api
+from ..metrics import registry, CONTENT_TYPE
+from ..exceptions import BUIserverException
+
+from six import string_types
+from flask.ext.restplus import Resource, fields
+from flask.ext.login import current_user
+from flask import Response
+
+
+@api.route('/metrics',
+           '/<server>/metrics',
+           endpoint='metrics')
+class Metrics(Resource):
+    """The :class:`burpui.api.metrics.Metrics` resource exposes the internal
+    metrics of ``Burp-UI`` in the `Prometheus <https://prometheus.io/>`_ text
+    format.
+
+    This resource is part of the :mod:`burpui.api.metrics` module.
+
+    When a ``server`` is given in multi-agent mode, the metrics of the
+    corresponding agent are returned instead.
+    """
+
+    @api.doc(
+        params={
+            'server': 'Which agent to collect the metrics from',
+        },
+        responses={
+            200: 'Success',
+            403: 'Insufficient permissions',
+            404: 'Unknown server',
+            503: 'The agent did not answer',
+        },
+    )
+    def get(self, server=None):
+        """Returns the metrics in the Prometheus text format
+
+        **GET** method provided by the webservice.
+
+        :param server: Which agent to collect the metrics from
+        :type server: str
+
+        :returns: A ``text/plain`` response
+        """
+        if api.bui.acl and not api.bui.acl.is_admin(current_user.get_id()):
+            api.abort(403, 'Sorry, you don\'t have any rights on the metrics')
+        if not server:
+            return Response(registry.render(), content_type=CONTENT_TYPE)
+        servers = getattr(api.bui.cli, 'servers', {})
+        if server not in servers:
+            api.abort(404, 'Unknown server \'{}\''.format(server))
+        try:
+            res = servers[server].metrics()
+        except BUIserverException as e:
+            api.abort(503, str(e))
+        if not isinstance(res, string_types):
+            api.abort(503, 'No metrics received from \'{}\''.format(server))
+        return Response(res, content_type=CONTENT_TYPE)
+
+
+@api.route('/slowqueries.json',
+           '/<server>/slowqueries.json',
+           endpoint='slow_queries')
+class SlowQueries(Resource):
+    """The :class:`burpui.api.metrics.SlowQueries` resource allows you to
+    retrieve the burp status queries that took longer than the ``slowquery``
+    threshold, aggregated per query shape.
+
+    This resource is part of the :mod:`burpui.api.metrics` module.
+
+    In multi-agent mode, the ``server`` is mandatory.
+    """
+    query_fields = api.model('SlowQuery', {
+        'shape': fields.String(required=True, description='Query with the client names, backup numbers and paths replaced by *'),
+        'count': fields.Integer(required=True, description='Number of slow queries'),
+        'seconds': fields.Float(required=True, description='Time spent in these queries'),
+        'max': fields.Float(required=True, description='Duration of the slowest query'),
+        'bytes': fields.Integer(required=True, description='Size of the answers'),
+        'last': fields.String(description='Last slow query of this shape'),
+    })
+    slow_fields = api.model('SlowQueries', {
+        'threshold': fields.Float(required=True, description='Queries slower than this number of seconds are recorded (0 means disabled)'),
+        'queries': fields.Nested(query_fields, as_list=True, description='Slow queries, the most expensive first'),
+    })
+
+    @api.marshal_with(slow_fields, code=200, description='Success')
+    @api.doc(
+        params={
+            'server': 'Which server to collect the slow queries from',
+        },
+        responses={
+            403: 'Insufficient permissions',
+            404: 'Unknown server',
+            500: 'Internal failure',
+        },
+    )
+    def get(self, server=None):
+        """Returns the slow status queries
+
+        **GET** method provided by the webservice.
+
+        The *JSON* returned is:
+        ::
+
+            {
+              "threshold": 1.0,
+              "queries": [
+                {
+                  "shape": "c:*:b:*:p:*",
+                  "count": 12,
+                  "seconds": 31.337,
+                  "max": 4.2,
+                  "bytes": 123456789,
+                  "last": "c:client1:b:42:p:/home"
+                }
+              ]
+            }
+
+
+        :param server: Which server to collect the slow queries from
+        :type server: str
+
+        :returns: The *JSON* described above
+        """
+        if api.bui.acl and not api.bui.acl.is_admin(current_user.get_id()):
+            api.abort(403, 'Sorry, you don\'t have any rights on the slow queries')
+        servers = getattr(api.bui.cli, 'servers', None)
+        if servers is not None and server not in servers:
+            api.abort(404, 'Unknown server \'{}\''.format(server))
+        try:
+            return api.bui.cli.get_slow_queries(agent=server)
+        except BUIserverException as e:
+            api.abort(500, str(e))
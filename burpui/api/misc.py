@@ -8,13 +8,19 @@
 
 """
 # This is a submodule we can also use "from ..api import api"
-from . import api, cache_key
+from . import api
+from ..live import LiveSampler
+from ..metrics import registry
 from ..exceptions import BUIserverException
 
+import json
+import threading
+
 from six import iteritems
-from flask.ext.restplus import Resource, fields
+from six.moves import queue
+from flask.ext.restplus import Resource, fields, marshal
 from flask.ext.login import current_user
-from flask import flash, url_for
+from flask import Response, flash, url_for
 
 ns = api.namespace('misc', 'Misc methods')
 
@@ -47,6 +53,42 @@ counters_fields = api.model('Counters', {
 })
 
 
+def running_index(server=None):
+    """Returns the clients currently running a backup.
+
+    The list is shared by every request and refreshed at most once per
+    ``liverefresh`` interval so following the counters of a client only costs
+    the query of its counters.
+
+    :param server: Which server to collect data from when in multi-agent mode
+    :type server: str
+    """
+    return api.call(
+        'running_index',
+        api.bui.config.get('LIVEREFRESH') or 5,
+        'is_one_backup_running',
+        server
+    )
+
+
+def clients_index(server=None):
+    """Returns the clients of a server along with their state.
+
+    Like :func:`burpui.api.misc.running_index`, the list is only kept for the
+    ``liverefresh`` interval: querying the backend is how we notice the
+    backups starting or finishing and clear the cache of the other endpoints.
+
+    :param server: Which server to collect data from when in multi-agent mode
+    :type server: str
+    """
+    return api.call(
+        'clients_stats',
+        api.bui.config.get('LIVEREFRESH') or 5,
+        'get_all_clients',
+        agent=server
+    )
+
+
 @ns.route('/counters.json',
           '/<server>/counters.json',
           '/counters.json/<name>',
@@ -106,19 +148,16 @@ class Counters(Resource):
             (not api.bui.acl.is_client_allowed(current_user.get_id(), name, server) or
              not api.bui.acl.is_admin(current_user.get_id()))):
             api.abort(403)
-        api.bui.cli.is_one_backup_running()
-        if isinstance(api.bui.cli.running, dict):
-            if server and name not in api.bui.cli.running[server]:
-                api.abort(404, "'{}' not found in the list of running clients for '{}'".format(name, server))
-            else:
-                found = False
-                for (k, a) in iteritems(api.bui.cli.running):
-                    found = found or (name in a)
-                if not found:
-                    api.bort(404, "'{}' not found in running clients".format(name))
-        else:
-            if name not in api.bui.cli.running:
+        running = running_index(server)
+        if isinstance(running, dict):
+            agents = [k for (k, a) in iteritems(running) if name in a]
+            if not agents:
                 api.abort(404, "'{}' not found in running clients".format(name))
+            server = agents[0]
+        elif name not in running:
+            if server:
+                api.abort(404, "'{}' not found in the list of running clients for '{}'".format(name, server))
+            api.abort(404, "'{}' not found in running clients".format(name))
         try:
             counters = api.bui.cli.get_counters(name, agent=server)
         except BUIserverException:
@@ -205,13 +244,13 @@ class Live(Resource):
                 server not in api.bui.acl.servers(current_user.get_id())):
             api.abort(403, 'You are not allowed to view stats of this server')
         if server:
-            l = api.bui.cli.is_one_backup_running(server)[server]
+            l = running_index(server)
             # ACL
             if api.bui.acl and not admin:
                 allowed = api.bui.acl.clients(current_user.get_id(), server)
                 l = [x for x in l if x in allowed]
         else:
-            l = api.bui.cli.is_one_backup_running()
+            l = running_index()
         if isinstance(l, dict):
             for (k, a) in iteritems(l):
                 for c in a:
@@ -243,6 +282,149 @@ class Live(Resource):
         return r
 
 
+def live_sample():
+    """Returns the counters of every running client. This is what the
+    :class:`burpui.live.LiveSampler` broadcasts to the *live-monitor*
+    viewers"""
+    r = []
+    # the sampler runs in its own thread
+    with api.bui.app_context():
+        running = running_index()
+    if isinstance(running, dict):
+        running = [(c, k) for (k, a) in iteritems(running) for c in a]
+    else:
+        running = [(c, None) for c in running]
+    for (c, k) in running:
+        s = {}
+        s['client'] = c
+        s['agent'] = k
+        try:
+            s['counters'] = api.bui.cli.get_counters(c, agent=k)
+        except BUIserverException:
+            s['counters'] = {}
+        r.append(s)
+    return marshal(r, Live.live_fields)
+
+
+sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Returns the sampler shared by every *live-monitor* viewer"""
+    with sampler_lock:
+        if not getattr(api, 'sampler', None):
+            api.sampler = LiveSampler(
+                live_sample,
+                api.bui.config.get('LIVEREFRESH') or 5,
+                api.bui.cli._logger
+            )
+    return api.sampler
+
+
+registry.gauge(
+    'burpui_live_subscribers',
+    lambda: len(api.sampler.subscribers) if getattr(api, 'sampler', None) else 0
+)
+
+
+@ns.route('/live/stream',
+          '/<server>/live/stream',
+          '/live/stream/<name>',
+          '/<server>/live/stream/<name>',
+          endpoint='live_stream')
+class LiveStream(Resource):
+    """The :class:`burpui.api.misc.LiveStream` resource pushes the counters of
+    the running clients using *Server-Sent Events*.
+
+    The backend is queried once per ``liverefresh`` interval whatever the
+    number of viewers.
+
+    This resource is part of the :mod:`burpui.api.misc` module.
+
+    An optional ``GET`` parameter called ``server`` is supported when running
+    in multi-agent mode.
+    An optional ``GET`` parameter called ``name`` is supported to only follow
+    one client.
+    """
+    parser = api.parser()
+    parser.add_argument('server', type=str, help='Which server to collect data from when in multi-agent mode')
+    parser.add_argument('name', type=str, help='Client name')
+    # seconds without any sample after which we send a keepalive
+    keepalive = 15
+
+    @api.doc(
+        params={
+            'server': 'Which server to collect data from when in multi-agent mode',
+            'name': 'Client name',
+        },
+        responses={
+            200: 'Success',
+            403: 'Insufficient permissions',
+        },
+        parser=parser
+    )
+    def get(self, server=None, name=None):
+        """Streams the counters of the running clients
+
+        **GET** method provided by the webservice.
+
+        Every event contains a *JSON* list with the same format than the
+        :class:`burpui.api.misc.Live` resource.
+
+        The output is filtered by the :mod:`burpui.misc.acl` module so that you
+        only see stats about the clients you are authorized to.
+
+        :param server: Which server to collect data from when in multi-agent mode
+        :type server: str
+
+        :param name: Only follow the given client
+        :type name: str
+
+        :returns: A ``text/event-stream`` response
+        """
+        args = self.parser.parse_args()
+        server = server or args['server']
+        name = name or args['name']
+        user = current_user.get_id()
+        acl = api.bui.acl
+        admin = acl and acl.is_admin(user)
+        if acl and not admin and server and server not in acl.servers(user):
+            api.abort(403, 'You are not allowed to view stats of this server')
+
+        def allowed(item):
+            if server and item['agent'] != server:
+                return False
+            if name and item['client'] != name:
+                return False
+            if acl and not admin:
+                return acl.is_client_allowed(user, item['client'], item['agent'])
+            return True
+
+        sampler = get_sampler()
+
+        def stream():
+            sub = sampler.subscribe()
+            try:
+                yield 'retry: {}\n\n'.format(sampler.interval * 1000)
+                while True:
+                    try:
+                        data = sub.get(timeout=self.keepalive)
+                    except queue.Empty:
+                        yield ': keepalive\n\n'
+                        continue
+                    yield 'data: {}\n\n'.format(
+                        json.dumps([x for x in data if allowed(x)])
+                    )
+            finally:
+                sampler.unsubscribe(sub)
+
+        return Response(stream(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            # do not let the reverse proxies buffer the events
+            'X-Accel-Buffering': 'no',
+        })
+
+
 @ns.route('/alert', endpoint='alert')
 class Alert(Resource):
     """The :class:`burpui.api.misc.Alert` resource allows you to propagate a
@@ -294,7 +476,7 @@ class About(Resource):
         'burp': fields.Nested(burp_fields, as_list=True, description='Burp version'),
     })
 
-    @api.cache.cached(timeout=3600, key_prefix=cache_key)
+    @api.cached('about', 3600)
     @api.marshal_with(about_fields, code=200, description='Success')
     @api.doc(
         params={
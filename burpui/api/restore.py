@@ -7,23 +7,60 @@
 .. moduleauthor:: Ziirish <ziirish@ziirish.info>
 
 """
-import select
-import struct
-
 from zlib import adler32
 from time import gmtime, strftime, time
 
 # This is a submodule we can also use "from ..api import api"
 from . import api
+from ..metrics import track_restore
 from ..exceptions import BUIserverException
-from flask.ext.restplus import Resource
+from flask.ext.restplus import Resource, fields
 from flask.ext.login import current_user
-from flask import Response, send_file, make_response, after_this_request
+from flask import Response, make_response, send_file
 from werkzeug.datastructures import Headers
 from werkzeug.exceptions import HTTPException
 
 ns = api.namespace('restore', 'Restore methods')
 
+MIMETYPES = {
+    'zip': 'application/zip',
+    'zip-stored': 'application/zip',
+    'tar': 'application/x-tar',
+    'tar.gz': 'application/gzip',
+    'tar.bz2': 'application/x-bzip2',
+}
+EXTENSIONS = {
+    'zip-stored': 'zip',
+}
+
+
+def archive_name(name, backup, server=None, archive='zip'):
+    """Returns the name of the archive sent to the user"""
+    ext = EXTENSIONS.get(archive, archive)
+    if server:
+        return 'restoration_%d_%s_on_%s_at_%s.%s' % (
+            backup,
+            name,
+            server,
+            strftime("%Y-%m-%d_%H_%M_%S", gmtime()),
+            ext)
+    return 'restoration_%d_%s_at_%s.%s' % (
+        backup,
+        name,
+        strftime("%Y-%m-%d_%H_%M_%S", gmtime()),
+        ext)
+
+
+def check_acl(name, server=None):
+    """Abort if the current user is not allowed to restore files of the
+    given client"""
+    if (api.bui.acl and
+            (not api.bui.acl.is_client_allowed(current_user.get_id(),
+                                               name,
+                                               server) and not
+             api.bui.acl.is_admin(current_user.get_id()))):
+        api.abort(403, 'You are not allowed to perform a restoration for this client')
+
 
 @ns.route('/archive/<name>/<int:backup>',
           '/<server>/archive/<name>/<int:backup>',
@@ -87,121 +124,259 @@ class Restore(Resource):
         if not l or not name or not backup:
             api.abort(400, 'missing arguments')
         # Manage ACL
-        if (api.bui.acl and
-                (not api.bui.acl.is_client_allowed(current_user.get_id(),
-                                                   name,
-                                                   server) and not
-                 api.bui.acl.is_admin(current_user.get_id()))):
-            api.abort(403, 'You are not allowed to perform a restoration for this client')
-        if server:
-            filename = 'restoration_%d_%s_on_%s_at_%s.%s' % (
-                backup,
-                name,
-                server,
-                strftime("%Y-%m-%d_%H_%M_%S", gmtime()),
-                f)
-        else:
-            filename = 'restoration_%d_%s_at_%s.%s' % (
-                backup,
-                name,
-                strftime("%Y-%m-%d_%H_%M_%S", gmtime()),
-                f)
-        if not server:
-            # Standalone mode, we can just return the file unless there were errors
-            archive, err = api.bui.cli.restore_files(name, backup, l, s, f, p)
-            if not archive:
+        check_acl(name, server)
+        filename = archive_name(name, backup, server, f)
+        stream = None
+        try:
+            # The archive is generated on the fly (locally or by the agent) so
+            # we can start sending it as soon as the first file is ready
+            stream, err = api.bui.cli.restore_stream(name, backup, l, s, f, p, server)
+            if not stream:
                 if err:
                     return make_response(err, 500)
                 api.abort(500)
-            try:
-                # Trick to delete the file while sending it to the client.
-                # First, we open the file in reading mode so that a file handler
-                # is open on the file. Then we delete it as soon as the request
-                # ended. Because the fh is open, the file will be actually removed
-                # when the transfert is done and the send_file method has closed
-                # the fh.
-                fh = open(archive, 'r')
-
-                @after_this_request
-                def remove_file(response):
-                    """Callback function to run after the client has handled
-                    the request to remove temporary files.
-                    """
-                    import os
-                    os.remove(archive)
-                    return response
-                resp = send_file(fh,
-                                 as_attachment=True,
-                                 attachment_filename=filename,
-                                 mimetype='application/zip')
-                resp.set_cookie('fileDownload', 'true')
-            except Exception as e:
-                api.bui.cli._logger('error', str(e))
-                api.abort(500, str(e))
-        else:
-            # Multi-agent mode
-            socket = None
-            try:
-                socket, length, err = api.bui.cli.restore_files(name,
-                                                                backup,
-                                                                l,
-                                                                s,
-                                                                f,
-                                                                p,
-                                                                server)
-                api.bui.cli._logger('debug', 'Need to get {} Bytes : {}'.format(length, socket))
 
-                if err:
-                    api.bui.cli._logger('debug', 'Something went wrong: {}'.format(err))
-                    socket.sendall(struct.pack('!Q', 2))
-                    socket.sendall(b'RE')
-                    socket.close()
-                    return make_response(err, 500)
+            headers = Headers()
+            headers.add('Content-Disposition',
+                        'attachment',
+                        filename=filename)
+
+            resp = Response(track_restore(stream, 'stream'),
+                            mimetype=MIMETYPES.get(f, 'application/octet-stream'),
+                            headers=headers,
+                            direct_passthrough=True)
+            resp.set_cookie('fileDownload', 'true')
+            resp.set_etag('flask-%s-%s' % (
+                time(),
+                adler32(filename.encode('utf-8')) & 0xffffffff))
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            if stream is not None and hasattr(stream, 'close'):
+                stream.close()
+            api.bui.cli._logger('error', str(e))
+            api.abort(500, str(e))
+        return resp
+
+
+job_fields = api.model('RestoreJob', {
+    'id': fields.String(required=True, description='Job id'),
+    'user': fields.String(description='User that started the job'),
+    'client': fields.String(required=True, description='Client name'),
+    'backup': fields.Integer(required=True, description='Backup number'),
+    'server': fields.String(description='Server the client belongs to'),
+    'format': fields.String(required=True, description='Archive format'),
+    'phase': fields.String(required=True, description='Current phase of the job (queued, restoring, archiving, done, failed)'),
+    'files': fields.Integer(description='Number of files already archived'),
+    'bytes': fields.Integer(required=True, description='Size in bytes of the compressed archive generated so far (not the size of the restored data)'),
+    'error': fields.String(description='Error message if the job failed'),
+    'created': fields.Float(required=True, description='Timestamp of the creation of the job'),
+    'updated': fields.Float(required=True, description='Timestamp of the last update of the job'),
+    'finished': fields.Float(description='Timestamp of the end of the job'),
+})
+
+
+def get_job(jid):
+    """Returns the state of a job if the current user is allowed to see it"""
+    try:
+        job = api.bui.jobs.get(jid)
+    except BUIserverException:
+        job = None
+    if not job:
+        api.abort(404, 'No such job')
+    if (api.bui.acl and job['user'] != current_user.get_id() and
+            not api.bui.acl.is_admin(current_user.get_id())):
+        api.abort(403, 'You are not allowed to access this job')
+    return job
+
+
+@ns.route('/jobs/<name>/<int:backup>',
+          '/<server>/jobs/<name>/<int:backup>',
+          endpoint='restore_job_create')
+class RestoreJobCreate(Resource):
+    """The :class:`burpui.api.restore.RestoreJobCreate` resource allows you to
+    start a file restoration in the background.
+
+    This resource is part of the :mod:`burpui.api.restore` module.
+
+    It supports the same parameters as :class:`burpui.api.restore.Restore`.
+    """
+    parser = Restore.parser
+
+    @api.marshal_with(job_fields, code=202, description='Success')
+    @api.doc(
+        params={
+            'server': 'Which server to collect data from when in multi-agent mode',
+            'name': 'Client name',
+            'backup': 'Backup number',
+        },
+        responses={
+            400: 'Missing parameter',
+            403: 'Insufficient permissions',
+            429: 'Too many running restorations',
+        },
+        parser=parser
+    )
+    def post(self, server=None, name=None, backup=None):
+        """Starts a restoration job
+
+        **POST** method provided by the webservice.
+
+        :param server: Which server to collect data from when in multi-agent mode
+        :type server: str
+
+        :param name: The client we are working on
+        :type name: str
+
+        :param backup: The backup we are working on
+        :type backup: int
+
+        :returns: The job description
+        """
+        args = self.parser.parse_args()
+        l = args['list']
+        s = args['strip']
+        f = args['format'] or 'zip'
+        p = args['pass']
+        if not l or not name or not backup:
+            api.abort(400, 'missing arguments')
+        check_acl(name, server)
+        job, err = api.bui.jobs.create(
+            current_user.get_id(),
+            name,
+            backup,
+            l,
+            s,
+            f,
+            p,
+            server
+        )
+        if not job:
+            api.abort(429, err)
+        return job, 202
+
+
+@ns.route('/jobs', endpoint='restore_jobs')
+class RestoreJobList(Resource):
+    """The :class:`burpui.api.restore.RestoreJobList` resource allows you to
+    list the restoration jobs.
+
+    This resource is part of the :mod:`burpui.api.restore` module.
+    """
+
+    @api.marshal_list_with(job_fields, code=200, description='Success')
+    def get(self):
+        """Returns the restoration jobs of the current user (or every job
+        for administrators)
+
+        **GET** method provided by the webservice.
+
+        :returns: The list of jobs
+        """
+        user = current_user.get_id()
+        if not api.bui.acl or api.bui.acl.is_admin(user):
+            user = None
+        return api.bui.jobs.list(user)
+
+
+@ns.route('/job/<jid>', endpoint='restore_job')
+class RestoreJob(Resource):
+    """The :class:`burpui.api.restore.RestoreJob` resource allows you to
+    follow the progress of a restoration job or to cancel it.
+
+    This resource is part of the :mod:`burpui.api.restore` module.
+    """
+
+    @api.marshal_with(job_fields, code=200, description='Success')
+    @api.doc(
+        params={
+            'jid': 'Job id',
+        },
+        responses={
+            403: 'Insufficient permissions',
+            404: 'No such job',
+        },
+    )
+    def get(self, jid=None):
+        """Returns the progress of a restoration job
+
+        **GET** method provided by the webservice.
+
+        :param jid: The job id
+        :type jid: str
+
+        :returns: The job description
+        """
+        return get_job(jid)
 
-                def stream_file(sock, l):
-                    """The restoration took place on another server so we need
-                    to stream the file that is not present on the current
-                    machine.
-                    """
-                    bsize = 1024
-                    received = 0
-                    if l < bsize:
-                        bsize = l
-                    while received < l:
-                        buf = b''
-                        r, _, _ = select.select([sock], [], [], 5)
-                        if not r:
-                            raise Exception('Socket timed-out')
-                        buf += sock.recv(bsize)
-                        if not buf:
-                            continue
-                        received += len(buf)
-                        api.bui.cli._logger('debug', '{}/{}'.format(received, l))
-                        yield buf
-                    sock.sendall(struct.pack('!Q', 2))
-                    sock.sendall(b'RE')
-                    sock.close()
-
-                headers = Headers()
-                headers.add('Content-Disposition',
-                            'attachment',
-                            filename=filename)
-                headers['Content-Length'] = length
-
-                resp = Response(stream_file(socket, length),
-                                mimetype='application/zip',
-                                headers=headers,
-                                direct_passthrough=True)
-                resp.set_cookie('fileDownload', 'true')
-                resp.set_etag('flask-%s-%s-%s' % (
-                    time(),
-                    length,
-                    adler32(filename.encode('utf-8')) & 0xffffffff))
-            except HTTPException as e:
-                raise e
-            except Exception as e:
-                api.bui.cli._logger('error', str(e))
-                api.abort(500, str(e))
+    @api.doc(
+        params={
+            'jid': 'Job id',
+        },
+        responses={
+            204: 'Success',
+            403: 'Insufficient permissions',
+            404: 'No such job',
+        },
+    )
+    def delete(self, jid=None):
+        """Cancels a running restoration job or removes a finished one
+
+        **DELETE** method provided by the webservice.
+
+        :param jid: The job id
+        :type jid: str
+        """
+        get_job(jid)
+        api.bui.jobs.cancel(jid)
+        return None, 204
+
+
+@ns.route('/job/<jid>/download', endpoint='restore_job_download')
+class RestoreJobDownload(Resource):
+    """The :class:`burpui.api.restore.RestoreJobDownload` resource allows you
+    to retrieve the archive generated by a restoration job.
+
+    This resource is part of the :mod:`burpui.api.restore` module.
+    """
+
+    @api.doc(
+        params={
+            'jid': 'Job id',
+        },
+        responses={
+            200: 'Success',
+            403: 'Insufficient permissions',
+            404: 'No such job',
+            409: 'The job is not finished',
+        },
+    )
+    def get(self, jid=None):
+        """Downloads the archive of a finished restoration job
+
+        **GET** method provided by the webservice.
+
+        :param jid: The job id
+        :type jid: str
+
+        :returns: A :mod:`flask.Response` object representing the archive
+        """
+        job = get_job(jid)
+        path = api.bui.jobs.archive(jid)
+        if not path:
+            api.abort(409, 'The job is {}'.format(job['phase']))
+        resp = send_file(
+            path,
+            mimetype=MIMETYPES.get(job['format'], 'application/octet-stream'),
+            as_attachment=True,
+            attachment_filename=archive_name(
+                job['client'],
+                job['backup'],
+                job['server'],
+                job['format']
+            )
+        )
+        resp.set_cookie('fileDownload', 'true')
         return resp
 
 
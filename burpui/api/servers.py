@@ -1,7 +1,7 @@
 # -*- coding: utf8 -*-
 
 # This is a submodule we can also use "from ..api import api"
-from . import api, cache_key, parallel_loop
+from . import api, parallel_loop
 from ..exceptions import BUIserverException
 
 from flask.ext.restplus import Resource, fields
@@ -10,6 +10,17 @@ from flask.ext.login import current_user
 ns = api.namespace('servers', 'Servers methods')
 
 
+def servers_health():
+    """Returns the state of the circuit breaker of every server so that a
+    change invalidates the ``ETag`` of the servers list"""
+    if not hasattr(api.bui.cli, 'servers'):
+        return None
+    return sorted(
+        [name, serv.health.state, serv.health.consecutive]
+        for (name, serv) in api.bui.cli.servers.items()
+    )
+
+
 @ns.route('/servers.json', endpoint='servers_stats')
 class ServersStats(Resource):
     """The :class:`burpui.api.servers.ServersStats` resource allows you to
@@ -17,13 +28,22 @@ class ServersStats(Resource):
 
     This resource is part of the :mod:`burpui.api.servers` module.
     """
+    health_fields = api.model('ServerHealth', {
+        'state': fields.String(required=True, description='State of the circuit breaker (closed, open or half-open)'),
+        'failures': fields.Integer(required=True, description='Number of consecutive failures'),
+        'latency': fields.Float(description='Moving average of the response time in milliseconds'),
+        'last_success': fields.Float(description='Timestamp of the last successful exchange'),
+        'last_failure': fields.Float(description='Timestamp of the last failure'),
+        'last_error': fields.String(description='Last error encountered'),
+    })
     servers_fields = api.model('Servers', {
         'alive': fields.Boolean(required=True, description='Is the server reachable'),
         'clients': fields.Integer(required=True, description='Number of clients managed by this server'),
         'name': fields.String(required=True, description='Server name'),
+        'health': fields.Nested(health_fields, description='Health of the server as seen by the circuit breaker'),
     })
 
-    @api.cache.cached(timeout=1800, key_prefix=cache_key)
+    @api.etag(version=servers_health)
     @api.marshal_list_with(servers_fields, code=200, description='Success')
     @api.doc(
         responses={
@@ -43,12 +63,33 @@ class ServersStats(Resource):
                 'alive': true,
                 'clients': 2,
                 'name': 'burp1',
+                'health': {
+                  'state': 'closed',
+                  'failures': 0,
+                  'latency': 1.523,
+                  'last_success': 1452158132.45,
+                  'last_failure': null,
+                  'last_error': null
+                }
               },
               {
                 'alive': false,
                 'clients': 0,
                 'name': 'burp2',
+                'health': {
+                  'state': 'open',
+                  'failures': 3,
+                  'latency': null,
+                  'last_success': null,
+                  'last_failure': 1452158127.12,
+                  'last_error': 'timed out'
+                }
               },
+            ]
+
+        Unreachable servers are not queried again until their circuit breaker
+        lets a new request through. In the meantime, the last known number of
+        clients is returned.
 
 
         :returns: The *JSON* described above.
@@ -70,14 +111,16 @@ class ServersStats(Resource):
                             output.put({
                                 'name': serv,
                                 'clients': len(api.bui.acl.clients(current_user.get_id(), serv)),
-                                'alive': api.bui.cli.servers[serv].ping()
+                                'alive': api.bui.cli.servers[serv].ping(),
+                                'health': api.bui.cli.servers[serv].health.to_dict()
                             })
                             return
                     else:
                         output.put({
                             'name': serv,
-                            'clients': len(api.bui.cli.servers[serv].get_all_clients(serv)),
-                            'alive': api.bui.cli.servers[serv].ping()
+                            'clients': len(api.call('servers_stats', 1800, 'get_all_clients', agent=serv)),
+                            'alive': api.bui.cli.servers[serv].ping(),
+                            'health': api.bui.cli.servers[serv].health.to_dict()
                         })
                         return
                     output.put(None)
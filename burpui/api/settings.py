@@ -10,7 +10,8 @@
 import sys
 
 # This is a submodule we can also use "from ..api import api"
-from . import api
+from . import api, parallel_loop
+from ..exceptions import BUIserverException
 from flask.ext.restplus import reqparse, Resource
 from flask.ext.login import current_user
 from flask import jsonify, request, url_for
@@ -193,9 +194,12 @@ class ServerSettings(Resource):
           '/<server>/clients.json',
           endpoint='clients_list')
 class ClientsList(Resource):
+    parser = api.parser()
+    parser.add_argument('prefix', type=str, help='Only list the clients whose name starts with this prefix')
 
     def get(self, server=None):
-        res = api.bui.cli.clients_list(server)
+        prefix = self.parser.parse_args()['prefix']
+        res = api.bui.cli.clients_list(prefix, agent=server)
         return jsonify(result=res)
 
 
@@ -232,15 +236,89 @@ class ClientSettings(Resource):
                        defaults=api.bui.cli.get_parser_attr('defaults', server))
 
 
+@ns.route('/clients/config',
+          '/<server>/clients/config',
+          endpoint='clients_settings')
+class ClientsSettings(Resource):
+    parser = api.parser()
+    parser.add_argument('pattern', type=str, location='json', help='Shell-style pattern matching the name of the clients')
+    parser.add_argument('patch', type=dict, location='json', help='New value of the settings to change')
+
+    def post(self, server=None):
+        """Apply the same changes to the configuration of several clients
+
+        **POST** method provided by the webservice.
+
+        The clients are selected by a shell-style pattern matching their
+        names. The *patch* holds the new value of every setting to change (a
+        list of values for the multi-valued settings), *null* removes the
+        setting. The patch is validated once, then every configuration file is
+        replaced atomically.
+
+        In multi-agent mode, the patch is applied on every agent in parallel
+        unless a server is given.
+
+        The *JSON* expected is:
+        ::
+
+            {
+              "pattern": "web-*",
+              "patch": {"keep": ["7", "4"], "client_can_delete": false, "restore_client": null}
+            }
+
+        The *JSON* returned is:
+        ::
+
+            {
+              "results": [
+                {
+                  "server": null,
+                  "error": null,
+                  "clients": [
+                    {"name": "web-1", "notif": [0, "'web-1' successfully updated"]},
+                    {"name": "web-2", "notif": [3, "'web-2' is already up to date"]}
+                  ]
+                }
+              ]
+            }
+
+        :returns: The *JSON* described above
+        """
+        # Only the admin can edit the configuration
+        if (api.bui.acl and not
+                api.bui.acl.is_admin(current_user.get_id())):
+            api.abort(403, 'Sorry, you don\'t have rights to access the setting panel')
+
+        args = self.parser.parse_args()
+        if not args['pattern']:
+            api.abort(400, 'No client pattern provided')
+        if not args['patch']:
+            api.abort(400, 'No settings to change')
+
+        if server or not hasattr(api.bui.cli, 'servers'):
+            try:
+                clients = api.bui.cli.patch_clients_conf(args['pattern'], args['patch'], agent=server)
+            except BUIserverException as e:
+                api.abort(400, str(e))
+            return {'results': [{'server': server, 'error': None, 'clients': clients}]}
+
+        def patch_agent(serv, output):  # pragma: no cover
+            try:
+                clients = api.bui.cli.patch_clients_conf(args['pattern'], args['patch'], agent=serv)
+                output.put({'server': serv, 'error': None, 'clients': clients})
+            except BUIserverException as e:
+                output.put({'server': serv, 'error': str(e), 'clients': []})
+
+        results = parallel_loop(patch_agent, api.bui.cli.servers)
+        return {'results': sorted(results, key=lambda x: x['server'])}
+
+
 @ns.route('/new-client',
           '/<server>/new-client',
           endpoint='new_client')
 class NewClient(Resource):
-
-    def __init__(self):
-        self.parser = reqparse.RequestParser()
-        self.parser.add_argument('newclient', type=str)
-        super(NewClient, self).__init__()
+    parser = api.parser()
+    parser.add_argument('newclient', type=str, help='Name of the new client')
 
     def put(self, server=None):
         # Only the admin can edit the configuration
@@ -251,7 +329,7 @@ class NewClient(Resource):
         newclient = self.parser.parse_args()['newclient']
         if not newclient:
             api.abort(400, 'No client name provided')
-        clients = api.bui.cli.clients_list(server)
+        clients = api.bui.cli.clients_list(newclient, agent=server)
         for cl in clients:
             if cl['name'] == newclient:
                 api.abort(409, "Client '{}' already exists".format(newclient))
@@ -0,0 +1,242 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.api.summary
+    :platform: Unix
+    :synopsis: Burp-UI summary api module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+"""
+# This is a submodule we can also use "from ..api import api"
+from . import api
+from .misc import running_index, clients_index
+from ..exceptions import BUIserverException
+
+import time
+import datetime
+import threading
+import traceback
+
+from six.moves import queue
+from flask.ext.restplus import Resource, fields
+from flask.ext.login import current_user
+
+# upper bounds (in days) of the last backup age histogram
+AGES = [('day', 1), ('week', 7), ('month', 30)]
+
+
+def last_backup_age(last, now):
+    """Returns the histogram bucket of the last backup date of a client"""
+    if last == 'never':
+        return 'never'
+    if last == 'now':
+        return AGES[0][0]
+    try:
+        date = datetime.datetime.strptime(last, '%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+    age = now - date
+    for (bucket, days) in AGES:
+        if age < datetime.timedelta(days=days):
+            return bucket
+    return 'older'
+
+
+def empty_ages():
+    return dict((bucket, 0) for bucket in [x for (x, _) in AGES] + ['older', 'never'])
+
+
+def summarize(clients, running):
+    """Computes the summary of a list of clients"""
+    now = datetime.datetime.now()
+    ages = empty_ages()
+    for cli in clients:
+        bucket = last_backup_age(cli.get('last'), now)
+        if bucket:
+            ages[bucket] += 1
+    return {
+        'clients': len(clients),
+        'running': sorted(running),
+        'crashed': sorted(
+            x['name'] for x in clients
+            if x.get('state') in ['client crashed', 'server crashed']
+        ),
+        'ages': ages,
+    }
+
+
+@api.route('/summary.json', endpoint='summary')
+class Summary(Resource):
+    """The :class:`burpui.api.summary.Summary` resource allows you to retrieve
+    an overview of every server in one request.
+
+    This resource is part of the :mod:`burpui.api.summary` module.
+
+    An optional ``GET`` parameter called ``timeout`` is supported to change
+    the global deadline of the request.
+    """
+    parser = api.parser()
+    parser.add_argument('timeout', type=float, help='Maximum number of seconds to wait for the servers')
+    # default and maximum deadline in seconds
+    deadline = 5
+    max_deadline = 30
+    ages_fields = api.model('SummaryAges', {
+        'day': fields.Integer(required=True, description='Clients backed up less than a day ago'),
+        'week': fields.Integer(required=True, description='Clients backed up less than a week ago'),
+        'month': fields.Integer(required=True, description='Clients backed up less than a month ago'),
+        'older': fields.Integer(required=True, description='Clients backed up more than a month ago'),
+        'never': fields.Integer(required=True, description='Clients never backed up'),
+    })
+    server_fields = api.model('SummaryServer', {
+        'name': fields.String(description='Server name (null in standalone mode)'),
+        'status': fields.String(required=True, description='ok, error or timeout'),
+        'error': fields.String(description='Why the server could not be summarized'),
+        'alive': fields.Boolean(required=True, description='Did the server answer in time'),
+        'clients': fields.Integer(description='Number of clients'),
+        'running': fields.List(fields.String, description='Clients currently running a backup'),
+        'crashed': fields.List(fields.String, description='Clients whose last backup crashed'),
+        'ages': fields.Nested(ages_fields, description='Age of the last backup of the clients'),
+    })
+    totals_fields = api.model('SummaryTotals', {
+        'clients': fields.Integer(required=True, description='Number of clients'),
+        'running': fields.Integer(required=True, description='Number of running backups'),
+        'crashed': fields.Integer(required=True, description='Number of crashed clients'),
+        'ages': fields.Nested(ages_fields, description='Age of the last backup of the clients'),
+    })
+    summary_fields = api.model('Summary', {
+        'complete': fields.Boolean(required=True, description='Did every server answer in time'),
+        'elapsed': fields.Float(required=True, description='Time spent in seconds'),
+        'totals': fields.Nested(totals_fields, description='Totals of the servers that answered'),
+        'servers': fields.Nested(server_fields, as_list=True, description='Summary of every server'),
+    })
+
+    @api.marshal_with(summary_fields, code=200, description='Success')
+    @api.doc(
+        params={
+            'timeout': 'Maximum number of seconds to wait for the servers',
+        },
+        parser=parser
+    )
+    def get(self):
+        """Returns a summary of every server
+
+        **GET** method provided by the webservice.
+
+        Every server is queried in parallel. The servers that did not answer
+        before the deadline are reported with a *timeout* status, they keep
+        being queried in the background so their results are cached for the
+        next request.
+
+        The *JSON* returned is:
+        ::
+
+            {
+              "complete": false,
+              "elapsed": 5.002,
+              "totals": {
+                "clients": 12,
+                "running": 1,
+                "crashed": 1,
+                "ages": {"day": 9, "week": 1, "month": 0, "older": 1, "never": 1}
+              },
+              "servers": [
+                {
+                  "name": "burp1",
+                  "status": "ok",
+                  "error": null,
+                  "alive": true,
+                  "clients": 12,
+                  "running": ["client1"],
+                  "crashed": ["client4"],
+                  "ages": {"day": 9, "week": 1, "month": 0, "older": 1, "never": 1}
+                },
+                {
+                  "name": "burp2",
+                  "status": "timeout",
+                  "error": "No answer within 5 seconds",
+                  "alive": false,
+                  "clients": null,
+                  "running": null,
+                  "crashed": null,
+                  "ages": null
+                }
+              ]
+            }
+
+
+        The output is filtered by the :mod:`burpui.misc.acl` module so that you
+        only see the servers and clients you are authorized to.
+
+        :returns: The *JSON* described above
+        """
+        start = time.time()
+        args = self.parser.parse_args()
+        deadline = min(args['timeout'] or self.deadline, self.max_deadline)
+        user = current_user.get_id()
+        acl = api.bui.acl
+        admin = not acl or acl.is_admin(user)
+
+        if hasattr(api.bui.cli, 'servers'):
+            servers = list(api.bui.cli.servers)
+            if not admin:
+                allowed = acl.servers(user)
+                servers = [x for x in servers if x in allowed]
+        else:
+            servers = [None]
+
+        output = queue.Queue()
+
+        def fetch(server):
+            with api.bui.app_context():
+                try:
+                    clients = clients_index(server)
+                    running = running_index(server)
+                    output.put((server, clients, running, None))
+                except BUIserverException as e:
+                    output.put((server, None, None, str(e)))
+                except Exception as e:
+                    api.bui.cli._logger('error', '{}\n{}'.format(str(e), traceback.format_exc()))
+                    output.put((server, None, None, str(e)))
+
+        for server in servers:
+            thread = threading.Thread(target=fetch, args=(server,), name='summary-{}'.format(server))
+            thread.daemon = True
+            thread.start()
+
+        results = {}
+        end = start + deadline
+        while len(results) < len(servers):
+            try:
+                res = output.get(timeout=max(end - time.time(), 0))
+            except queue.Empty:
+                break
+            results[res[0]] = res[1:]
+
+        ret = {
+            'complete': len(results) == len(servers),
+            'totals': {'clients': 0, 'running': 0, 'crashed': 0, 'ages': empty_ages()},
+            'servers': [],
+        }
+        totals = ret['totals']
+        for server in servers:
+            summary = {'name': server}
+            if server not in results:
+                summary.update(status='timeout', alive=False, error='No answer within {} seconds'.format(deadline))
+            elif results[server][2]:
+                summary.update(status='error', alive=False, error=results[server][2])
+            else:
+                clients, running, _ = results[server]
+                if not admin:
+                    allowed = acl.clients(user, server)
+                    clients = [x for x in clients if x['name'] in allowed]
+                    running = [x for x in running if x in allowed]
+                summary.update(summarize(clients, running))
+                summary.update(status='ok', alive=True)
+                totals['clients'] += summary['clients']
+                totals['running'] += len(summary['running'])
+                totals['crashed'] += len(summary['crashed'])
+                for (bucket, count) in summary['ages'].items():
+                    totals['ages'][bucket] += count
+            ret['servers'].append(summary)
+        ret['elapsed'] = round(time.time() - start, 3)
+        return ret
@@ -0,0 +1,292 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.async_agent
+    :platform: Unix
+    :synopsis: Burp-UI asyncio agent module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+This module provides an alternative agent server based on :mod:`asyncio`.
+Connections are all handled by a single event loop and only the actual backend
+calls are offloaded to a bounded pool of threads.
+
+It speaks exactly the same protocol as the threaded
+:class:`burpui.agent.AgentServer` so the :class:`burpui.misc.backend.multi.NClient`
+does not need to know which implementation it is talking to.
+
+.. note:: This module requires python >= 3.5
+"""
+import os
+import ssl
+import json
+import time
+import struct
+import socket
+import asyncio
+import functools
+import traceback
+
+from base64 import b64decode
+from concurrent.futures import ThreadPoolExecutor
+
+from .agent import BurpHandler
+from .metrics import registry
+from .utils import FRAME_PROGRESS
+from .tracing import tracer
+from .profiling import profiler
+from .exceptions import BUIserverException
+from ._compat import pickle
+
+# size of the chunks sent while streaming a restoration archive
+CHUNK_SIZE = 64 * 1024
+
+
+class AsyncAgentServer(object):
+    """The :class:`burpui.async_agent.AsyncAgentServer` class serves the agent
+    requests from an :mod:`asyncio` event loop.
+
+    Unlike the threaded server, a connection does not hold a thread while it is
+    idle. The *threads* setting only bounds the number of backend calls running
+    at the same time.
+
+    :param agent: Agent instance
+    :type agent: :class:`burpui.agent.BUIAgent`
+    """
+
+    def __init__(self, agent=None):
+        self.agent = agent
+        self.numThreads = self.agent.threads
+        self.executor = ThreadPoolExecutor(max_workers=self.numThreads)
+        self.clients = []
+        for i in range(self.numThreads):
+            cli = BurpHandler(self.agent.vers, self.agent.logger, self.agent.conf)
+            self.clients.append(cli)
+        self.loop = asyncio.new_event_loop()
+        self.pool = None
+        # number of calls waiting for an idle handler
+        self.waiting = 0
+        registry.gauge('burpui_agent_queue_depth', lambda: self.waiting)
+        registry.gauge(
+            'burpui_agent_busy_workers',
+            lambda: self.numThreads - self.pool.qsize() if self.pool else 0
+        )
+
+    def serve_forever(self):
+        """Run the event loop until doomsday"""
+        loop = self.loop
+        asyncio.set_event_loop(loop)
+        # every backend call picks an idle handler from this pool
+        self.pool = asyncio.Queue()
+        for cli in self.clients:
+            self.pool.put_nowait(cli)
+
+        context = None
+        if self.agent.ssl:
+            context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            context.load_cert_chain(self.agent.sslcert, self.agent.sslkey)
+
+        server = loop.run_until_complete(
+            asyncio.start_server(
+                self.handle,
+                self.agent.bind,
+                self.agent.port,
+                ssl=context,
+                reuse_address=True
+            )
+        )
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            self.executor.shutdown(wait=False)
+            loop.close()
+
+    async def handle(self, reader, writer):
+        """Serve every request sent on a connection until the client closes it
+        (or sends the ``RE`` message)"""
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except (OSError, AttributeError):
+                pass
+        try:
+            while True:
+                try:
+                    lengthbuf = await reader.readexactly(8)
+                    length, = struct.unpack('!Q', lengthbuf)
+                    data = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    break
+                self.agent._logger('info', 'recv: {}'.format(data))
+                txt = data.decode('UTF-8')
+                if txt == 'RE':
+                    break
+                j = json.loads(txt)
+                if j['password'] != self.agent.password:
+                    self.agent._logger('warning', '-----> Wrong Password <-----')
+                    writer.write(b'KO')
+                    await writer.drain()
+                    break
+                if not await self.process(j, writer):
+                    break
+        except Exception as e:
+            self.agent._logger('error', '!!! {} !!!\n{}'.format(str(e), traceback.format_exc()))
+        finally:
+            try:
+                writer.close()
+            except Exception as e:
+                self.agent._logger('error', '!!! {} !!!\n{}'.format(str(e), traceback.format_exc()))
+
+    async def process(self, j, writer):
+        """Process a request and send the answer back.
+
+        :returns: True if the connection can be reused for another request
+        """
+        func = j['func']
+        args = j.get('args') or {}
+        if args and j.get('pickled'):
+            # de-serialize arguments if needed
+            args = pickle.loads(b64decode(args))
+        cli, waiting = await self.acquire()
+        try:
+            try:
+                res = await self.call(cli, func, args, waiting, j.get('trace'), j.get('profile'))
+            except BUIserverException as e:
+                err = str(e).encode('UTF-8')
+                writer.write(b'ER' + struct.pack('!Q', len(err)) + err)
+                await writer.drain()
+                return True
+            except AttributeError as e:
+                self.agent._logger('warning', '{}\nWrong method => {}'.format(traceback.format_exc(), str(e)))
+                writer.write(b'KO')
+                await writer.drain()
+                return False
+
+            if func == 'restore_stream':
+                gen, err = res
+                # the archive is generated by the handler while it is sent so
+                # the handler is only released at the end of the stream
+                await self.send_stream(writer, gen, err)
+                return False
+        finally:
+            self.pool.put_nowait(cli)
+
+        if func == 'restore_files':
+            path, err = res
+            await self.send_archive(writer, path, err)
+            # the client does not expect anything after the archive
+            return False
+
+        res = json.dumps(res)
+        self.agent._logger('info', 'result: {}'.format(res))
+        res = res.encode('UTF-8')
+        writer.write(b'OK' + struct.pack('!Q', len(res)) + res)
+        await writer.drain()
+        return True
+
+    async def acquire(self):
+        """Wait for an idle handler
+
+        :returns: A tuple with the handler and the time we started waiting
+        """
+        waiting = time.time()
+        self.waiting += 1
+        try:
+            cli = await self.pool.get()
+        finally:
+            self.waiting -= 1
+        return cli, waiting
+
+    async def call(self, cli, func, args, waiting, trace=None, profile=False):
+        """Run a backend call of the handler *cli* in the executor"""
+        method = getattr(cli, func)
+        if trace:
+            method = functools.partial(self.traced, trace, func, waiting, time.time(), method)
+        if profiler.enabled:
+            method = functools.partial(self.profiled, func, profile, method)
+        return await self.loop.run_in_executor(
+            self.executor,
+            functools.partial(method, **args)
+        )
+
+    @staticmethod
+    def traced(tid, func, waiting, acquired, method, **args):
+        """Run a backend call within the trace started by the server.
+
+        Only the call itself is traced: for ``restore_stream`` the trace ends
+        once the generator of the archive is returned, the generation and the
+        sending of the chunks by
+        :func:`burpui.async_agent.AsyncAgentServer.send_stream` are not part
+        of it."""
+        trace = tracer.begin(tid, func, force=True, start=waiting)
+        trace.add('agent.wait', waiting, acquired - waiting)
+        try:
+            return method(**args)
+        finally:
+            tracer.end()
+
+    @staticmethod
+    def profiled(func, force, method, **args):
+        """Run a backend call within a profile if the server asked for it or
+        if it is picked by the sampling rate"""
+        profiler.start(func, force=bool(force))
+        try:
+            return method(**args)
+        finally:
+            profiler.stop()
+
+    async def send_archive(self, writer, path, err):
+        """Stream the restoration archive to the client chunk by chunk while
+        honoring the transport flow control"""
+        if err:
+            self.agent._logger('error', 'Restoration failed')
+            err = err.encode('UTF-8')
+            writer.write(b'OK' + b'KO' + struct.pack('!Q', len(err)) + err)
+            await writer.drain()
+            return
+        try:
+            size = os.path.getsize(path)
+            writer.write(b'OK' + b'OK' + struct.pack('!Q', size))
+            with open(path, 'rb') as f:
+                buf = f.read(CHUNK_SIZE)
+                while buf:
+                    writer.write(buf)
+                    await writer.drain()
+                    buf = f.read(CHUNK_SIZE)
+            self.agent._logger('info', 'sent {} Bytes'.format(size))
+        finally:
+            os.unlink(path)
+
+    async def send_stream(self, writer, gen, err):
+        """Send the restoration archive as it is generated. Every chunk is
+        produced in the executor and sent in its own frame, preceded by the
+        number of files archived so far when it changed. An empty frame marks
+        the end of the archive"""
+        if err:
+            self.agent._logger('error', 'Restoration failed')
+            err = err.encode('UTF-8')
+            writer.write(b'OK' + b'KO' + struct.pack('!Q', len(err)) + err)
+            await writer.drain()
+            return
+        size = 0
+        files = 0
+        try:
+            writer.write(b'OK' + b'OK')
+            while True:
+                chunk = await self.loop.run_in_executor(self.executor, next, gen, None)
+                if getattr(gen, 'files', files) != files:
+                    files = gen.files
+                    writer.write(struct.pack('!Q', FRAME_PROGRESS | files))
+                if chunk is None:
+                    break
+                writer.write(struct.pack('!Q', len(chunk)) + chunk)
+                size += len(chunk)
+                await writer.drain()
+        finally:
+            # closing the generator cleans the restored files up
+            await self.loop.run_in_executor(self.executor, gen.close)
+        writer.write(struct.pack('!Q', 0))
+        await writer.drain()
+        self.agent._logger('info', 'sent {} Bytes'.format(size))
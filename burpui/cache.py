@@ -0,0 +1,109 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.cache
+    :platform: Unix
+    :synopsis: Burp-UI cache module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+"""
+import time
+import threading
+
+from collections import OrderedDict
+from werkzeug.contrib.cache import BaseCache
+
+from ._compat import pickle
+
+
+class MemoryCache(BaseCache):
+    """In-process cache honoring both the timeout of the entries and a
+    maximum amount of memory. When the cache is full, the least recently used
+    entries are evicted first.
+
+    Unlike :class:`werkzeug.contrib.cache.SimpleCache`, this cache is
+    thread-safe.
+
+    :param maxsize: Maximum size in bytes of the (serialized) entries
+    :type maxsize: int
+
+    :param default_timeout: Timeout used when none is given to
+                            :meth:`set`. 0 means the entry never expires
+    :type default_timeout: int
+    """
+
+    def __init__(self, maxsize=64 * 1024 * 1024, default_timeout=300):
+        BaseCache.__init__(self, default_timeout)
+        self.maxsize = maxsize
+        self.size = 0
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _expires(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        if timeout > 0:
+            return time.time() + timeout
+        return 0
+
+    def _pop(self, key):
+        item = self._cache.pop(key, None)
+        if item is not None:
+            self.size -= len(item[1])
+        return item
+
+    def get(self, key):
+        with self._lock:
+            item = self._pop(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires and expires <= time.time():
+                return None
+            # put it back at the end so it is the last one to be evicted
+            self._cache[key] = item
+            self.size += len(value)
+        try:
+            return pickle.loads(value)
+        except pickle.PickleError:
+            return None
+
+    def set(self, key, value, timeout=None):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(value) > self.maxsize:
+            return False
+        with self._lock:
+            self._pop(key)
+            self._cache[key] = (self._expires(timeout), value)
+            self.size += len(value)
+            while self.size > self.maxsize:
+                self._pop(next(iter(self._cache)))
+        return True
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if self.has(key):
+                return False
+            return self.set(key, value, timeout)
+
+    def has(self, key):
+        with self._lock:
+            item = self._cache.get(key)
+            return item is not None and (not item[0] or item[0] > time.time())
+
+    def delete(self, key):
+        with self._lock:
+            return self._pop(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.size = 0
+        return True
+
+
+def memory(app, config, args, kwargs):
+    """Factory used by :mod:`flask.ext.cache` when ``CACHE_TYPE`` is set to
+    ``burpui.cache.memory``"""
+    kwargs.update(dict(maxsize=config.get('CACHE_MAXSIZE', 64 * 1024 * 1024)))
+    return MemoryCache(*args, **kwargs)
@@ -0,0 +1,317 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.capture
+    :platform: Unix
+    :synopsis: Burp-UI capture and replay module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+The backends can record every status query along with the raw answer of the
+burp server in a capture file. Such a file can then be used in place of a
+burp server so ``Burp-UI`` can be profiled against the data of a real fleet
+without any burp server at hand.
+
+A capture file is a gzip compressed list of JSON documents, one per line. The
+first one describes the capture, the next ones are the queries::
+
+    {"capture": 1, "backend": 2, "start": 1475000000.0, ...}
+    [0.012, 0.004, "c:\\n", "{\\"clients\\": [...]}"]
+
+A query is made of its offset since the beginning of the capture, its
+duration, the query itself and the raw answer (the list of lines for burp-1,
+the JSON document for burp-2).
+
+Client names and paths can be anonymised while recording. They are replaced
+the same way in the queries and in the answers so the replayed data remains
+browsable. The free-form logs only get their client names replaced.
+"""
+import re
+import json
+import gzip
+import time
+import zlib
+import threading
+
+from six import iteritems
+
+FORMAT = 1
+
+# the backends of an agent share the captures and the replays
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _split_query(query):
+    """Splits a status query in a list of (key, value)"""
+    parts = query.split(':')
+    ret = []
+    i = 0
+    while i < len(parts) - 1:
+        if parts[i] == 'p':
+            # paths may contain ':'
+            ret.append(('p', ':'.join(parts[i + 1:])))
+            break
+        ret.append((parts[i], parts[i + 1]))
+        i += 2
+    return ret
+
+
+class Anonymiser(object):
+    """The :class:`burpui.capture.Anonymiser` class replaces the client names
+    and the path components with stable aliases"""
+    # the listed entries of a burp-1 tree: mode nlink uid gid size date time name
+    burp1_entry = re.compile(r'^(\S{10}(?:\s+\S+){6}\s+)(.*)$')
+
+    def __init__(self):
+        self.clients = {}
+        self.components = {}
+        self.pattern = None
+        self.lock = threading.Lock()
+
+    def client(self, name):
+        """Returns the alias of a client"""
+        if not name:
+            return name
+        alias = self.clients.get(name)
+        if alias is None:
+            with self.lock:
+                alias = self.clients.setdefault(name, 'client{}'.format(len(self.clients) + 1))
+                self.pattern = None
+        return alias
+
+    def component(self, name):
+        """Returns the alias of a path component, keeping its extension"""
+        if name in ['', '.', '..'] or re.match(r'^[A-Za-z]:$', name):
+            return name
+        alias = self.components.get(name)
+        if alias is None:
+            ext = ''
+            idx = name.rfind('.')
+            if 0 < idx and len(name) - idx <= 5:
+                ext = name[idx:]
+            with self.lock:
+                alias = self.components.setdefault(name, 'f{}{}'.format(len(self.components) + 1, ext))
+        return alias
+
+    def path(self, path):
+        """Returns the alias of a path"""
+        if not path:
+            return path
+        sep = '\\' if '\\' in path and '/' not in path else '/'
+        return sep.join(self.component(x) for x in path.split(sep))
+
+    def text(self, text):
+        """Replaces the known client names in a free-form text"""
+        if not self.clients or not text:
+            return text
+        pattern = self.pattern
+        if pattern is None:
+            names = sorted(self.clients, key=len, reverse=True)
+            pattern = self.pattern = re.compile(r'\b({})\b'.format('|'.join(re.escape(x) for x in names)))
+        return pattern.sub(lambda m: self.clients[m.group(1)], text)
+
+    def query(self, query):
+        """Returns the anonymised status query"""
+        ret = []
+        for (key, val) in _split_query(query.rstrip('\n')):
+            if key == 'c':
+                val = self.client(val)
+            elif key == 'p':
+                val = self.path(val)
+            ret += [key, val]
+        return ':'.join(ret) + ('\n' if query.endswith('\n') else '')
+
+    def burp1(self, query, lines):
+        """Returns the anonymised answer of a burp-1 server"""
+        qry = dict(_split_query(query.rstrip('\n')))
+        ret = []
+        if 'b' not in qry:
+            # client(s) status: name, version, status, ... (path if running)
+            for line in lines:
+                fields = line.split('\t')
+                fields[0] = self.client(fields[0])
+                if len(fields) > 4 and fields[2] == 'r' and ('/' in fields[-1] or '\\' in fields[-1]):
+                    fields[-1] = self.path(fields[-1])
+                ret.append('\t'.join(fields))
+            return ret
+        if 'p' in qry:
+            for line in lines:
+                match = self.burp1_entry.match(line)
+                if match and line not in ['-list begin-', '-list end-']:
+                    line = match.group(1) + self.component(match.group(2))
+                ret.append(line)
+            return ret
+        return [self.text(x) for x in lines]
+
+    def burp2(self, doc):
+        """Returns the anonymised document of a burp-2 server"""
+        js = json.loads(doc)
+        for client in js.get('clients', []):
+            client['name'] = self.client(client.get('name'))
+            for backup in client.get('backups', []):
+                browse = backup.get('browse')
+                if browse:
+                    browse['directory'] = self.path(browse.get('directory'))
+                    for entry in browse.get('entries', []):
+                        entry['name'] = self.component(entry['name'])
+                for counter in backup.get('counters', []):
+                    if counter.get('name') == 'path' and 'count' in counter:
+                        counter['count'] = self.path(counter['count'])
+                logs = backup.get('logs', {})
+                for (key, val) in iteritems(logs):
+                    if key != 'list' and isinstance(val, list):
+                        logs[key] = [self.text(x) for x in val]
+        return json.dumps(js, separators=(',', ':'))
+
+
+class Capture(object):
+    """The :class:`burpui.capture.Capture` class records the status queries
+    and their raw answers.
+
+    :param path: Path of the capture file
+    :type path: str
+
+    :param backend: Version of the backend recording the queries
+    :type backend: int
+
+    :param anonymise: Whether to anonymise the client names and the paths
+    :type anonymise: bool
+
+    :param info: Extra information stored in the header of the capture
+    :type info: dict
+    """
+
+    def __init__(self, path, backend, anonymise=False, info=None):
+        self.path = path
+        self.backend = backend
+        self.anonymiser = Anonymiser() if anonymise else None
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.fileobj = gzip.open(path, 'wb')
+        header = {'capture': FORMAT, 'backend': backend, 'start': self.start, 'anonymised': bool(anonymise)}
+        header.update(info or {})
+        self._write(header)
+
+    def _write(self, obj):
+        line = json.dumps(obj, separators=(',', ':')) + '\n'
+        self.fileobj.write(line.encode('utf-8'))
+        # flush every record so an interrupted capture remains readable
+        self.fileobj.flush()
+
+    def record(self, query, answer, start, duration):
+        """Record a query.
+
+        :param query: The status query
+        :type query: str
+
+        :param answer: The raw answer (list of lines for burp-1, JSON
+                       document for burp-2)
+
+        :param start: Timestamp of the query
+        :type start: float
+
+        :param duration: Time spent in the query (in seconds)
+        :type duration: float
+        """
+        if self.anonymiser:
+            if self.backend == 1:
+                answer = self.anonymiser.burp1(query, answer)
+            elif answer:
+                answer = self.anonymiser.burp2(answer)
+            query = self.anonymiser.query(query)
+        with self.lock:
+            if self.fileobj:
+                self._write([round(start - self.start, 6), round(duration, 6), query, answer])
+
+    def close(self):
+        with self.lock:
+            if self.fileobj:
+                self.fileobj.close()
+                self.fileobj = None
+
+
+def read(path):
+    """Returns the header and a generator of the queries of a capture file"""
+    fileobj = gzip.open(path, 'rb')
+    try:
+        header = json.loads(fileobj.readline().decode('utf-8'))
+    except (ValueError, IOError, EOFError, zlib.error):
+        fileobj.close()
+        raise ValueError('{} is not a capture file'.format(path))
+    if not isinstance(header, dict) or header.get('capture') != FORMAT:
+        fileobj.close()
+        raise ValueError('{} is not a capture file'.format(path))
+
+    def queries():
+        try:
+            for line in fileobj:
+                yield json.loads(line.decode('utf-8'))
+        except (EOFError, IOError, zlib.error, ValueError):
+            # the capture was interrupted
+            pass
+        finally:
+            fileobj.close()
+    return header, queries()
+
+
+class Replay(object):
+    """The :class:`burpui.capture.Replay` class answers the status queries
+    with the answers of a capture file.
+
+    The same query gets the recorded answers in turn so the running backups
+    keep progressing.
+
+    :param path: Path of the capture file
+    :type path: str
+
+    :param speed: Timing of the answers: 1 waits as long as the original
+                  query, 10 ten times less, 0 does not wait at all
+    :type speed: float
+    """
+
+    def __init__(self, path, speed=1):
+        self.path = path
+        self.speed = speed
+        self.header, queries = read(path)
+        self.backend = self.header.get('backend')
+        self.answers = {}
+        self.queries = []
+        self.cursors = {}
+        self.lock = threading.Lock()
+        for (offset, duration, query, answer) in queries:
+            self.answers.setdefault(query.strip(), []).append((duration, answer))
+            self.queries.append((offset, query))
+
+    def answer(self, query):
+        """Returns the recorded answer of a query or None"""
+        key = query.strip()
+        answers = self.answers.get(key)
+        if not answers:
+            return None
+        with self.lock:
+            idx = self.cursors.get(key, 0)
+            self.cursors[key] = (idx + 1) % len(answers)
+        duration, answer = answers[idx]
+        if self.speed:
+            time.sleep(duration / self.speed)
+        return answer
+
+
+def open_capture(path, backend, anonymise=False, info=None):
+    """Returns the :class:`burpui.capture.Capture` recording in *path*,
+    shared by every backend of the process"""
+    with _shared_lock:
+        capture = _shared.get(('capture', path))
+        if capture is None or capture.fileobj is None:
+            capture = _shared[('capture', path)] = Capture(path, backend, anonymise, info)
+        return capture
+
+
+def load_replay(path, speed=1):
+    """Returns the :class:`burpui.capture.Replay` of *path*, shared by every
+    backend of the process"""
+    with _shared_lock:
+        replay = _shared.get(('replay', path, speed))
+        if replay is None:
+            replay = _shared[('replay', path, speed)] = Replay(path, speed)
+        return replay
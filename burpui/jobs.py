@@ -0,0 +1,304 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.jobs
+    :platform: Unix
+    :synopsis: Burp-UI restoration jobs module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+"""
+import os
+import json
+import fcntl
+import time
+import uuid
+import shutil
+import threading
+import traceback
+
+from contextlib import contextmanager
+
+from .metrics import registry
+from .exceptions import BUIserverException
+
+
+class RestoreJobs(object):
+    """The :class:`burpui.jobs.RestoreJobs` class runs online restorations in
+    the background.
+
+    Every job lives in its own directory containing a ``state.json`` file and
+    the generated archive. Because everything is stored on disk, the progress
+    of a job can be followed from any worker (when running under gunicorn for
+    instance), and a job can be cancelled from any worker too. The limits of
+    running jobs are enforced under a lock file of the jobs directory so they
+    apply to every worker as a whole.
+
+    The progress is made of the number of files archived so far (``files``)
+    and of the size of the archive generated so far (``bytes``), which is the
+    size of the compressed archive and not the size of the restored data.
+
+    :param app: The application context
+    :type app: :class:`burpui.server.BUIServer`
+
+    :param tmpdir: Directory where to store the jobs
+    :type tmpdir: str
+
+    :param ttl: Number of seconds to keep the finished jobs
+    :type ttl: int
+
+    :param serverjobs: Maximum number of running jobs per server
+    :type serverjobs: int
+
+    :param userjobs: Maximum number of running jobs per user
+    :type userjobs: int
+    """
+    # the different phases of a job
+    QUEUED = 'queued'
+    RESTORING = 'restoring'
+    ARCHIVING = 'archiving'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    running = [QUEUED, RESTORING, ARCHIVING]
+    # minimal interval between two updates of the state while archiving
+    interval = 1
+    # interval between two heartbeats of a running job
+    heartbeat = 60
+
+    def __init__(self, app=None, tmpdir='/tmp/bui-jobs', ttl=3600, serverjobs=2, userjobs=1):
+        self.app = app
+        self.tmpdir = tmpdir
+        self.ttl = ttl
+        self.serverjobs = serverjobs
+        self.userjobs = userjobs
+        self.lock = threading.Lock()
+        if not os.path.isdir(self.tmpdir):
+            os.makedirs(self.tmpdir)
+
+    def _path(self, jid, name=''):
+        # job ids are generated by us, refuse anything else
+        if not jid or not all(c in '0123456789abcdef' for c in jid):
+            raise BUIserverException('Invalid job id')
+        return os.path.join(self.tmpdir, jid, name)
+
+    def _write(self, state):
+        """Atomically update the state of a job"""
+        state['updated'] = time.time()
+        path = self._path(state['id'], 'state.json')
+        with open(path + '.tmp', 'w') as fileobj:
+            json.dump(state, fileobj)
+        os.rename(path + '.tmp', path)
+
+    @contextmanager
+    def _locked(self):
+        """Serialize the creation of the jobs between the threads and the
+        processes sharing the jobs directory"""
+        with self.lock:
+            with open(os.path.join(self.tmpdir, '.lock'), 'a') as fileobj:
+                fcntl.flock(fileobj, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fileobj, fcntl.LOCK_UN)
+
+    def get(self, jid):
+        """Returns the state of a job or None if it does not exist"""
+        try:
+            with open(self._path(jid, 'state.json')) as fileobj:
+                return json.load(fileobj)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def list(self, user=None):
+        """Returns the state of every job, optionally filtered by user"""
+        self.cleanup()
+        ret = []
+        for jid in os.listdir(self.tmpdir):
+            if jid.startswith('.'):
+                continue
+            state = self.get(jid)
+            if state and (user is None or state['user'] == user):
+                ret.append(state)
+        ret.sort(key=lambda x: x['created'])
+        return ret
+
+    def _alive(self, jid):
+        """Returns the time of the last heartbeat of a running job"""
+        try:
+            return os.path.getmtime(self._path(jid, 'heartbeat'))
+        except OSError:
+            return 0
+
+    def cleanup(self):
+        """Remove the jobs that are finished since more than *ttl* seconds.
+        Running jobs whose worker did not report anything for that long are
+        considered as dead (their worker may have been killed)."""
+        now = time.time()
+        for jid in os.listdir(self.tmpdir):
+            if jid.startswith('.'):
+                continue
+            try:
+                state = self.get(jid)
+                if state:
+                    updated = state['updated']
+                    if state['phase'] in self.running:
+                        updated = max(updated, self._alive(jid))
+                    if now - updated < self.ttl:
+                        continue
+                if not state:
+                    # the state may just be in the process of being created
+                    path = self._path(jid)
+                    if now - os.path.getmtime(path) < self.ttl:
+                        continue
+                shutil.rmtree(self._path(jid), ignore_errors=True)
+            except (BUIserverException, OSError):
+                continue
+
+    def create(self, user=None, name=None, backup=None, files=None, strip=None, archive='zip', password=None, server=None):
+        """Create and start a restoration job.
+
+        :returns: A tuple with the state of the new job and/or an error message
+        """
+        with self._locked():
+            active = [x for x in self.list() if x['phase'] in self.running]
+            if self.userjobs and len([x for x in active if x['user'] == user]) >= self.userjobs:
+                return None, 'Too many running restorations for user {}'.format(user)
+            if self.serverjobs and len([x for x in active if x['server'] == server]) >= self.serverjobs:
+                return None, 'Too many running restorations on this server'
+            jid = uuid.uuid4().hex
+            os.makedirs(self._path(jid))
+            now = time.time()
+            state = {
+                'id': jid,
+                'user': user,
+                'client': name,
+                'backup': backup,
+                'server': server,
+                'format': archive,
+                'phase': self.QUEUED,
+                'files': None,
+                'bytes': 0,
+                'error': None,
+                'created': now,
+                'finished': None,
+            }
+            self._write(state)
+
+        # the password is never written on disk
+        thread = threading.Thread(
+            target=self._run,
+            args=(state, files, strip, password),
+            name='restore-{}'.format(jid)
+        )
+        thread.daemon = True
+        thread.start()
+        return state, None
+
+    def cancel(self, jid):
+        """Cancel a job. The job stops as soon as it notices the request."""
+        state = self.get(jid)
+        if not state:
+            return False
+        if state['phase'] in self.running:
+            # the worker running the job may live in another process
+            open(self._path(jid, 'cancel'), 'w').close()
+        else:
+            shutil.rmtree(self._path(jid), ignore_errors=True)
+        return True
+
+    def archive(self, jid):
+        """Returns the path of the archive of a finished job"""
+        state = self.get(jid)
+        if not state or state['phase'] != self.DONE:
+            return None
+        return self._path(jid, 'archive')
+
+    def _cancelled(self, jid):
+        return os.path.exists(self._path(jid, 'cancel'))
+
+    def _heartbeat(self, jid, done):
+        """Keep a running job alive even when it does not report any
+        progress (burp may take a while before streaming anything)"""
+        path = self._path(jid, 'heartbeat')
+        while not done.wait(min(self.heartbeat, self.ttl / 2.0)):
+            try:
+                with open(path, 'a'):
+                    os.utime(path, None)
+            except (IOError, OSError):
+                # the job has been removed in the meantime
+                return
+
+    def _run(self, state, files, strip, password):
+        jid = state['id']
+        stream = None
+        start = time.time()
+        done = threading.Event()
+        beat = threading.Thread(
+            target=self._heartbeat,
+            args=(jid, done),
+            name='restore-heartbeat-{}'.format(jid)
+        )
+        beat.daemon = True
+        beat.start()
+        try:
+            state['phase'] = self.RESTORING
+            self._write(state)
+            stream, err = self.app.cli.restore_stream(
+                state['client'],
+                state['backup'],
+                files,
+                strip,
+                state['format'],
+                password,
+                state['server']
+            )
+            if not stream:
+                raise BUIserverException(err or 'Restoration failed')
+            if self._cancelled(jid):
+                raise BUIserverException(self.CANCELLED)
+
+            state['phase'] = self.ARCHIVING
+            self._write(state)
+            last = time.time()
+            path = self._path(jid, 'archive')
+            with open(path + '.tmp', 'wb') as fileobj:
+                for chunk in stream:
+                    fileobj.write(chunk)
+                    state['bytes'] += len(chunk)
+                    if time.time() - last >= self.interval:
+                        last = time.time()
+                        if self._cancelled(jid):
+                            raise BUIserverException(self.CANCELLED)
+                        state['files'] = getattr(stream, 'files', None)
+                        self._write(state)
+            os.rename(path + '.tmp', path)
+            state['files'] = getattr(stream, 'files', None)
+            state['phase'] = self.DONE
+            registry.observe('burpui_restore_seconds', time.time() - start, {'kind': 'job'})
+            registry.observe('burpui_restore_bytes', state['bytes'], {'kind': 'job'})
+        except BUIserverException as e:
+            if str(e) == self.CANCELLED or self._cancelled(jid):
+                state['phase'] = self.CANCELLED
+            else:
+                state['phase'] = self.FAILED
+                state['error'] = str(e)
+        except Exception as e:
+            self.app.cli._logger('error', '{}\n{}'.format(str(e), traceback.format_exc()))
+            state['phase'] = self.FAILED
+            state['error'] = str(e)
+        finally:
+            done.set()
+            if stream is not None and hasattr(stream, 'close'):
+                # cleans the restored files up
+                stream.close()
+
+        if state['phase'] == self.CANCELLED:
+            shutil.rmtree(self._path(jid), ignore_errors=True)
+            return
+        state['finished'] = time.time()
+        try:
+            self._write(state)
+        except (IOError, OSError):
+            # the job has been removed in the meantime
+            pass
@@ -0,0 +1,103 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.live
+    :platform: Unix
+    :synopsis: Burp-UI live monitoring module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+"""
+import time
+import threading
+import traceback
+
+from six.moves import queue
+
+
+class LiveSampler(object):
+    """The :class:`burpui.live.LiveSampler` class queries the backend once per
+    interval on behalf of every *live-monitor* viewer and broadcasts the
+    result to all of them. The load on the backend does not depend on the
+    number of viewers anymore.
+
+    The sampling thread is started with the first subscriber and stops once
+    the last one left.
+
+    :param sample: Callable returning the data to broadcast
+    :type sample: callable
+
+    :param interval: Number of seconds between two samples
+    :type interval: int
+
+    :param logger: Optional callable used to report the sampling errors
+    :type logger: callable
+    """
+
+    def __init__(self, sample, interval=5, logger=None):
+        self.sample = sample
+        self.interval = interval
+        self.logger = logger
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        # last sample and the time it was taken at
+        self.data = None
+        self.stamp = 0
+
+    def subscribe(self):
+        """Register a new subscriber.
+
+        :returns: A queue receiving every sample. Only the most recent sample
+                  is kept if the subscriber is too slow to consume them
+        """
+        sub = queue.Queue(maxsize=1)
+        with self.lock:
+            self.subscribers.add(sub)
+            # do not make the newcomer wait for the next sample
+            if self.data is not None and time.time() - self.stamp < self.interval:
+                sub.put(self.data)
+            if not self.thread or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='live-sampler')
+                self.thread.daemon = True
+                self.thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        """Remove a subscriber"""
+        with self.lock:
+            self.subscribers.discard(sub)
+            if not self.subscribers:
+                self.wakeup.set()
+
+    @staticmethod
+    def _push(sub, data):
+        try:
+            sub.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            sub.put_nowait(data)
+        except queue.Full:  # pragma: no cover
+            pass
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    return
+                self.wakeup.clear()
+            try:
+                data = self.sample()
+            except Exception as e:
+                if self.logger:
+                    self.logger('error', '{}\n{}'.format(str(e), traceback.format_exc()))
+                data = None
+            if data is not None:
+                with self.lock:
+                    self.data = data
+                    self.stamp = time.time()
+                    for sub in self.subscribers:
+                        self._push(sub, data)
+            self.wakeup.wait(self.interval)
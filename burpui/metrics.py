@@ -0,0 +1,294 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.metrics
+    :platform: Unix
+    :synopsis: Burp-UI metrics module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+The metrics are kept in memory and exposed in the `Prometheus
+<https://prometheus.io/>`_ text format. Recording a value only costs a lock,
+a dict lookup and a few additions so it can be done in the hot path.
+"""
+import time
+import bisect
+import threading
+
+from functools import wraps
+
+from .utils import BUIprogress
+from .tracing import tracer
+from .misc.backend.interface import BUIbackend
+
+# default buckets of the latency histograms (in seconds)
+LATENCY = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# buckets of the size histograms (in bytes)
+SIZE = tuple(x * 1024 * 1024 for x in (1, 10, 100, 1024, 10 * 1024, 100 * 1024))
+# buckets of the restoration durations (in seconds)
+DURATION = (1, 5, 15, 60, 300, 900, 3600, 4 * 3600)
+
+
+class Histogram(object):
+    """Cumulative histogram with fixed buckets"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry(object):
+    """The :class:`burpui.metrics.Registry` class stores every metric.
+
+    Every metric must be declared with :func:`burpui.metrics.Registry.declare`
+    before being recorded.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> (type, help, buckets)
+        self.families = {}
+        # name -> labels -> value (or histogram)
+        self.values = {}
+        # name -> callback returning the current value(s) of a gauge
+        self.gauges = {}
+        self.order = []
+
+    def declare(self, name, kind, help, buckets=None):
+        """Declare a metric.
+
+        :param kind: One of *counter*, *histogram* or *gauge*
+        :type kind: str
+        """
+        with self.lock:
+            if name not in self.families:
+                self.order.append(name)
+                self.values[name] = {}
+            self.families[name] = (kind, help, buckets)
+
+    def inc(self, name, labels=None, value=1):
+        """Increment a counter"""
+        key = tuple(sorted(labels.items())) if labels else ()
+        with self.lock:
+            values = self.values[name]
+            values[key] = values.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        """Record a value in a histogram"""
+        key = tuple(sorted(labels.items())) if labels else ()
+        with self.lock:
+            values = self.values[name]
+            hist = values.get(key)
+            if hist is None:
+                hist = values[key] = Histogram(self.families[name][2] or LATENCY)
+            hist.observe(value)
+
+    def gauge(self, name, callback):
+        """Register the callback of a gauge. It returns either a number or a
+        dict of labels -> number and is only called when the metrics are
+        rendered"""
+        self.gauges[name] = callback
+
+    def get(self, name, labels=None):
+        """Returns the current value of a counter"""
+        key = tuple(sorted(labels.items())) if labels else ()
+        with self.lock:
+            return self.values.get(name, {}).get(key, 0)
+
+    @staticmethod
+    def _labels(key, extra=None):
+        items = list(key)
+        if extra:
+            items.append(extra)
+        if not items:
+            return ''
+        return '{' + ','.join(
+            '{}="{}"'.format(k, escape(v)) for (k, v) in items
+        ) + '}'
+
+    def render(self):
+        """Returns every metric in the Prometheus text format"""
+        lines = []
+        with self.lock:
+            snapshot = []
+            for name in self.order:
+                values = self.values[name]
+                items = []
+                for (key, val) in values.items():
+                    if isinstance(val, Histogram):
+                        val = (list(val.counts), val.sum, val.count)
+                    items.append((key, val))
+                snapshot.append((name, self.families[name], items))
+        for (name, (kind, help, buckets), items) in snapshot:
+            callback = self.gauges.get(name)
+            if callback:
+                try:
+                    current = callback()
+                except Exception:
+                    current = None
+                if isinstance(current, dict):
+                    items = [(tuple(sorted(k.items())) if isinstance(k, dict) else k, v) for (k, v) in current.items()]
+                elif current is not None:
+                    items = [((), current)]
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for (key, val) in sorted(items):
+                if kind != 'histogram':
+                    lines.append('{}{} {}'.format(name, self._labels(key), val))
+                    continue
+                counts, total, count = val
+                cumul = 0
+                for (bound, num) in zip(list(buckets or LATENCY) + ['+Inf'], counts):
+                    cumul += num
+                    lines.append('{}_bucket{} {}'.format(
+                        name, self._labels(key, ('le', bound)), cumul
+                    ))
+                lines.append('{}_sum{} {}'.format(name, self._labels(key), total))
+                lines.append('{}_count{} {}'.format(name, self._labels(key), count))
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def query_shape(query):
+    """Returns the shape of a status query: the client names, backup numbers
+    and paths are replaced by ``*`` so the number of shapes stays small.
+
+    >>> query_shape('c:client1:b:42:l:backup\\n')
+    'c:*:b:*:l:*'
+    """
+    query = query.strip()
+    if not query:
+        return 'summary'
+    parts = query.split(':')
+    shape = [parts[0]]
+    for (i, part) in enumerate(parts[1:]):
+        # the first part is always the name of the client
+        if i and len(part) == 1 and part.isalpha():
+            shape.append(part)
+        elif part:
+            shape.append('*')
+        else:
+            shape.append('')
+    return ':'.join(shape)
+
+
+registry = Registry()
+registry.declare('burpui_api_request_seconds', 'histogram', 'Time spent serving the API requests per endpoint')
+registry.declare('burpui_api_requests_total', 'counter', 'Number of API requests per endpoint and status code')
+registry.declare('burpui_backend_call_seconds', 'histogram', 'Time spent in the backend methods')
+registry.declare('burpui_backend_errors_total', 'counter', 'Number of backend calls that raised an exception')
+registry.declare('burpui_status_query_seconds', 'histogram', 'Time spent in the burp status queries per query shape')
+registry.declare('burpui_agent_request_seconds', 'histogram', 'Time spent waiting for the agents')
+registry.declare('burpui_cache_requests_total', 'counter', 'Number of cache lookups per endpoint and result')
+registry.declare('burpui_cache_hit_ratio', 'gauge', 'Ratio of cache lookups served from the cache per endpoint')
+registry.declare('burpui_agent_queue_depth', 'gauge', 'Number of agent requests waiting for a worker')
+registry.declare('burpui_agent_busy_workers', 'gauge', 'Number of agent workers currently serving a request')
+registry.declare('burpui_restore_seconds', 'histogram', 'Duration of the restorations', DURATION)
+registry.declare('burpui_restore_bytes', 'histogram', 'Size of the restoration archives', SIZE)
+registry.declare('burpui_live_subscribers', 'gauge', 'Number of live-monitor viewers')
+
+
+def cache_hit_ratio():
+    ret = {}
+    with registry.lock:
+        lookups = dict(registry.values['burpui_cache_requests_total'])
+    for (key, count) in lookups.items():
+        labels = dict(key)
+        if labels.get('result') != 'hit':
+            continue
+        miss = lookups.get(tuple(sorted(dict(labels, result='miss').items())), 0)
+        ret[(('endpoint', labels.get('endpoint')),)] = float(count) / (count + miss)
+    return ret
+
+
+registry.gauge('burpui_cache_hit_ratio', cache_hit_ratio)
+
+
+def track_restore(stream, kind):
+    """Wraps the chunks of a restoration archive in order to record its size
+    and duration once it has been sent"""
+    start = time.time()
+
+    def chunks(progress):
+        for chunk in stream:
+            yield chunk
+        registry.observe('burpui_restore_seconds', time.time() - start, {'kind': kind})
+        registry.observe('burpui_restore_bytes', progress.bytes, {'kind': kind})
+
+    # the stream is closed even if the client leaves before the first chunk
+    return BUIprogress(chunks, getattr(stream, 'close', None))
+
+
+# methods of the backends we time
+BACKEND_METHODS = sorted(
+    k for (k, v) in vars(BUIbackend).items()
+    if getattr(v, '__isabstractmethod__', False)
+)
+
+
+def _timed_method(func, name):
+    labels = {'method': name}
+    span = 'backend.' + name
+
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        start = time.time()
+        try:
+            with tracer.span(span):
+                return func(*args, **kwargs)
+        except Exception:
+            registry.inc('burpui_backend_errors_total', labels)
+            raise
+        finally:
+            registry.observe('burpui_backend_call_seconds', time.time() - start, labels)
+    return wrapped
+
+
+def _timed_status(func):
+    # the default query depends on the burp version
+    defaults = getattr(getattr(func, '__func__', func), '__defaults__', None) or ('',)
+
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        query = args[0] if args else kwargs.get('query', defaults[0])
+        shape = query_shape(query)
+        start = time.time()
+        try:
+            with tracer.span('status', shape):
+                return func(*args, **kwargs)
+        finally:
+            registry.observe(
+                'burpui_status_query_seconds',
+                time.time() - start,
+                {'query': shape}
+            )
+    return wrapped
+
+
+def instrument_backend(cli):
+    """Time the methods of a backend instance. In multi-agent mode, the
+    requests sent to every agent are timed by
+    :func:`burpui.misc.backend.multi.NClient.do_command`."""
+    if getattr(cli, '_instrumented', False):
+        return cli
+    for name in BACKEND_METHODS:
+        func = getattr(cli, name, None)
+        if func is not None:
+            setattr(cli, name, _timed_method(func, name))
+    status = getattr(cli, 'status', None)
+    if status is not None and not hasattr(cli, 'servers'):
+        setattr(cli, 'status', _timed_status(status))
+    cli._instrumented = True
+    return cli
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -17,13 +17,18 @@ import shutil
 import subprocess
 import tempfile
 import codecs
+import random
+import threading
 
 from pipes import quote
-from six import iteritems
+from six import iteritems, viewkeys
 
 from .interface import BUIbackend
 from ..parser.burp1 import Parser
-from ...utils import human_readable as _hr, BUIcompress
+from ...utils import human_readable as _hr, BUIstream, BUIprogress, open_archives
+from ...tracing import tracer
+from ...slowlog import open_slowlog
+from ...capture import open_capture, load_replay
 from ...exceptions import BUIserverException
 from ..._compat import ConfigParser, unquote, PY3
 
@@ -34,6 +39,18 @@ G_STRIPBIN = u'/usr/sbin/vss_strip'
 G_BURPCONFCLI = None
 G_BURPCONFSRV = u'/etc/burp/burp-server.conf'
 G_TMPDIR = u'/tmp/bui'
+G_COMPRESSION = None
+G_ARCHIVECACHE = u'512'
+G_STRIPWORKERS = u'0'
+G_STRIPBATCH = u'32'
+G_SLOWQUERY = u'1'
+G_SLOWLOG = None
+G_CAPTURE = None
+G_ANONYMISE = u'false'
+G_REPLAY = None
+G_REPLAYSPEED = u'1'
+G_WATCHER = u'none'
+G_WATCHINTERVAL = u'5'
 
 
 class Burp(BUIbackend):
@@ -69,6 +86,29 @@ class Burp(BUIbackend):
         '0': 'deleting'
     }
 
+    # fields tracked by the change log
+    tracked = ['name', 'state', 'phase', 'percent', 'last']
+    # change logs of the process, shared by every backend of a same server
+    changelogs = {}
+    changes_lock = threading.Lock()
+    # the versions embed the id of their change log so the versions handed
+    # out by another process are never mistaken for ours
+    changes_span = 2 ** 32
+
+    # records the slow status queries (see burpui.slowlog)
+    slowlog = None
+    # records the status queries and their answers (see burpui.capture)
+    capture = None
+    # answers the status queries from a capture file (see burpui.capture)
+    replay = None
+
+    # number of workers stripping the VSS headers, 0 for the number of CPUs
+    # (see the 'stripworkers' option)
+    strip_workers = 0
+    # number of files handed to a worker at once, one vss_strip per file (see
+    # the 'stripbatch' option)
+    strip_batch = int(G_STRIPBATCH)
+
     counters = [
         'phase',
         'Total',
@@ -113,6 +153,8 @@ class Burp(BUIbackend):
         self.burpconfcli = G_BURPCONFCLI
         self.burpconfsrv = G_BURPCONFSRV
         self.tmpdir = G_TMPDIR
+        self.compression = G_COMPRESSION
+        self.archivecache = int(G_ARCHIVECACHE)
         self.running = []
         self.defaults = {
             'bport': G_BURPPORT,
@@ -121,8 +163,26 @@ class Burp(BUIbackend):
             'stripbin': G_STRIPBIN,
             'bconfcli': G_BURPCONFCLI,
             'bconfsrv': G_BURPCONFSRV,
-            'tmpdir': G_TMPDIR
+            'tmpdir': G_TMPDIR,
+            'compression': G_COMPRESSION,
+            'archivecache': G_ARCHIVECACHE,
+            'stripworkers': G_STRIPWORKERS,
+            'stripbatch': G_STRIPBATCH,
+            'slowquery': G_SLOWQUERY,
+            'slowlog': G_SLOWLOG,
+            'capture': G_CAPTURE,
+            'anonymise': G_ANONYMISE,
+            'replay': G_REPLAY,
+            'replayspeed': G_REPLAYSPEED,
+            'watcher': G_WATCHER,
+            'watchinterval': G_WATCHINTERVAL
         }
+        slowquery = float(G_SLOWQUERY)
+        slowlog = G_SLOWLOG
+        capture = G_CAPTURE
+        anonymise = False
+        watcher = None
+        interval = float(G_WATCHINTERVAL)
         if conf:
             config = ConfigParser.ConfigParser(self.defaults)
             with codecs.open(conf, 'r', 'utf-8') as fileobj:
@@ -135,6 +195,20 @@ class Burp(BUIbackend):
                 confcli = self._safe_config_get(config.get, 'bconfcli')
                 confsrv = self._safe_config_get(config.get, 'bconfsrv')
                 tmpdir = self._safe_config_get(config.get, 'tmpdir')
+                self.compression = self._parse_compression(self._safe_config_get(config.get, 'compression'))
+                self.archivecache = self._parse_archivecache(self._safe_config_get(config.get, 'archivecache'))
+                self.strip_workers = self._parse_stripworkers(self._safe_config_get(config.get, 'stripworkers'))
+                self.strip_batch = self._parse_stripbatch(self._safe_config_get(config.get, 'stripbatch'))
+                slowquery = self._parse_slowquery(self._safe_config_get(config.get, 'slowquery'))
+                slowlog = self._safe_config_get(config.get, 'slowlog')
+                capture = self._safe_config_get(config.get, 'capture')
+                anonymise = self._safe_config_get(config.getboolean, 'anonymise', cast=bool)
+                replay = self._safe_config_get(config.get, 'replay')
+                if replay:
+                    speed = self._parse_replayspeed(self._safe_config_get(config.get, 'replayspeed'))
+                    self.replay = self._load_replay(replay, speed, 1)
+                watcher = self._parse_watcher(self._safe_config_get(config.get, 'watcher'))
+                interval = self._parse_watchinterval(self._safe_config_get(config.get, 'watchinterval'))
 
                 if tmpdir and os.path.exists(tmpdir) and not os.path.isdir(tmpdir):
                     self._logger('warning', "'%s' is not a directory", tmpdir)
@@ -187,27 +261,38 @@ class Burp(BUIbackend):
                 self.tmpdir = tmpdir
 
         self.parser = Parser(self.app, self.burpconfsrv)
+        if watcher:
+            self.parser.watch(watcher, interval)
+        self.archives = None
+        if self.archivecache:
+            self.archives = open_archives(self.tmpdir, self.archivecache * 1024 * 1024)
+        if slowquery:
+            self.slowlog = open_slowlog(slowquery, slowlog)
 
         self.family = Burp._get_inet_family(self.host)
-        self._test_burp_server_address(self.host)
+        if self.replay:
+            self.client_version = self.replay.header.get('client_version')
+            self.server_version = self.replay.header.get('server_version')
+        else:
+            self._test_burp_server_address(self.host)
 
-        try:
-            cmd = [self.burpbin, '-v']
-            self.client_version = subprocess.check_output(cmd, universal_newlines=True).rstrip().replace('burp-', '')
-        except:
-            pass
+            try:
+                cmd = [self.burpbin, '-v']
+                self.client_version = subprocess.check_output(cmd, universal_newlines=True).rstrip().replace('burp-', '')
+            except:
+                pass
 
-        try:
-            cmd = [self.burpbin, '-a', 'l']
-            if self.burpconfcli:
-                cmd += ['-c', self.burpconfcli]
-            for line in subprocess.check_output(cmd, universal_newlines=True).split('\n'):
-                result = re.search(r'^.*Server version:\s+(\d+\.\d+\.\d+)', line)
-                if result:
-                    self.server_version = result.group(1)
-                    break
-        except:
-            pass
+            try:
+                cmd = [self.burpbin, '-a', 'l']
+                if self.burpconfcli:
+                    cmd += ['-c', self.burpconfcli]
+                for line in subprocess.check_output(cmd, universal_newlines=True).split('\n'):
+                    result = re.search(r'^.*Server version:\s+(\d+\.\d+\.\d+)', line)
+                    if result:
+                        self.server_version = result.group(1)
+                        break
+            except:
+                pass
 
         self._logger('info', 'burp port: %d', self.port)
         self._logger('info', 'burp host: %s', self.host)
@@ -216,11 +301,18 @@ class Burp(BUIbackend):
         self._logger('info', 'burp conf cli: %s', self.burpconfcli)
         self._logger('info', 'burp conf srv: %s', self.burpconfsrv)
         self._logger('info', 'tmpdir: %s', self.tmpdir)
+        self._logger('info', 'archive cache: %d MB', self.archivecache)
+        self._logger('info', 'strip workers: %d (batches of %d files)', self.strip_workers, self.strip_batch)
+        self._logger('info', 'slow queries: %s (%s)', slowquery, slowlog)
+        self._logger('info', 'capture: %s (anonymise: %s)', capture, anonymise)
+        self._logger('info', 'replay: %s', self.replay.path if self.replay else None)
         try:
             # make the connection
             self.status()
         except BUIserverException:
             pass
+        if capture:
+            self.capture = self._open_capture(capture, anonymise, 1)
 
     # Utilities functions
 
@@ -278,6 +370,9 @@ class Burp(BUIbackend):
     def status(self, query='\n', agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.status`"""
         result = []
+        if self.replay:
+            return self.replay.answer(query) or []
+        start = time.time()
         try:
             qry = b''
             if not query.endswith('\n'):  # pragma: no cover
@@ -290,7 +385,11 @@ class Burp(BUIbackend):
             sock.shutdown(socket.SHUT_WR)
             fileobj = sock.makefile()
             sock.close()
-            for line in fileobj.readlines():
+            lines = fileobj.readlines()
+            received = time.time()
+            size = 0
+            for line in lines:
+                size += len(line)
                 line = line.rstrip('\n')
                 if not line:
                     continue
@@ -301,6 +400,11 @@ class Burp(BUIbackend):
                     pass
                 result.append(line)
             fileobj.close()
+            if self.slowlog:
+                now = time.time()
+                self.slowlog.record(query, size, now - start, now - received)
+            if self.capture:
+                self.capture.record(query, result, start, received - start)
             return result
         except socket.error:
             self._logger('error', 'Cannot contact burp server at %s:%s', self.host, self.port)
@@ -603,25 +707,25 @@ class Burp(BUIbackend):
     def get_counters(self, name=None, agent=None):  # pragma: no cover (hard to test, requires a running backup)
         """See :func:`burpui.misc.backend.interface.BUIbackend.get_counters`"""
         res = {}
-        if agent:
-            if not name or name not in self.running[agent]:
-                return res
-        else:
-            if not name or name not in self.running:
-                return res
+        # the answer tells us whether the client is running, so this is the
+        # only query we need
+        if not name:
+            return res
         filemap = self.status('c:{0}\n'.format(name))
         if not filemap:
             return res
+        running = False
         for line in filemap:
             # self._logger('debug', 'line: {0}'.format(line))
             reg = re.search(r'^{0}\s+(\d)\s+(\S)\s+(.+)$'.format(name), line)
             if reg and reg.group(2) == 'r' and int(reg.group(1)) == 2:
+                running = True
                 count = 0
                 for val in reg.group(3).split('\t'):
                     # self._logger('debug', '{0}: {1}'.format(self.counters[c], v))
                     if val and count > 0 and count < 15:
                         try:
-                            vals = map(int, val.split('/'))
+                            vals = [int(x) for x in val.split('/')]
                         except ValueError:
                             count += 1
                             continue
@@ -638,9 +742,11 @@ class Burp(BUIbackend):
                                 continue
                     count += 1
 
+        if not running:
+            return res
         if 'bytes' not in res:
             res['bytes'] = 0
-        if res.viewkeys() & {'start', 'estimated_bytes', 'bytes_in'}:
+        if viewkeys(res) & {'start', 'estimated_bytes', 'bytes_in'}:
             try:
                 diff = time.time() - int(res['start'])
                 byteswant = int(res['estimated_bytes'])
@@ -683,9 +789,12 @@ class Burp(BUIbackend):
             cls = self.get_all_clients()
         except BUIserverException:
             return res
+        # the states are part of the list of clients, no need to ask for
+        # every client
         for cli in cls:
-            if self.is_backup_running(cli['name']):
+            if cli['state'] not in ['idle', 'client crashed', 'server crashed']:
                 res.append(cli['name'])
+        self._observe_running(res)
         self.running = res
         self.refresh = time.time()
         return res
@@ -724,8 +833,82 @@ class Burp(BUIbackend):
                 spl = infos.split('\t')
                 cli['last'] = datetime.datetime.fromtimestamp(int(spl[len(spl) - 2])).strftime('%Y-%m-%d %H:%M:%S')
             res.append(cli)
+        self._observe_running([x['name'] for x in res if x['state'] == 'running'])
+        self._record_changes(res)
         return res
 
+    def _changes_key(self):
+        """Identifies the server in the change logs of the process"""
+        # dummy backends are not configured
+        return ('burp1', getattr(self, 'host', None), getattr(self, 'port', None))
+
+    def _changelog(self, create=True):
+        """Returns the change log of the server. The ``changes_lock`` must be
+        held by the caller."""
+        key = self._changes_key()
+        log = self.changelogs.get(key)
+        # a change log inherited from our parent process is not ours
+        if (log is None or log['pid'] != os.getpid()) and create:
+            epoch = random.SystemRandom().randint(1, 2 ** 20)
+            log = self.changelogs[key] = {
+                'pid': os.getpid(),
+                'first': epoch * self.changes_span,
+                'version': epoch * self.changes_span,
+                'clients': {},
+            }
+        return log
+
+    def _record_changes(self, clients):
+        """Update the change log with the current state of the clients.
+
+        Every client is stored with the version at which it last changed.
+        Removed clients are kept as tombstones so they can be reported too.
+        """
+        with self.changes_lock:
+            log = self._changelog()
+            changelog = log['clients']
+            seen = set()
+            for cli in clients:
+                data = dict((key, cli.get(key)) for key in self.tracked)
+                seen.add(data['name'])
+                old = changelog.get(data['name'])
+                if old and old[1] == data:
+                    continue
+                log['version'] += 1
+                changelog[data['name']] = (log['version'], data)
+            for (name, (_, data)) in list(changelog.items()):
+                if data is not None and name not in seen:
+                    log['version'] += 1
+                    changelog[name] = (log['version'], None)
+
+    def get_changes(self, since=None, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.get_changes`"""
+        with self.changes_lock:
+            log = self._changelog(False)
+        if not log or log['pid'] != os.getpid():
+            self.get_all_clients()
+        with self.changes_lock:
+            log = self._changelog()
+            # versions of another change log get the whole list
+            full = since is None or since < log['first'] or since > log['version']
+            ret = {'version': log['version'], 'full': full, 'clients': [], 'removed': []}
+            for (name, (version, data)) in iteritems(log['clients']):
+                if full:
+                    if data is not None:
+                        ret['clients'].append(data)
+                elif version > since:
+                    if data is None:
+                        ret['removed'].append(name)
+                    else:
+                        ret['clients'].append(data)
+        return ret
+
+    def get_slow_queries(self, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.get_slow_queries`"""
+        if not self.slowlog:
+            return {'threshold': 0, 'queries': []}
+        return {'threshold': self.slowlog.threshold, 'queries': self.slowlog.summary()}
+
     def get_client(self, name=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.get_client`"""
         res = []
@@ -806,8 +989,11 @@ class Burp(BUIbackend):
 
         return self.parser.server_initiated_restoration(name, backup, files, strip, force, prefix, restoreto)
 
-    def restore_files(self, name=None, backup=None, files=None, strip=None, archive='zip', password=None, agent=None):
-        """See :func:`burpui.misc.backend.interface.BUIbackend.restore_files`"""
+    def _prepare_restore(self, name=None, backup=None, files=None, strip=None, password=None):
+        """Restore the requested files in a temporary directory.
+
+        :returns: A tuple with the temporary directory and/or an error message
+        """
         if not name or not backup or not files:
             return None, 'At least one argument is missing'
         if not self.stripbin:
@@ -815,11 +1001,11 @@ class Burp(BUIbackend):
         if not self.burpbin:
             return None, 'Missing \'burp\' binary'
         flist = json.loads(files)
+        if 'restore' not in flist:
+            return None, 'Wrong call'
         if password:
             tmphandler, tmpfile = tempfile.mkstemp()
         tmpdir = tempfile.mkdtemp(prefix=self.tmpdir)
-        if 'restore' not in flist:
-            return None, 'Wrong call'
         if os.path.isdir(tmpdir):
             shutil.rmtree(tmpdir)
         full_reg = u''
@@ -834,6 +1020,8 @@ class Burp(BUIbackend):
         cmd = [self.burpbin, '-C', quote(name), '-a', 'r', '-b', quote(str(backup)), '-r', full_reg.rstrip('|'), '-d', tmpdir]
         if password:
             if not self.burpconfcli:
+                os.close(tmphandler)
+                os.remove(tmpfile)
                 return None, 'No client configuration file specified'
             tmpdesc = os.fdopen(tmphandler, 'w+')
             with open(self.burpconfcli) as fileobj:
@@ -850,9 +1038,10 @@ class Burp(BUIbackend):
             cmd.append('-s')
             cmd.append(strip)
         self._logger('debug', cmd)
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        out, _ = proc.communicate()
-        status = proc.wait()
+        with tracer.span('subprocess', 'burp -a r'):
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            out, _ = proc.communicate()
+            status = proc.wait()
         if password:
             os.remove(tmpfile)
         self._logger('debug', out)
@@ -866,48 +1055,271 @@ class Burp(BUIbackend):
         # a return code of 2 means there were some warnings during restoration
         # so we can assume the restoration was successful anyway
         if status not in [0, 2]:
+            shutil.rmtree(tmpdir, ignore_errors=True)
             return None, out
 
+        return tmpdir, None
+
+    def _parse_compression(self, value):
+        """Validate the compression level of the restoration archives"""
+        if value is None or value == '':
+            return None
+        try:
+            level = int(value)
+            if level < 0 or level > 9:
+                raise ValueError(value)
+        except ValueError:
+            self._logger('warning', "Invalid value for 'compression'. Must be between 0 and 9. Using the default level")
+            return None
+        return level
+
+    def _parse_slowquery(self, value):
+        """Validate the slow queries threshold in seconds"""
+        try:
+            threshold = float(value)
+            if threshold < 0:
+                raise ValueError(value)
+        except (TypeError, ValueError):
+            self._logger('warning', "Invalid value for 'slowquery'. Must be a positive number of seconds. Using '%s'", G_SLOWQUERY)
+            return float(G_SLOWQUERY)
+        return threshold
+
+    def _parse_replayspeed(self, value):
+        """Validate the speed factor of the replay"""
+        try:
+            speed = float(value)
+            if speed < 0:
+                raise ValueError(value)
+        except (TypeError, ValueError):
+            self._logger('warning', "Invalid value for 'replayspeed'. Must be a positive number. Using '%s'", G_REPLAYSPEED)
+            return float(G_REPLAYSPEED)
+        return speed
+
+    def _parse_watcher(self, value):
+        """Validate the method used to watch the clientconfdir"""
+        value = (value or G_WATCHER).lower()
+        if value not in ['none', 'auto', 'inotify', 'poll']:
+            self._logger('warning', "Invalid value for 'watcher'. Must be one of 'none', 'auto', 'inotify' or 'poll'. Using '%s'", G_WATCHER)
+            value = G_WATCHER
+        return None if value == 'none' else value
+
+    def _parse_watchinterval(self, value):
+        """Validate the polling interval of the watcher"""
+        try:
+            interval = float(value)
+            if interval <= 0:
+                raise ValueError(value)
+        except (TypeError, ValueError):
+            self._logger('warning', "Invalid value for 'watchinterval'. Must be a positive number. Using '%s'", G_WATCHINTERVAL)
+            return float(G_WATCHINTERVAL)
+        return interval
+
+    def _load_replay(self, path, speed, version):
+        """Returns the replay of a capture file recorded by the given
+        backend version"""
+        try:
+            replay = load_replay(path, speed)
+        except (IOError, OSError, ValueError) as exc:
+            raise Exception("Unable to replay '{}': {}".format(path, str(exc)))
+        if replay.backend != version:
+            raise Exception("'{}' was captured by the burp-{} backend".format(path, replay.backend))
+        return replay
+
+    def _open_capture(self, path, anonymise, version):
+        """Returns the capture recording the status queries"""
+        try:
+            return open_capture(
+                path,
+                version,
+                anonymise,
+                {'client_version': self.client_version, 'server_version': self.server_version}
+            )
+        except (IOError, OSError) as exc:
+            self._logger('error', "Unable to capture the status queries in '%s': %s", path, str(exc))
+        return None
+
+    def _parse_archivecache(self, value):
+        """Validate the size in MB of the restoration archives cache"""
+        try:
+            size = int(value)
+            if size < 0:
+                raise ValueError(value)
+        except (TypeError, ValueError):
+            self._logger('warning', "Invalid value for 'archivecache'. Must be a positive number of MB. Using '%s'", G_ARCHIVECACHE)
+            return int(G_ARCHIVECACHE)
+        return size
+
+    def _parse_stripworkers(self, value):
+        """Validate the number of workers stripping the VSS headers"""
+        try:
+            workers = int(value)
+            if workers < 0:
+                raise ValueError(value)
+        except (TypeError, ValueError):
+            self._logger('warning', "Invalid value for 'stripworkers'. Must be a positive number. Using '%s'", G_STRIPWORKERS)
+            return int(G_STRIPWORKERS)
+        return workers
+
+    def _parse_stripbatch(self, value):
+        """Validate the number of files handed to a stripping worker at once"""
+        try:
+            batch = int(value)
+            if batch <= 0:
+                raise ValueError(value)
+        except (TypeError, ValueError):
+            self._logger('warning', "Invalid value for 'stripbatch'. Must be a strictly positive number. Using '%s'", G_STRIPBATCH)
+            return int(G_STRIPBATCH)
+        return batch
+
+    def _strip_file(self, path):
+        """Strip the VSS headers of a restored file.
+
+        :returns: True if the file has been stripped successfully
+        """
+        self._logger('debug', "stripping file: %s", path)
+        shutil.move(path, path + '.tmp')
+        with tracer.span('subprocess', 'vss_strip'):
+            status = subprocess.call([self.stripbin, '-i', path + '.tmp', '-o', path])
+        if status != 0:
+            if os.path.exists(path):
+                os.remove(path)
+            shutil.move(path + '.tmp', path)
+            return False
+        os.remove(path + '.tmp')
+        return True
+
+    def _restored_files(self, tmpdir):
+        """Walk through the restored files and strip the VSS headers if needed.
+
+        The first file tells us whether the files embed VSS headers. If they
+        do, the files are stripped in parallel by a pool of workers. Every
+        file still needs its own ``vss_strip`` process: the batches only
+        reduce the hand-offs between the workers and this generator, so the
+        files are returned as soon as their batch is done.
+
+        :returns: A generator of tuples with the path of the file and its name
+                  within the archive
+        """
         zip_dir = tmpdir.rstrip(os.sep)
-        zip_file = zip_dir + '.zip'
-        if os.path.isfile(zip_file):
-            os.remove(zip_file)
         zip_len = len(zip_dir) + 1
-        stripping = True
-        test_strip = True
-        with BUIcompress(zip_file, archive) as zfh:
-            for dirname, _, files in os.walk(zip_dir):
-                for filename in files:
-                    path = os.path.join(dirname, filename)
-                    # try to detect if the file contains vss headers
-                    if test_strip:
-                        test_strip = False
-                        otp = None
-                        try:
-                            otp = subprocess.check_output([self.stripbin, '-p', '-i', path])
-                        except subprocess.CalledProcessError as exc:
-                            self._logger('debug', "Stripping failed on '{}': {}".format(path, str(exc)))
-                        if not otp:
-                            stripping = False
-
-                    if stripping and os.path.isfile(path):
-                        self._logger('debug', "stripping file: %s", path)
-                        shutil.move(path, path + '.tmp')
-                        status = subprocess.call([self.stripbin, '-i', path + '.tmp', '-o', path])
-                        if status != 0:
-                            os.remove(path)
-                            shutil.move(path + '.tmp', path)
-                            stripping = False
-                            self._logger('debug', "Disable stripping since this file does not seem to embed VSS headers")
-                        else:
-                            os.remove(path + '.tmp')
+        paths = []
+        for dirname, _, files in os.walk(zip_dir):
+            for filename in files:
+                paths.append(os.path.join(dirname, filename))
+
+        if not paths:
+            return
+
+        # try to detect if the file contains vss headers
+        otp = None
+        try:
+            with tracer.span('subprocess', 'vss_strip -p'):
+                otp = subprocess.check_output([self.stripbin, '-p', '-i', paths[0]])
+        except subprocess.CalledProcessError as exc:
+            self._logger('debug', "Stripping failed on '{}': {}".format(paths[0], str(exc)))
+        if not otp:
+            for path in paths:
+                yield path, path[zip_len:]
+            return
 
-                    entry = path[zip_len:]
-                    zfh.append(path, entry)
+        # the workers mostly wait for vss_strip so threads are enough
+        from multiprocessing import cpu_count
+        from multiprocessing.pool import ThreadPool
+
+        state = {'stripping': True}
+
+        def strip_batch(batch):
+            for path in batch:
+                if not state['stripping'] or not os.path.isfile(path):
+                    continue
+                if not self._strip_file(path):
+                    state['stripping'] = False
+                    self._logger('debug', "Disable stripping since this file does not seem to embed VSS headers")
+            return batch
+
+        workers = self.strip_workers or cpu_count()
+        batches = [paths[i:i + self.strip_batch] for i in range(0, len(paths), self.strip_batch)]
+        pool = ThreadPool(min(workers, len(batches)))
+        try:
+            for batch in pool.imap_unordered(strip_batch, batches):
+                for path in batch:
+                    yield path, path[zip_len:]
+        finally:
+            pool.terminate()
+            # the restored files are removed once we are done, make sure no
+            # worker still uses them
+            pool.join()
+
+    def restore_files(self, name=None, backup=None, files=None, strip=None, archive='zip', password=None, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.restore_files`"""
+        stream, err = self.restore_stream(name, backup, files, strip, archive, password)
+        if err:
+            return None, err
+
+        handle, zip_file = tempfile.mkstemp(prefix=self.tmpdir)
+        with os.fdopen(handle, 'wb') as fileobj:
+            for chunk in stream:
+                fileobj.write(chunk)
 
-        shutil.rmtree(tmpdir)
         return zip_file, None
 
+    def restore_stream(self, name=None, backup=None, files=None, strip=None, archive='zip', password=None, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.restore_stream`"""
+        if archive not in BUIstream.formats:
+            return None, 'Unsupported archive format: {}'.format(archive)
+        entry = None
+        # archives of encrypted backups are never kept
+        if self.archives and not password:
+            entry, owner = self.archives.get(self.archives.key(name, backup, files, strip, archive))
+            if not owner:
+                self._logger('debug', 'Serving the restoration of %s (%s) from the archives cache', name, backup)
+                return BUIprogress(entry.follow), None
+        try:
+            tmpdir, err = self._prepare_restore(name, backup, files, strip, password)
+        except Exception:
+            if entry:
+                self.archives.discard(entry)
+            raise
+        if err:
+            if entry:
+                self.archives.discard(entry)
+            return None, err
+
+        state = {'complete': False}
+
+        def stream(progress):
+            try:
+                arch = BUIstream(archive, level=self.compression)
+                for path, arcname in self._restored_files(tmpdir):
+                    for chunk in arch.add(path, arcname):
+                        if entry:
+                            entry.write(chunk)
+                        yield chunk
+                    # the file is now part of the archive, free some space
+                    os.remove(path)
+                    progress.files += 1
+                    if entry:
+                        entry.files = progress.files
+                for chunk in arch.close():
+                    if entry:
+                        entry.write(chunk)
+                    yield chunk
+                state['complete'] = True
+                if entry:
+                    self.archives.commit(entry)
+            except Exception as e:
+                self._logger('error', 'Restoration stream interrupted: %s', str(e))
+                raise
+
+        def cleanup():
+            # runs even if the stream is closed before being read (cancelled
+            # job, client gone) so the restored files are never left behind
+            if entry and not state['complete']:
+                self.archives.discard(entry)
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        return BUIprogress(stream, cleanup), None
+
     def read_conf_cli(self, client=None, conf=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.read_conf_cli`"""
         if not self.parser:
@@ -930,6 +1342,12 @@ class Burp(BUIbackend):
             pass
         return self.parser.store_client_conf(data, client, conf)
 
+    def patch_clients_conf(self, pattern=None, patch=None, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.patch_clients_conf`"""
+        if not self.parser:
+            return []
+        return self.parser.patch_clients(pattern, patch)
+
     def store_conf_srv(self, data, conf=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.store_conf_srv`"""
         if not self.parser:
@@ -952,9 +1370,9 @@ class Burp(BUIbackend):
             return [2, "No client provided"]
         return self.parser.remove_client(client)
 
-    def clients_list(self, agent=None):
+    def clients_list(self, prefix=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.clients_list`"""
-        return self.parser.list_clients()
+        return self.parser.list_clients(prefix)
 
     def get_parser_attr(self, attr=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.get_parser_attr`"""
@@ -7,13 +7,16 @@ import subprocess
 import codecs
 import sys
 import json
+import threading
 
-from six import iteritems
+from six import iteritems, viewkeys
 from select import select
 
 from .burp1 import Burp as Burp1
 from ..parser.burp2 import Parser
-from ...utils import human_readable as _hr
+from ...utils import human_readable as _hr, open_archives
+from ...tracing import tracer
+from ...slowlog import open_slowlog
 from ...exceptions import BUIserverException
 from ..._compat import ConfigParser
 
@@ -28,6 +31,18 @@ g_burpconfcli = u'/etc/burp/burp.conf'
 g_burpconfsrv = u'/etc/burp/burp-server.conf'
 g_tmpdir = u'/tmp/bui'
 g_timeout = u'5'
+g_compression = None
+g_archivecache = u'512'
+g_stripworkers = u'0'
+g_stripbatch = u'32'
+g_slowquery = u'1'
+g_slowlog = None
+g_capture = None
+g_anonymise = u'false'
+g_replay = None
+g_replayspeed = u'1'
+g_watcher = u'none'
+g_watchinterval = u'5'
 
 
 # Some functions are the same as in Burp1 backend
@@ -50,6 +65,8 @@ class Burp(Burp1):
         global g_burpbin, g_stripbin, g_burpconfcli, g_burpconfsrv, g_tmpdir, \
             g_timeout, BURP_MINIMAL_VERSION
         self.proc = None
+        # the burp client process answers one query at a time
+        self.proc_lock = threading.Lock()
         self.app = None
         self.client_version = None
         self.server_version = None
@@ -63,14 +80,35 @@ class Burp(Burp1):
         self.stripbin = g_stripbin
         self.burpconfcli = g_burpconfcli
         self.burpconfsrv = g_burpconfsrv
+        self.compression = g_compression
+        self.archivecache = int(g_archivecache)
+        self.tmpdir = g_tmpdir
         self.defaults = {
             'burpbin': g_burpbin,
             'stripbin': g_stripbin,
             'bconfcli': g_burpconfcli,
             'bconfsrv': g_burpconfsrv,
             'timeout': g_timeout,
-            'tmpdir': g_tmpdir
+            'tmpdir': g_tmpdir,
+            'compression': g_compression,
+            'archivecache': g_archivecache,
+            'stripworkers': g_stripworkers,
+            'stripbatch': g_stripbatch,
+            'slowquery': g_slowquery,
+            'slowlog': g_slowlog,
+            'capture': g_capture,
+            'anonymise': g_anonymise,
+            'replay': g_replay,
+            'replayspeed': g_replayspeed,
+            'watcher': g_watcher,
+            'watchinterval': g_watchinterval
         }
+        slowquery = float(g_slowquery)
+        slowlog = g_slowlog
+        capture = g_capture
+        anonymise = False
+        watcher = None
+        interval = float(g_watchinterval)
         self.running = []
         version = ''
         if conf:
@@ -84,6 +122,20 @@ class Burp(Burp1):
                     confsrv = self._safe_config_get(config.get, 'bconfsrv', sect='Burp2')
                     self.timeout = self._safe_config_get(config.getint, 'timeout', sect='Burp2', cast=int)
                     tmpdir = self._safe_config_get(config.get, 'tmpdir')
+                    self.compression = self._parse_compression(self._safe_config_get(config.get, 'compression', sect='Burp2'))
+                    self.archivecache = self._parse_archivecache(self._safe_config_get(config.get, 'archivecache', sect='Burp2'))
+                    self.strip_workers = self._parse_stripworkers(self._safe_config_get(config.get, 'stripworkers', sect='Burp2'))
+                    self.strip_batch = self._parse_stripbatch(self._safe_config_get(config.get, 'stripbatch', sect='Burp2'))
+                    slowquery = self._parse_slowquery(self._safe_config_get(config.get, 'slowquery', sect='Burp2'))
+                    slowlog = self._safe_config_get(config.get, 'slowlog', sect='Burp2')
+                    capture = self._safe_config_get(config.get, 'capture', sect='Burp2')
+                    anonymise = self._safe_config_get(config.getboolean, 'anonymise', sect='Burp2', cast=bool)
+                    replay = self._safe_config_get(config.get, 'replay', sect='Burp2')
+                    if replay:
+                        speed = self._parse_replayspeed(self._safe_config_get(config.get, 'replayspeed', sect='Burp2'))
+                        self.replay = self._load_replay(replay, speed, 2)
+                    watcher = self._parse_watcher(self._safe_config_get(config.get, 'watcher', sect='Burp2'))
+                    interval = self._parse_watchinterval(self._safe_config_get(config.get, 'watchinterval', sect='Burp2'))
 
                     if tmpdir and os.path.exists(tmpdir) and not os.path.isdir(tmpdir):
                         self._logger('warning', "'%s' is not a directory", tmpdir)
@@ -121,7 +173,7 @@ class Burp(Burp1):
                         self._logger('warning', "'%s' does not exist or is not executable. Fallback to '%s'", bbin, g_burpbin)
                         bbin = g_burpbin
 
-                    if bbin and (not os.path.isfile(bbin) or not os.access(bbin, os.X_OK)):
+                    if bbin and (not os.path.isfile(bbin) or not os.access(bbin, os.X_OK)) and not self.replay:
                         self._logger('error', "Ooops, '%s' not found or is not executable", bbin)
                         # The burp binary is mandatory for this backend
                         raise Exception('This backend *CAN NOT* work without a burp binary')
@@ -136,30 +188,49 @@ class Burp(Burp1):
                 except ConfigParser.NoSectionError as e:
                     self._logger('warning', str(e))
 
-        # check the burp version because this backend only supports clients newer than BURP_MINIMAL_VERSION
-        try:
-            cmd = [self.burpbin, '-v']
-            version = subprocess.check_output(cmd, universal_newlines=True).rstrip()
-            if version < BURP_MINIMAL_VERSION:
-                raise Exception('Your burp version ({}) does not fit the minimal requirements: {}'.format(version, BURP_MINIMAL_VERSION))
-        except subprocess.CalledProcessError as e:
-            raise Exception('Unable to determine your burp version: {}'.format(str(e)))
+        if self.replay:
+            version = self.replay.header.get('client_version') or ''
+            self.server_version = self.replay.header.get('server_version')
+        else:
+            # check the burp version because this backend only supports clients newer than BURP_MINIMAL_VERSION
+            try:
+                cmd = [self.burpbin, '-v']
+                version = subprocess.check_output(cmd, universal_newlines=True).rstrip()
+                if version < BURP_MINIMAL_VERSION:
+                    raise Exception('Your burp version ({}) does not fit the minimal requirements: {}'.format(version, BURP_MINIMAL_VERSION))
+            except subprocess.CalledProcessError as e:
+                raise Exception('Unable to determine your burp version: {}'.format(str(e)))
 
         self.client_version = version.replace('burp-', '')
 
         self.parser = Parser(self.app, self.burpconfsrv)
+        if watcher:
+            self.parser.watch(watcher, interval)
+        self.archives = None
+        if self.archivecache:
+            self.archives = open_archives(self.tmpdir, self.archivecache * 1024 * 1024)
+        if slowquery:
+            self.slowlog = open_slowlog(slowquery, slowlog)
 
         self._logger('info', 'burp binary: {}'.format(self.burpbin))
         self._logger('info', 'strip binary: {}'.format(self.stripbin))
         self._logger('info', 'burp conf cli: {}'.format(self.burpconfcli))
         self._logger('info', 'burp conf srv: {}'.format(self.burpconfsrv))
         self._logger('info', 'command timeout: {}'.format(self.timeout))
+        self._logger('info', 'archive cache: {} MB'.format(self.archivecache))
+        self._logger('info', 'strip workers: {} (batches of {} files)'.format(self.strip_workers, self.strip_batch))
+        self._logger('info', 'slow queries: {} ({})'.format(slowquery, slowlog))
         self._logger('info', 'burp version: {}'.format(self.client_version))
+        self._logger('info', 'capture: {} (anonymise: {})'.format(capture, anonymise))
+        self._logger('info', 'replay: {}'.format(self.replay.path if self.replay else None))
         try:
             # make the connection
             self.status()
         except BUIserverException:
             pass
+        # the server version is only known once the connection is made
+        if capture:
+            self.capture = self._open_capture(capture, anonymise, 2)
 
     def __exit__(self, type, value, traceback):
         """try not to leave child process server side"""
@@ -189,9 +260,10 @@ class Burp(Burp1):
     def _spawn_burp(self):
         """Launch the burp client process"""
         cmd = [self.burpbin, '-c', self.burpconfcli, '-a', 'm']
-        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=False, universal_newlines=True, bufsize=0)
-        # wait a little bit in case the process dies on a network error
-        time.sleep(0.5)
+        with tracer.span('subprocess', 'burp -a m'):
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=False, universal_newlines=True, bufsize=0)
+            # wait a little bit in case the process dies on a network error
+            time.sleep(0.5)
         if not self._proc_is_alive():
             raise Exception('Unable to spawn burp process')
         _, w, _ = select([], [self.proc.stdin], [], self.timeout)
@@ -263,8 +335,13 @@ class Burp(Burp1):
 
         return hr
 
-    def _read_proc_stdout(self):
-        """reads the burp process stdout and returns a document or None"""
+    def _read_proc_stdout(self, stats=None):
+        """reads the burp process stdout and returns a document or None
+
+        :param stats: If provided, receives the size of the document and the
+                      time spent parsing it
+        :type stats: dict
+        """
         doc = u''
         js = None
         while True:
@@ -275,7 +352,12 @@ class Burp(Burp1):
                 if self.proc.stdout not in r:
                     raise TimeoutError('Read operation timed out')
                 doc += self.proc.stdout.readline().rstrip('\n')
+                parsing = time.time()
                 js = self._is_valid_json(doc)
+                if stats is not None:
+                    stats['parse'] += time.time() - parsing
+                    stats['bytes'] = len(doc)
+                    stats['doc'] = doc
                 # if the string is a valid json and looks like a logline, we
                 # simply ignore it
                 if js and self._is_ignored(js):
@@ -292,19 +374,28 @@ class Burp(Burp1):
 
     def status(self, query='c:\n', agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.status`"""
+        if self.replay:
+            return self._replay_status(query)
         try:
             if not query.endswith('\n'):
                 q = '{0}\n'.format(query)
             else:
                 q = query
-            if not self._proc_is_alive():
-                self._spawn_burp()
-
-            _, w, _ = select([], [self.proc.stdin], [], self.timeout)
-            if self.proc.stdin not in w:
-                raise TimeoutError('Write operation timed out')
-            self.proc.stdin.write(q)
-            js = self._read_proc_stdout()
+            with self.proc_lock:
+                start = time.time()
+                if not self._proc_is_alive():
+                    self._spawn_burp()
+
+                _, w, _ = select([], [self.proc.stdin], [], self.timeout)
+                if self.proc.stdin not in w:
+                    raise TimeoutError('Write operation timed out')
+                self.proc.stdin.write(q)
+                stats = {'bytes': 0, 'parse': 0}
+                js = self._read_proc_stdout(stats)
+            if self.slowlog:
+                self.slowlog.record(q, stats['bytes'], time.time() - start, stats['parse'])
+            if self.capture and js:
+                self.capture.record(q, stats['doc'], start, time.time() - start)
             if self._is_warning(js):
                 self._logger('warning', js['warning'])
                 return None
@@ -320,6 +411,18 @@ class Burp(Burp1):
             self._logger('error', msg)
             raise BUIserverException(msg)
 
+    def _replay_status(self, query):
+        """Answers a status query from the capture file"""
+        doc = self.replay.answer(query)
+        js = self._is_valid_json(doc) if doc else None
+        if not js:
+            self._logger('warning', 'No answer captured for {}'.format(query.strip()))
+            return None
+        if self._is_warning(js):
+            self._logger('warning', js['warning'])
+            return None
+        return js
+
     def get_backup_logs(self, number, client, forward=False, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.get_backup_logs`"""
         if not client or not number:
@@ -463,12 +566,10 @@ class Burp(Burp1):
     def get_counters(self, name=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.get_counters`"""
         r = {}
-        if agent:
-            if not name or name not in self.running[agent]:
-                return r
-        else:
-            if not name or name not in self.running:
-                return r
+        # the answer tells us whether the client is running, so this is the
+        # only query we need
+        if not name:
+            return r
         clients = self.status('c:{0}\n'.format(name))
         # check the status returned something
         if not clients:
@@ -517,7 +618,7 @@ class Burp(Burp1):
 
         if 'bytes' not in r:
             r['bytes'] = 0
-        if r.viewkeys() & {'time_start', 'estimated_bytes', 'bytes'}:
+        if viewkeys(r) & {'time_start', 'estimated_bytes', 'bytes'}:
             try:
                 diff = time.time() - int(r['time_start'])
                 byteswant = int(r['estimated_bytes'])
@@ -615,8 +716,14 @@ class Burp(Burp1):
                 infos = infos[0]
                 c['last'] = datetime.datetime.fromtimestamp(infos['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
             j.append(c)
+        self._observe_running([x['name'] for x in j if x['state'] == 'running'])
+        self._record_changes(j)
         return j
 
+    def _changes_key(self):
+        """See :func:`burpui.misc.backend.burp1.Burp._changes_key`"""
+        return ('burp2', getattr(self, 'burpbin', None), getattr(self, 'burpconfcli', None))
+
     def get_client(self, name=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.get_client`"""
         r = []
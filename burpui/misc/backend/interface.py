@@ -89,6 +89,43 @@ class BUIbackend(BUIlogging):
         """
         self.logger = logger
 
+    def add_listener(self, callback):
+        """The :func:`burpui.misc.backend.interface.BUIbackend.add_listener`
+        function registers a callback that is called whenever the backend
+        observes a backup starting or finishing.
+
+        :param callback: Function called with the list of clients whose backup
+                         started, the list of clients whose backup finished and
+                         the agent name
+        :type callback: callable
+        """
+        if not hasattr(self, 'listeners'):
+            self.listeners = []
+        self.listeners.append(callback)
+
+    def _observe_running(self, running, agent=None):
+        """Compare the running clients with the ones observed previously and
+        notify the listeners if something changed.
+
+        :param running: List of the clients currently running a backup
+        :type running: list
+
+        :param agent: What server we are observing when in multi-agent mode
+        :type agent: str
+        """
+        if not hasattr(self, 'observed'):
+            self.observed = {}
+        running = set(running or [])
+        previous = self.observed.get(agent)
+        self.observed[agent] = running
+        if previous is None or previous == running:
+            return
+        started = list(running - previous)
+        finished = list(previous - running)
+        self._logger('debug', 'backups started: %s, finished: %s', started, finished)
+        for callback in getattr(self, 'listeners', []):
+            callback(started, finished, agent)
+
     @abstractmethod
     def status(self, query='\n', agent=None):
         """The :func:`burpui.misc.backend.interface.BUIbackend.status` method is
@@ -344,6 +381,75 @@ class BUIbackend(BUIlogging):
         """
         raise NotImplementedError("Sorry, the current Backend does not implement this method!")  # pragma: no cover
 
+    @abstractmethod
+    def get_changes(self, since=None, agent=None):
+        """The :func:`burpui.misc.backend.interface.BUIbackend.get_changes`
+        function returns the clients whose state, phase, percentage or last
+        backup changed since a given version.
+
+        The change log is updated every time
+        :func:`burpui.misc.backend.interface.BUIbackend.get_all_clients` is
+        called.
+
+        :param since: Version returned by a previous call. If it is missing
+                      or unknown, the whole list of clients is returned
+        :type since: int
+
+        :param agent: What server to ask (only in multi-agent mode)
+        :type agent: str
+
+        :returns: A dict with the current version, the changed clients and
+                  the removed ones
+
+        Example::
+
+            {
+                "version": 1452158132042,
+                "full": false,
+                "clients": [
+                    {
+                        "last": "now",
+                        "name": "client1",
+                        "percent": 12,
+                        "phase": "backup",
+                        "state": "running"
+                    }
+                ],
+                "removed": []
+            }
+        """
+        raise NotImplementedError("Sorry, the current Backend does not implement this method!")  # pragma: no cover
+
+    @abstractmethod
+    def get_slow_queries(self, agent=None):
+        """The :func:`burpui.misc.backend.interface.BUIbackend.get_slow_queries`
+        function returns the status queries that took longer than the
+        ``slowquery`` threshold, aggregated per query shape.
+
+        :param agent: What server to ask (only in multi-agent mode)
+        :type agent: str
+
+        :returns: A dict with the threshold and the slow queries, the most
+                  expensive first
+
+        Example::
+
+            {
+                "threshold": 1.0,
+                "queries": [
+                    {
+                        "shape": "c:*:b:*:p:*",
+                        "count": 12,
+                        "seconds": 31.337,
+                        "max": 4.2,
+                        "bytes": 123456789,
+                        "last": "c:client1:b:42:p:/home"
+                    }
+                ]
+            }
+        """
+        raise NotImplementedError("Sorry, the current Backend does not implement this method!")  # pragma: no cover
+
     @abstractmethod
     def get_client(self, name=None, agent=None):
         """The :func:`burpui.misc.backend.interface.BUIbackend.get_client`
@@ -435,8 +541,8 @@ class BUIbackend(BUIlogging):
                       files
         :type strip: int
 
-        :param archive: Format of the generated archive (may be zip, tar.gz or
-                        tar.bz2)
+        :param archive: Format of the generated archive (may be zip,
+                        zip-stored, tar, tar.gz or tar.bz2)
         :type archive: str
 
         :param password: Password for encrypted backups
@@ -449,6 +555,21 @@ class BUIbackend(BUIlogging):
         """
         raise NotImplementedError("Sorry, the current Backend does not implement this method!")  # pragma: no cover
 
+    @abstractmethod
+    def restore_stream(self, name=None, backup=None, files=None, strip=None, archive='zip', password=None, agent=None):
+        """The :func:`burpui.misc.backend.interface.BUIbackend.restore_stream`
+        function performs a restoration like
+        :func:`burpui.misc.backend.interface.BUIbackend.restore_files` but the
+        archive is generated on the fly instead of being written on disk.
+
+        The arguments are the same as
+        :func:`burpui.misc.backend.interface.BUIbackend.restore_files`.
+
+        :returns: A tuple with a generator of chunks of the archive and/or an
+                  error message
+        """
+        raise NotImplementedError("Sorry, the current Backend does not implement this method!")  # pragma: no cover
+
     @abstractmethod
     def read_conf_srv(self, conf=None, agent=None):
         """The :func:`burpui.misc.backend.interface.BUIbackend.read_conf_srv`
@@ -583,6 +704,37 @@ class BUIbackend(BUIlogging):
         """
         raise NotImplementedError("Sorry, the current Backend does not implement this method!")  # pragma: no cover
 
+    @abstractmethod
+    def patch_clients_conf(self, pattern=None, patch=None, agent=None):
+        """The :func:`burpui.misc.backend.interface.BUIbackend.patch_clients_conf`
+        function is used to apply the same changes to the configuration of
+        several clients at once. The patch is validated once, then every
+        configuration file is replaced atomically.
+
+        :param pattern: Shell-style pattern matching the name of the clients
+        :type pattern: str
+
+        :param patch: The settings to change: a value (or a list of values for
+                      the multi-valued settings) per key, None removes the key
+        :type patch: dict
+
+        :param agent: What server to ask (only in multi-agent mode)
+        :type agent: str
+
+        :returns: The notification of every matching client
+
+        :raises: :class:`burpui.exceptions.BUIserverException` if the patch is
+                 invalid
+
+        Example::
+
+            [
+                {"name": "client1", "notif": [0, "'client1' successfully updated"]},
+                {"name": "client2", "notif": [3, "'client2' is already up to date"]}
+            ]
+        """
+        raise NotImplementedError("Sorry, the current Backend does not implement this method!")  # pragma: no cover
+
     @abstractmethod
     def get_parser_attr(self, attr=None, agent=None):
         """The :func:`burpui.misc.backend.interface.BUIbackend.get_parser_attr`
@@ -621,11 +773,17 @@ class BUIbackend(BUIlogging):
         raise NotImplementedError("Sorry, the current Backend does not implement this method!")  # pragma: no cover
 
     @abstractmethod
-    def clients_list(self, agent=None):
+    def clients_list(self, prefix=None, agent=None):
         """The :func:`burpui.misc.backend.interface.BUIbackend.clients_list`
         function is used to retrieve a list of clients with their configuration
         file.
 
+        :param prefix: Only return the clients whose name starts with prefix
+        :type prefix: str
+
+        :param agent: What server to ask (only in multi-agent mode)
+        :type agent: str
+
         :returns: A list of clients with their configuration file
         """
         raise NotImplementedError("Sorry, the current Backend does not implement this method!")  # pragma: no cover
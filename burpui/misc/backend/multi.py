@@ -1,18 +1,29 @@
 # -*- coding: utf8 -*-
 import re
+import select
 import socket
 import errno
 import time
 import json
 import struct
+import threading
 import traceback
 
+from collections import OrderedDict
 from six import iteritems
 
 from .interface import BUIbackend
+from ...tracing import tracer
+from ...metrics import registry
+from ...profiling import profiler
+from ...utils import BUIprogress, FRAME_PROGRESS
 from ...exceptions import BUIserverException
 from ..._compat import IS_GUNICORN, ConfigParser, local, pickle
 
+g_failures = u'3'
+g_retry = u'30'
+g_probe = u'30'
+
 
 class Burp(BUIbackend):
     """The :class:`burpui.misc.backend.multi.Burp` class provides a consistent
@@ -41,7 +52,9 @@ class Burp(BUIbackend):
         self.app.config['SERVERS'] = []
         self.running = {}
         if conf:
-            config = ConfigParser.ConfigParser()
+            config = ConfigParser.ConfigParser({
+                'failures': g_failures, 'retry': g_retry, 'probe': g_probe
+            })
             with open(conf) as fp:
                 config.readfp(fp)
                 for sec in config.sections():
@@ -53,13 +66,57 @@ class Burp(BUIbackend):
                         password = self._safe_config_get(config.get, 'password', sec)
                         ssl = self._safe_config_get(config.getboolean, 'ssl', sec, cast=bool)
                         timeout = self._safe_config_get(config.getint, 'timeout', sec, cast=int)
+                        failures = self._safe_config_get(config.getint, 'failures', sec, cast=int)
+                        retry = self._safe_config_get(config.getint, 'retry', sec, cast=int)
+                        probe = self._safe_config_get(config.getint, 'probe', sec, cast=int)
 
-                        self.servers[r.group(1)] = NClient(self.app, host, port, password, ssl, timeout)
+                        health = AgentHealth(failures, retry, probe)
+                        self.servers[r.group(1)] = NClient(self.app, host, port, password, ssl, timeout, health, r.group(1))
 
         self.app.logger.debug(self.servers)
         for (key, serv) in iteritems(self.servers):
             self.app.config['SERVERS'].append(key)
 
+        self._start_health_probe()
+
+    def _start_health_probe(self):
+        """Start a background thread that regularly checks the agents so their
+        health is known before any request has to wait for them"""
+        intervals = [s.health.probe for s in self.servers.values() if s.health.probe > 0]
+        if not intervals:
+            return
+        delay = min(intervals)
+
+        def probe_loop():
+            while True:
+                time.sleep(delay)
+                for (name, serv) in iteritems(self.servers):
+                    if not serv.health.need_probe():
+                        continue
+                    try:
+                        serv.probe()
+                    except Exception as e:
+                        self._logger('debug', 'Unable to probe agent {}: {}'.format(name, str(e)))
+
+        thread = threading.Thread(target=probe_loop, name='agents-health')
+        thread.daemon = True
+        thread.start()
+
+    def get_health(self, agent=None):
+        """Returns the health of the agents as tracked by their circuit
+        breaker.
+
+        :param agent: Which agent to look at. If None, every agent is returned
+        :type agent: str
+
+        :returns: A dict as returned by
+                  :func:`burpui.misc.backend.multi.AgentHealth.to_dict` or a
+                  dict of those indexed by agent name
+        """
+        if agent:
+            return self.servers[agent].health.to_dict()
+        return dict((k, s.health.to_dict()) for (k, s) in iteritems(self.servers))
+
     def status(self, query='\n', agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.status`"""
         return self.servers[agent].status(query)
@@ -139,9 +196,12 @@ class Burp(BUIbackend):
         r = []
         if agent:
             r = self.servers[agent].is_one_backup_running(agent)
+            self._observe_running(r, agent)
             self.running[agent] = r
         else:
             r = self._backup_running_parallel()
+            for (a, l) in iteritems(r):
+                self._observe_running(l, a)
 
             self.running = r
         self.refresh = time.time()
@@ -151,7 +211,17 @@ class Burp(BUIbackend):
         """See :func:`burpui.misc.backend.interface.BUIbackend.get_all_clients`"""
         if agent not in self.servers:
             return []
-        return self.servers[agent].get_all_clients()
+        r = self.servers[agent].get_all_clients()
+        self._observe_running([x['name'] for x in r if x.get('state') == 'running'], agent)
+        return r
+
+    def get_changes(self, since=None, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.get_changes`"""
+        return self.servers[agent].get_changes(since)
+
+    def get_slow_queries(self, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.get_slow_queries`"""
+        return self.servers[agent].get_slow_queries()
 
     def get_client(self, name=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.get_client`"""
@@ -165,6 +235,10 @@ class Burp(BUIbackend):
         """See :func:`burpui.misc.backend.interface.BUIbackend.restore_files`"""
         return self.servers[agent].restore_files(name, backup, files, strip, archive, password)
 
+    def restore_stream(self, name=None, backup=None, files=None, strip=None, archive='zip', password=None, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.restore_stream`"""
+        return self.servers[agent].restore_stream(name, backup, files, strip, archive, password)
+
     def read_conf_cli(self, client=None, conf=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.read_conf_cli`"""
         return self.servers[agent].read_conf_cli(client, conf)
@@ -177,6 +251,10 @@ class Burp(BUIbackend):
         """See :func:`burpui.misc.backend.interface.BUIbackend.store_conf_cli`"""
         return self.servers[agent].store_conf_cli(data, client, conf)
 
+    def patch_clients_conf(self, pattern=None, patch=None, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.patch_clients_conf`"""
+        return self.servers[agent].patch_clients_conf(pattern, patch)
+
     def store_conf_srv(self, data, conf=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.store_conf_srv`"""
         return self.servers[agent].store_conf_srv(data, conf)
@@ -189,9 +267,9 @@ class Burp(BUIbackend):
         """See :func:`burpui.misc.backend.interface.BUIbackend.delete_client`"""
         return self.servers[agent].delete_client(client)
 
-    def clients_list(self, agent=None):
+    def clients_list(self, prefix=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.clients_list`"""
-        return self.servers[agent].clients_list()
+        return self.servers[agent].clients_list(prefix)
 
     def get_parser_attr(self, attr=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.get_parser_attr`"""
@@ -276,6 +354,134 @@ class Burp(BUIbackend):
         return self.servers[agent].get_server_version()
 
 
+class AgentHealth(object):
+    """The :class:`burpui.misc.backend.multi.AgentHealth` class tracks the
+    health of an agent and implements a circuit breaker.
+
+    The breaker is *closed* while the agent answers. After *failures*
+    consecutive failures it becomes *open*: requests fail fast (or are served
+    from the last known answers) instead of waiting for the timeout. Once
+    *retry* seconds have elapsed, the breaker is *half-open* and lets a single
+    request reach the agent. A success closes the breaker, a failure opens it
+    again.
+
+    The object is shared between every :class:`burpui.misc.backend.multi.NClient`
+    instance (one per thread/greenlet) of a given agent.
+
+    :param failures: Number of consecutive failures before opening the breaker
+    :type failures: int
+
+    :param retry: Number of seconds before trying an agent again
+    :type retry: int
+
+    :param probe: Interval in seconds of the background checks (0 to disable)
+    :type probe: int
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    # weight of the last measure in the latency moving average
+    alpha = 0.3
+    # number of answers we remember
+    max_known = 64
+
+    def __init__(self, failures=3, retry=30, probe=30):
+        self.failures = failures if failures is not None else 3
+        self.retry = retry if retry is not None else 30
+        self.probe = probe if probe is not None else 30
+        self.state = self.CLOSED
+        self.consecutive = 0
+        self.latency = None
+        self.opened = None
+        self.last_success = None
+        self.last_failure = None
+        self.last_error = None
+        self.trial = None
+        self.known = OrderedDict()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Tells whether a request may be sent to the agent"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.time() - self.opened < self.retry:
+                    return False
+                self.state = self.HALF_OPEN
+                self.trial = None
+            # half-open: only one trial request at a time unless the previous
+            # one never reported back
+            now = time.time()
+            if self.trial and now - self.trial < self.retry:
+                return False
+            self.trial = now
+            return True
+
+    def success(self, elapsed=None):
+        """Record a successful exchange with the agent"""
+        with self.lock:
+            if elapsed is not None:
+                if self.latency is None:
+                    self.latency = elapsed
+                else:
+                    self.latency = self.alpha * elapsed + (1 - self.alpha) * self.latency
+            self.consecutive = 0
+            self.state = self.CLOSED
+            self.trial = None
+            self.last_success = time.time()
+
+    def failure(self, error=None):
+        """Record a failed exchange with the agent"""
+        with self.lock:
+            self.consecutive += 1
+            self.last_failure = time.time()
+            self.last_error = error
+            self.trial = None
+            if self.state == self.HALF_OPEN or self.consecutive >= self.failures:
+                if self.state != self.OPEN:
+                    self.opened = self.last_failure
+                self.state = self.OPEN
+
+    def need_probe(self):
+        """Tells whether the background check should look at this agent"""
+        if self.probe <= 0:
+            return False
+        if self.state != self.CLOSED:
+            return True
+        last = max(self.last_success or 0, self.last_failure or 0)
+        return time.time() - last >= self.probe
+
+    @property
+    def alive(self):
+        return self.state == self.CLOSED
+
+    def remember(self, key, value):
+        """Store the last known answer of a request"""
+        with self.lock:
+            self.known.pop(key, None)
+            self.known[key] = value
+            while len(self.known) > self.max_known:
+                self.known.popitem(last=False)
+
+    def recall(self, key):
+        """Returns the last known answer of a request or None"""
+        with self.lock:
+            return self.known.get(key)
+
+    def to_dict(self):
+        return {
+            'state': self.state,
+            'alive': self.alive,
+            'failures': self.consecutive,
+            'latency': round(self.latency * 1000, 3) if self.latency is not None else None,
+            'last_success': self.last_success,
+            'last_failure': self.last_failure,
+            'last_error': self.last_error,
+        }
+
+
 class NClient(BUIbackend, local):
     """The :class:`burpui.misc.backend.multi.NClient` class provides a
     consistent backend to interact with ``agents``.
@@ -297,9 +503,31 @@ class NClient(BUIbackend, local):
 
     :param ssl: Use SSL to communicate with the agent
     :type ssl: bool
-    """
 
-    def __init__(self, app=None, host=None, port=None, password=None, ssl=None, timeout=5):
+    :param timeout: Socket timeout in seconds
+    :type timeout: int
+
+    :param health: Health tracker shared between the instances of this agent
+    :type health: :class:`burpui.misc.backend.multi.AgentHealth`
+
+    :param name: Name of the agent in the metrics and the traces
+    :type name: str
+    """
+    # requests whose last answer may be served while the agent is unreachable
+    recallable = [
+        'get_all_clients',
+        'get_client',
+        'is_backup_running',
+        'is_one_backup_running',
+        'clients_list',
+        'get_client_version',
+        'get_server_version',
+    ]
+    # how long to wait for the next chunk of a restoration archive
+    stream_timeout = 300
+
+    def __init__(self, app=None, host=None, port=None, password=None, ssl=None, timeout=5, health=None, name=None):
+        self.name = name or '{}:{}'.format(host, port)
         self.host = host
         self.port = port
         self.password = password
@@ -307,6 +535,7 @@ class NClient(BUIbackend, local):
         self.connected = False
         self.app = app
         self.timeout = timeout or 5
+        self.health = health or AgentHealth()
 
     def conn(self, notimeout=False):
         """Connects to the agent if needed"""
@@ -318,6 +547,7 @@ class NClient(BUIbackend, local):
             self.app.logger.debug('OK, connected to agent %s:%s', self.host, self.port)
         except Exception as e:
             self.connected = False
+            self.health.failure(str(e))
             self.app.logger.error('Could not connect to %s:%s => %s', self.host, self.port, str(e))
 
     def do_conn(self, notimeout=False):
@@ -345,10 +575,29 @@ class NClient(BUIbackend, local):
 
     def ping(self):
         """Check if we are connected to the agent"""
+        if not self.health.allow():
+            return False
         self.conn()
         res = self.connected
         return res
 
+    def probe(self):
+        """Open a new connection to the agent and close it right away in order
+        to refresh its health"""
+        if not self.health.allow():
+            return False
+        start = time.time()
+        try:
+            sock = self.do_conn()
+            sock.sendall(struct.pack('!Q', 2))
+            sock.sendall(b'RE')
+            sock.close()
+        except Exception as e:
+            self.health.failure(str(e))
+            return False
+        self.health.success(time.time() - start)
+        return True
+
     def close(self, force=True):
         """Disconnect from the agent"""
         if self.connected and force:
@@ -358,16 +607,53 @@ class NClient(BUIbackend, local):
             self.sock.close()
             self.connected = False
 
+    def _recall_key(self, data):
+        if not data or data.get('func') not in self.recallable:
+            return None
+        return json.dumps([data.get('func'), data.get('args')], sort_keys=True)
+
     def do_command(self, data=None, restarted=False):
         """Send a command to the remote agent"""
-        self.conn()
+        # the time is measured here rather than by wrapping the method of
+        # the instance since its attributes are local to every greenlet
+        func = (data or {}).get('func')
+        start = time.time()
+        try:
+            with tracer.span('agent.{}'.format(func), self.name):
+                return self._do_command(data, restarted)
+        finally:
+            registry.observe(
+                'burpui_agent_request_seconds',
+                time.time() - start,
+                {'agent': self.name, 'func': func}
+            )
+
+    def _do_command(self, data=None, restarted=False):
         res = '[]'
+        key = self._recall_key(data)
+        if not restarted and not self.health.allow():
+            # the circuit breaker is open, do not wait for a dead agent
+            self.app.logger.debug('Agent %s:%s is unavailable, failing fast', self.host, self.port)
+            if key:
+                known = self.health.recall(key)
+                if known is not None:
+                    return known
+            return res
+        self.conn()
         toclose = False
         if not data or not self.connected:
             return res
+        start = time.time()
         try:
             data['password'] = self.password
-            if data['func'] == 'restore_files':
+            trace = tracer.current
+            if trace:
+                # lets the agent match its spans with ours
+                data['trace'] = trace.id
+            if profiler.current:
+                # the agent profiles its part of the request too
+                data['profile'] = True
+            if data['func'] in ['restore_files', 'restore_stream']:
                 self.close()
                 self.conn(True)
             raw = json.dumps(data)
@@ -377,6 +663,8 @@ class NClient(BUIbackend, local):
             self.app.logger.debug("Sending: %s", raw)
             tmp = self.sock.recv(2).decode('UTF-8')
             self.app.logger.debug("recv: '%s'", tmp)
+            if tmp:
+                self.health.success(time.time() - start)
             if 'ER' == tmp:
                 lengthbuf = self.sock.recv(8)
                 length, = struct.unpack('!Q', lengthbuf)
@@ -387,8 +675,15 @@ class NClient(BUIbackend, local):
                 return res
             self.app.logger.debug("Data sent successfully")
             tmp = 'OK'
-            if data['func'] == 'restore_files':
-                tmp = self.sock.recv(2)
+            if data['func'] in ['restore_files', 'restore_stream']:
+                tmp = self.sock.recv(2).decode('UTF-8')
+            if data['func'] == 'restore_stream' and tmp != 'KO':
+                # the archive is sent in frames until an empty one, the
+                # connection is released even if the stream is never read
+                sock = self.sock
+                res = (BUIprogress(lambda progress: self._recv_frames(sock, progress), lambda: self._release(sock)), None)
+                self.connected = False
+                return res
             lengthbuf = self.sock.recv(8)
             length, = struct.unpack('!Q', lengthbuf)
             if data['func'] == 'restore_files':
@@ -397,34 +692,109 @@ class NClient(BUIbackend, local):
                     err = self.recvall(length).decode('UTF-8')
                 res = (self.sock, length, err)
                 self.connected = False
+            elif data['func'] == 'restore_stream':
+                err = self.recvall(length).decode('UTF-8')
+                self._release(self.sock)
+                res = (None, err)
+                self.connected = False
             else:
                 res = self.recvall(length).decode('UTF-8')
+                if key:
+                    self.health.remember(key, res)
         except BUIserverException as e:
             raise e
         except IOError as e:
             if not restarted and e.errno == errno.EPIPE:
                 self.connected = False
-                return self.do_command(data, True)
+                return self._do_command(data, True)
             elif e.errno == errno.ECONNRESET:
                 self.connected = False
+                self.health.failure(str(e))
                 self.app.logger.error('!!! {} !!!\nPlease check your SSL configuration on both sides!'.format(str(e)))
             else:
                 toclose = True
+                self.health.failure(str(e))
                 self.app.logger.error('!!! {} !!!\n{}'.format(str(e), traceback.format_exc()))
         except socket.timeout as e:
-            if self.app.gunicorn and not restarted:
+            self.health.failure(str(e))
+            # only retry if the agent is still believed to be alive
+            if self.app.gunicorn and not restarted and self.health.alive:
                 self.connected = False
-                return self.do_command(data, True)
+                return self._do_command(data, True)
             toclose = True
             self.app.logger.error('!!! {} !!!\n{}'.format(str(e), traceback.format_exc()))
         except Exception as e:
             toclose = True
+            self.health.failure(str(e))
             self.app.logger.error('!!! {} !!!\n{}'.format(str(e), traceback.format_exc()))
         finally:
             self.close(toclose)
 
         return res
 
+    def _release(self, sock):
+        """Tell the agent we are done with this connection and close it"""
+        try:
+            sock.sendall(struct.pack('!Q', 2))
+            sock.sendall(b'RE')
+            sock.close()
+        except (IOError, socket.error) as e:
+            self.app.logger.debug('Unable to close the connection: %s', str(e))
+
+    def _wait(self, sock):
+        """Wait for the agent to send some data"""
+        r, _, _ = select.select([sock], [], [], self.stream_timeout)
+        if not r:
+            raise BUIserverException('Socket timed-out')
+
+    def _recv_raw(self, sock, length):
+        """Generator reading an archive of a known size from the agent"""
+        bsize = 65536
+        received = 0
+        try:
+            while received < length:
+                self._wait(sock)
+                buf = sock.recv(min(bsize, length - received))
+                if not buf:
+                    raise BUIserverException('Connection closed by the agent')
+                received += len(buf)
+                yield buf
+        finally:
+            self._release(sock)
+
+    def _recv_frames(self, sock, progress=None):
+        """Generator reading a streamed archive from the agent
+
+        :param progress: Receives the number of files archived by the agent
+        :type progress: :class:`burpui.utils.BUIprogress`
+        """
+        def recv(length):
+            buf = b''
+            while len(buf) < length:
+                self._wait(sock)
+                newbuf = sock.recv(length - len(buf))
+                if not newbuf:
+                    raise BUIserverException('Connection closed by the agent')
+                buf += newbuf
+            return buf
+
+        while True:
+            length, = struct.unpack('!Q', recv(8))
+            if length & FRAME_PROGRESS:
+                if progress is not None:
+                    progress.files = length & ~FRAME_PROGRESS
+                continue
+            if not length:
+                break
+            # do not hold a whole frame in memory before sending it
+            while length:
+                self._wait(sock)
+                buf = sock.recv(min(65536, length))
+                if not buf:
+                    raise BUIserverException('Connection closed by the agent')
+                length -= len(buf)
+                yield buf
+
     def recvall(self, length=1024):
         """Read the answer of the agent"""
         buf = b''
@@ -479,6 +849,21 @@ class NClient(BUIbackend, local):
         data = {'func': 'get_all_clients', 'args': None}
         return json.loads(self.do_command(data))
 
+    def get_changes(self, since=None, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.get_changes`"""
+        data = {'func': 'get_changes', 'args': {'since': since}}
+        return json.loads(self.do_command(data))
+
+    def get_slow_queries(self, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.get_slow_queries`"""
+        data = {'func': 'get_slow_queries', 'args': None}
+        return json.loads(self.do_command(data))
+
+    def metrics(self):
+        """Returns the metrics of the agent in the Prometheus text format"""
+        data = {'func': 'metrics', 'args': None}
+        return json.loads(self.do_command(data))
+
     def get_client(self, name=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.get_client`"""
         data = {'func': 'get_client', 'args': {'name': name}}
@@ -494,6 +879,22 @@ class NClient(BUIbackend, local):
         data = {'func': 'restore_files', 'args': {'name': name, 'backup': backup, 'files': files, 'strip': strip, 'archive': archive, 'password': password}}
         return self.do_command(data)
 
+    def restore_stream(self, name=None, backup=None, files=None, strip=None, archive='zip', password=None, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.restore_stream`"""
+        data = {'func': 'restore_stream', 'args': {'name': name, 'backup': backup, 'files': files, 'strip': strip, 'archive': archive, 'password': password}}
+        res = self.do_command(data)
+        if isinstance(res, tuple):
+            return res
+        # older agents do not know how to stream the archive
+        res = self.restore_files(name, backup, files, strip, archive, password)
+        if not isinstance(res, tuple):
+            return None, 'Unable to perform the restoration'
+        sock, length, err = res
+        if err:
+            self._release(sock)
+            return None, err
+        return self._recv_raw(sock, length), None
+
     def read_conf_cli(self, client=None, conf=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.read_conf_cli`"""
         data = {'func': 'read_conf_cli', 'args': {'conf': conf, 'client': client}}
@@ -512,6 +913,11 @@ class NClient(BUIbackend, local):
         data = {'func': 'store_conf_cli', 'args': b64encode(pickle.dumps({'data': data, 'conf': conf, 'client': client}, -1)), 'pickled': True}
         return json.loads(self.do_command(data))
 
+    def patch_clients_conf(self, pattern=None, patch=None, agent=None):
+        """See :func:`burpui.misc.backend.interface.BUIbackend.patch_clients_conf`"""
+        data = {'func': 'patch_clients_conf', 'args': {'pattern': pattern, 'patch': patch}}
+        return json.loads(self.do_command(data))
+
     def store_conf_srv(self, data, conf=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.store_conf_srv`"""
         # serialize data as it is a nested dict
@@ -530,9 +936,12 @@ class NClient(BUIbackend, local):
         data = {'func': 'delete_client', 'args': {'client': client}}
         return json.loads(self.do_command(data))
 
-    def clients_list(self, agent=None):
+    def clients_list(self, prefix=None, agent=None):
         """See :func:`burpui.misc.backend.interface.BUIbackend.clients_list`"""
         data = {'func': 'clients_list', 'args': None}
+        if prefix:
+            # older agents do not know about the prefix
+            data['args'] = {'prefix': prefix}
         return json.loads(self.do_command(data))
 
     def get_parser_attr(self, attr=None, agent=None):
@@ -4,12 +4,21 @@ import os
 import json
 import shutil
 import codecs
+import tempfile
 
 from glob import glob
+from fnmatch import fnmatchcase
+from six import iteritems, text_type
 
 from .interface import BUIparser
+from .cache import ParseCache, signature, glob_dirs
+from .watcher import watch
 from ...exceptions import BUIserverException
 
+KEY_BOOLEAN = 'boolean'
+KEY_INTEGER = 'integer'
+KEY_MULTI = 'multi'
+
 
 class Parser(BUIparser):
     """:class:`burpui.misc.parser.burp1.Parser` provides a consistent interface
@@ -18,6 +27,10 @@ class Parser(BUIparser):
     It implements :class:`burpui.misc.parser.interface.BUIparser`.
     """
     pver = 1
+    _comment_re = re.compile(r'^\s*#')
+    _line_re = re.compile(r'\s*([^=\s]+)\s*=?\s*(.*)$')
+    _booleans = {u'1': u'1', u'true': u'1', u'yes': u'1', u'on': u'1',
+                 u'0': u'0', u'false': u'0', u'no': u'0', u'off': u'0'}
     defaults = {
         u'address': u'',  # IP
         u'atime': False,  # bool
@@ -518,17 +531,29 @@ class Parser(BUIparser):
         self.root = None
         if self.conf:
             self.root = os.path.dirname(self.conf)
+        # parsed files, re-read only when they or their includes change
+        self.cache = ParseCache()
+        # kind of the known keys per mode (see _key_kinds)
+        self._kinds = {}
+        # index of the clients kept up to date by a watcher thread (optional)
+        self.watcher = None
+        self.interval = 5
+        self.index = None
         # first run to setup vars
         self.read_server_conf()
 
-    def _readfile(self, f=None, client=False):
-        if not f:
-            return []
+    def _resolve(self, f, client=False):
         if f != self.conf and not f.startswith('/'):
             if client:
                 f = os.path.join(self.clientconfdir, f)
             else:
                 f = os.path.join(self.root, f)
+        return f
+
+    def _readfile(self, f=None, client=False):
+        if not f:
+            return []
+        f = self._resolve(f, client)
         self._logger('debug', 'reading file: %s', f)
         with codecs.open(f, 'r', 'utf-8') as ff:
             ret = [x.rstrip('\n') for x in ff.readlines()]
@@ -541,27 +566,68 @@ class Parser(BUIparser):
     def _parse_lines_cli(self, fi):
         return self._parse_lines(fi, 'cli')
 
-    def _parse_lines(self, fi, mode='srv'):
+    def _parse_file(self, f, mode='srv'):
+        """Returns the parsed content of a configuration file. The file is
+        only read again if it or one of its includes changed since the last
+        time."""
+        path = self._resolve(f, mode == 'cli')
+        key = (path, mode, self.root if mode == 'srv' else self.clientconfdir)
+        cached = self.cache.get(key)
+        if cached is not None:
+            parsed, state = cached
+            if state:
+                # the variables set while parsing the server configuration
+                self.workingdir, self.clientconfdir = state
+            return [list(x) for x in parsed]
+        # the signatures are taken before reading so a concurrent change is
+        # noticed next time
+        deps = [(path, signature(path))]
+        parsed = self._parse_lines(self._readfile(path), mode, deps)
+        state = None
+        if mode == 'srv':
+            state = (self.workingdir, self.clientconfdir)
+        self.cache.set(key, (parsed, state), deps)
+        return [list(x) for x in parsed]
+
+    def _key_kinds(self, mode='srv'):
+        """Returns the kind (boolean, integer or multi) of the known keys of a
+        mode"""
+        kinds = self._kinds.get(mode)
+        if kinds is None:
+            kinds = {}
+            # same precedence as the successive checks of _parse_lines
+            for kind in [KEY_MULTI, KEY_INTEGER, KEY_BOOLEAN]:
+                for key in getattr(self, '{}_{}'.format(kind, mode)):
+                    kinds[key] = kind
+            self._kinds[mode] = kinds
+        return kinds
+
+    def _parse_lines(self, fi, mode='srv', deps=None):
         dic = []
         boolean = []
         multi = []
         integer = []
         includes = []
         includes_ext = []
+        # values of the multi keys, in the order they appear
+        multi_values = {}
+        kinds = self._key_kinds(mode)
+        comment = self._comment_re.match
+        tokenize = self._line_re.search
         for l in fi:
-            if re.match('^\s*#', l):
+            if comment(l):
                 continue
-            r = re.search('\s*([^=\s]+)\s*=?\s*(.*)$', l)
+            r = tokenize(l)
             if r:
-                key = r.group(1)
-                val = r.group(2)
+                key, val = r.groups()
                 # We are gonna use this for server-side initiated restoration
                 if mode == 'srv' and key == u'directory':
                     self.workingdir = val
-                if key in getattr(self, 'boolean_{}'.format(mode)):
+                kind = kinds.get(key)
+                if kind == KEY_BOOLEAN:
                     boolean.append({'name': key, 'value': int(val) == 1})
                     continue
-                elif key in getattr(self, 'integer_{}'.format(mode)):
+                elif kind == KEY_INTEGER:
                     integer.append({'name': key, 'value': int(val)})
                     continue
                 if key == u'.':
@@ -571,19 +637,20 @@ class Parser(BUIparser):
                             i = os.path.join(self.root, val)
                         else:
                             i = os.path.join(self.clientconfdir, val)
+                    if deps is not None:
+                        deps += [(x, signature(x)) for x in glob_dirs(i)]
                     for p in glob(i):
+                        if deps is not None:
+                            deps.append((p, signature(p)))
                         includes_ext.append({'name': p, 'value': val})
                     includes.append(val)
                     continue
-                if key in getattr(self, 'multi_{}'.format(mode)):
-                    found = False
-                    for m in multi:
-                        if m['name'] == key:
-                            m['value'].append(val)
-                            found = True
-                            break
-                    if not found:
-                        multi.append({'name': key, 'value': [val]})
+                if kind == KEY_MULTI:
+                    values = multi_values.get(key)
+                    if values is None:
+                        values = multi_values[key] = []
+                        multi.append({'name': key, 'value': values})
+                    values.append(val)
                     continue
                 if key == u'clientconfdir':
                     if mode != 'srv':
@@ -616,7 +683,11 @@ class Parser(BUIparser):
         if not client:
             return [2, "No client provided"]
         try:
-            os.unlink(os.path.join(self.clientconfdir, client))
+            path = os.path.join(self.clientconfdir, client)
+            os.unlink(path)
+            self.cache.forget(path)
+            if self.index:
+                self.index.remove(client)
             return [0, "'{}' successfully removed".format(client)]
         except Exception as e:
             return [2, str(e)]
@@ -642,11 +713,11 @@ class Parser(BUIparser):
             mconf = os.path.join(self.clientconfdir, client)
 
         try:
-            f = self._readfile(mconf, True)
+            parsed = self._parse_file(mconf, 'cli')
         except Exception:
             return res
 
-        strings, boolean, multi, integer, includes, includes_ext = self._parse_lines_cli(f)
+        strings, boolean, multi, integer, includes, includes_ext = parsed
         res[u'common'] = strings
         res[u'boolean'] = boolean
         res[u'integer'] = integer
@@ -676,11 +747,11 @@ class Parser(BUIparser):
             return res
 
         try:
-            f = self._readfile(mconf)
+            parsed = self._parse_file(mconf, 'srv')
         except Exception:
             return res
 
-        strings, boolean, multi, integer, includes, includes_ext = self._parse_lines_srv(f)
+        strings, boolean, multi, integer, includes, includes_ext = parsed
         res[u'common'] = strings
         res[u'boolean'] = boolean
         res[u'integer'] = integer
@@ -690,29 +761,67 @@ class Parser(BUIparser):
 
         return res
 
-    def _list_clients(self, force=False):
+    def watch(self, method='auto', interval=5):
+        """Keep the list of clients up to date with a watcher thread instead
+        of scanning the ``clientconfdir`` once.
+
+        :param method: 'inotify', 'poll' or 'auto' (inotify if available)
+        :type method: str
+
+        :param interval: Number of seconds between two scans when polling
+        :type interval: float
+        """
+        self.watcher = method
+        self.interval = interval
+        self.index = None
+        self.clients = []
+
+    def _get_index(self):
+        if not self.watcher or not self.clientconfdir:
+            return None
+        index = self.index
+        if index is None or index.directory != self.clientconfdir or index.stopped:
+            try:
+                index = watch(self.clientconfdir, self.watcher, self.interval)
+            except OSError as exc:
+                self._logger('error', 'Unable to watch %s: %s', self.clientconfdir, str(exc))
+                self.watcher = None
+                return None
+            if self.cache.forget not in index.listeners:
+                index.listeners.append(self.cache.forget)
+            self.index = index
+        return index
+
+    def _list_clients(self, force=False, prefix=None):
         if not self.clientconfdir:
             return []
 
-        if self.clients and not force:
-            return self.clients
+        index = self._get_index()
+        if index:
+            # always fresh, no need to scan the directory again
+            self.clients = index.entries()
+            return index.entries(prefix) if prefix else self.clients
 
-        res = []
-        for f in os.listdir(self.clientconfdir):
-            ff = os.path.join(self.clientconfdir, f)
-            if os.path.isfile(ff) and not f.startswith('.') and not f.endswith('~'):
-                res.append({'name': f, 'value': os.path.join(self.clientconfdir, f)})
+        if not self.clients or force:
+            res = []
+            for f in os.listdir(self.clientconfdir):
+                ff = os.path.join(self.clientconfdir, f)
+                if os.path.isfile(ff) and not f.startswith('.') and not f.endswith('~'):
+                    res.append({'name': f, 'value': os.path.join(self.clientconfdir, f)})
 
-        self.clients = res
-        return res
+            self.clients = res
 
-    def list_clients(self):
+        if prefix:
+            return [x for x in self.clients if x['name'].startswith(prefix)]
+        return self.clients
+
+    def list_clients(self, prefix=None):
         """See :func:`burpui.misc.parser.interface.BUIparser.list_clients`"""
         self.read_server_conf()
         if not self.clientconfdir:
                 return []
 
-        return self._list_clients()
+        return self._list_clients(prefix=prefix)
 
     def store_client_conf(self, data, client=None, conf=None):
         """See :func:`burpui.misc.parser.interface.BUIparser.store_client_conf`"""
@@ -723,7 +832,13 @@ class Parser(BUIparser):
         elif client and not conf:
             conf = os.path.join(self.clientconfdir, client)
         ret = self.store_conf(data, conf, mode='cli')
-        self._list_clients(True)  # refresh client list
+        index = self._get_index()
+        if index:
+            # do not wait for the watcher to notice the new client
+            if os.path.dirname(conf) == index.directory and os.path.isfile(conf):
+                index.add(os.path.basename(conf))
+        else:
+            self._list_clients(True)  # refresh client list
         return ret
 
     def store_conf(self, data, conf=None, mode='srv'):
@@ -745,22 +860,10 @@ class Parser(BUIparser):
             except OSError as e:
                 return [[1, str(e)]]
 
-        if self.clientconfdir in dirname:
-            ref = '{}.bui.init.back~'.format(mconf)
-            bak = '{}.bak~'.format(mconf)
-        else:
-            ref = '{}.bui.init.back'.format(mconf)
-            bak = '{}.bak'.format(mconf)
-        if not os.path.isfile(ref) and os.path.isfile(mconf):
-            try:
-                shutil.copy(mconf, ref)
-            except Exception as e:
-                return [[2, str(e)]]
-        elif os.path.isfile(mconf):
-            try:
-                shutil.copy(mconf, bak)
-            except Exception as e:
-                return [[2, str(e)]]
+        try:
+            self._backup_conf(mconf)
+        except Exception as e:
+            return [[2, str(e)]]
 
         errs = []
         for key in data.keys():
@@ -832,10 +935,154 @@ class Parser(BUIparser):
                     if file not in already_file:
                         self._write_key(f, '.', file)
         except Exception as e:
+            self.cache.forget(mconf)
             return [[2, str(e)]]
 
+        # parse what we just wrote so the next read is served by the cache
+        self.cache.forget(mconf)
+        try:
+            self._parse_file(mconf, mode)
+        except Exception:
+            pass
+
         return [[0, 'Configuration successfully saved.']]
 
+    def _backup_conf(self, mconf):
+        """Keep a copy of the original file and of its previous version"""
+        if self.clientconfdir in os.path.dirname(mconf):
+            ref = '{}.bui.init.back~'.format(mconf)
+            bak = '{}.bak~'.format(mconf)
+        else:
+            ref = '{}.bui.init.back'.format(mconf)
+            bak = '{}.bak'.format(mconf)
+        if not os.path.isfile(ref) and os.path.isfile(mconf):
+            shutil.copy(mconf, ref)
+        elif os.path.isfile(mconf):
+            shutil.copy(mconf, bak)
+
+    def _validate_patch(self, patch, mode='cli'):
+        """Returns the lines of value of every key of a patch, None for the
+        removed keys"""
+        if not patch or not isinstance(patch, dict):
+            raise BUIserverException('No settings to change')
+        kinds = self._key_kinds(mode)
+        known = set(kinds) | set(getattr(self, 'string_{}'.format(mode)))
+        ret = {}
+        errors = []
+        for (key, value) in iteritems(patch):
+            if key not in known:
+                errors.append("Unknown setting '{}'".format(key))
+                continue
+            kind = kinds.get(key)
+            values = list(value) if isinstance(value, (list, tuple)) else [value]
+            if value is None or not values:
+                ret[key] = None
+                continue
+            if kind != KEY_MULTI and len(values) > 1:
+                errors.append("'{}' takes a single value".format(key))
+                continue
+            try:
+                if kind == KEY_BOOLEAN:
+                    val = text_type(values[0]).lower()
+                    if val not in self._booleans:
+                        raise ValueError(val)
+                    values = [self._booleans[val]]
+                elif kind == KEY_INTEGER:
+                    values = [text_type(int(values[0]))]
+                else:
+                    values = [text_type(x) for x in values]
+            except (TypeError, ValueError):
+                errors.append("Invalid value for '{}'".format(key))
+                continue
+            if any('\n' in x or '\r' in x for x in values):
+                errors.append("Invalid value for '{}'".format(key))
+                continue
+            if key in self.files:
+                missing = [x for x in values if not os.path.isfile(x)]
+                if missing:
+                    errors.append("Sorry, the file '{}' does not exist".format(missing[0]))
+                    continue
+            ret[key] = values
+        if errors:
+            raise BUIserverException(', '.join(errors))
+        return ret
+
+    def _patch_lines(self, lines, patch):
+        """Returns the lines of a configuration file with a validated patch
+        applied: the first occurrence of a changed key is replaced by its new
+        value, the other ones are dropped and the removed keys are commented"""
+        ret = []
+        done = set()
+        for line in lines:
+            key = None
+            if not self._comment_re.match(line) and not self._line_is_file_include(line.strip()):
+                r = self._line_re.search(line)
+                if r:
+                    key = r.group(1)
+            if key is None or key not in patch:
+                ret.append(line)
+            elif patch[key] is None:
+                ret.append(u'#{}'.format(line))
+            elif key not in done:
+                ret += [u'{} = {}'.format(key, x) for x in patch[key]]
+                done.add(key)
+        for key in sorted(patch):
+            if key not in done and patch[key] is not None:
+                ret += [u'{} = {}'.format(key, x) for x in patch[key]]
+        return ret
+
+    def _write_atomic(self, path, lines):
+        """Replace the content of a file at once"""
+        dirname, name = os.path.split(path)
+        # hidden and ending with '~' so it is never taken for a client
+        fd, tmp = tempfile.mkstemp(prefix='.{}.'.format(name), suffix='~', dir=dirname)
+        os.close(fd)
+        try:
+            with codecs.open(tmp, 'w', 'utf-8') as f:
+                for line in lines:
+                    f.write(u'{}\n'.format(line))
+            if os.path.exists(path):
+                shutil.copymode(path, tmp)
+            os.rename(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def patch_clients(self, pattern=None, patch=None):
+        """See :func:`burpui.misc.parser.interface.BUIparser.patch_clients`"""
+        if not pattern:
+            raise BUIserverException('No client provided')
+        self.read_server_conf()
+        if not self.clientconfdir:
+            raise BUIserverException('Unable to find the clientconfdir')
+        patch = self._validate_patch(patch)
+        # the literal beginning of the pattern narrows the search
+        prefix = re.split(r'[*?\[]', pattern, 1)[0]
+        clients = sorted(
+            (x for x in self._list_clients(prefix=prefix) if fnmatchcase(x['name'], pattern)),
+            key=lambda x: x['name']
+        )
+        ret = []
+        for client in clients:
+            name = client['name']
+            path = client['value']
+            try:
+                with codecs.open(path, 'r', 'utf-8') as ff:
+                    orig = [x.rstrip('\n') for x in ff.readlines()]
+                lines = self._patch_lines(orig, patch)
+                if lines == orig:
+                    ret.append({'name': name, 'notif': [3, "'{}' is already up to date".format(name)]})
+                    continue
+                self._backup_conf(path)
+                self._write_atomic(path, lines)
+                ret.append({'name': name, 'notif': [0, "'{}' successfully updated".format(name)]})
+            except Exception as e:
+                ret.append({'name': name, 'notif': [2, str(e)]})
+            finally:
+                self.cache.forget(path)
+        return ret
+
     def _write_key(self, f, key, data):
         if key in self.boolean_srv:
             val = 0
@@ -0,0 +1,84 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.misc.parser.cache
+    :platform: Unix
+    :synopsis: Burp-UI parse cache module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+The parsed configuration files are kept along with the signature (mtime, size
+and inode) of every file and directory their content depends on: the file
+itself, the included files and the directories scanned by the include globs.
+A parsed file is only used again if none of these changed.
+"""
+import os
+import threading
+
+from glob import glob, has_magic
+
+
+def signature(path):
+    """Returns the (mtime, size, inode) of a path or None if it is missing"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+def glob_dirs(pattern):
+    """Returns the directories whose content decides the result of
+    ``glob(pattern)``"""
+    dirname = os.path.dirname(pattern)
+    if not has_magic(dirname):
+        return [dirname]
+    # every level of a magic dirname may gain new matches
+    head = dirname
+    while has_magic(head):
+        head = os.path.dirname(head)
+    ret = [head]
+    current = [head]
+    for part in dirname[len(head):].strip(os.sep).split(os.sep):
+        current = [x for d in current for x in glob(os.path.join(d, part)) if os.path.isdir(x)]
+        ret += current
+    return ret
+
+
+class ParseCache(object):
+    """The :class:`burpui.misc.parser.cache.ParseCache` class keeps the parsed
+    configuration files until one of their dependencies changes"""
+
+    def __init__(self):
+        # key -> (signatures, value)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the value of *key* or None if it is unknown or outdated"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        signatures, value = entry
+        for (path, sig) in signatures:
+            if signature(path) != sig:
+                with self.lock:
+                    if self.entries.get(key) is entry:
+                        del self.entries[key]
+                return None
+        return value
+
+    def set(self, key, value, signatures):
+        """Store *value* for *key*.
+
+        :param signatures: The (path, signature) of every dependency, taken
+                           *before* reading them
+        :type signatures: list
+        """
+        with self.lock:
+            self.entries[key] = (signatures, value)
+
+    def forget(self, path):
+        """Drop the values depending on *path*"""
+        with self.lock:
+            for key in [k for (k, (sigs, _)) in self.entries.items() if any(p == path for (p, _) in sigs)]:
+                del self.entries[key]
@@ -132,6 +132,26 @@ class BUIparser(BUIlogging):
         """
         raise NotImplementedError("Sorry, the current Parser does not implement this method!")  # pragma: no cover
 
+    @abstractmethod
+    def patch_clients(self, pattern=None, patch=None):
+        """:func:`burpui.misc.parser.interface.BUIparser.patch_clients` is used
+        by :func:`burpui.misc.backend.BUIbackend.patch_clients_conf` to apply
+        the same changes to the configuration of several clients.
+
+        :param pattern: Shell-style pattern matching the name of the clients
+        :type pattern: str
+
+        :param patch: The settings to change: a value (or a list of values for
+                      the multi-valued settings) per key, None removes the key
+        :type patch: dict
+
+        :returns: The result of every matching client
+
+        :raises: :class:`burpui.exceptions.BUIserverException` if the patch is
+                 invalid, in which case no file is modified
+        """
+        raise NotImplementedError("Sorry, the current Parser does not implement this method!")  # pragma: no cover
+
     @abstractmethod
     def store_conf(self, data, conf=None, mode='srv'):
         """:func:`burpui.misc.parser.interface.BUIparser.store_conf` is used to
@@ -174,10 +194,13 @@ class BUIparser(BUIlogging):
         raise NotImplementedError("Sorry, the current Parser does not implement this method!")  # pragma: no cover
 
     @abstractmethod
-    def list_clients(self):
+    def list_clients(self, prefix=None):
         """:func:`burpui.misc.parser.interface.BUIparser.list_clients` is used
         to retrieve a list of clients with their configuration file.
 
+        :param prefix: Only return the clients whose name starts with prefix
+        :type prefix: str
+
         :returns: A list of clients with their configuration file
         """
         raise NotImplementedError("Sorry, the current Parser does not implement this method!")  # pragma: no cover
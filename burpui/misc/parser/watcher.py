@@ -0,0 +1,255 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.misc.parser.watcher
+    :platform: Unix
+    :synopsis: Burp-UI clients index module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+The index of the clients found in the ``clientconfdir`` is kept up to date by
+a background thread, using inotify when available and polling the directory
+otherwise. The configuration files changed outside ``Burp-UI`` are reported
+so their parsed content can be dropped.
+"""
+import os
+import time
+import errno
+import struct
+import bisect
+import select
+import threading
+
+# inotify events (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCHED = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+    IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT = struct.Struct('iIII')
+
+
+def is_client(directory, name):
+    """Whether the file *name* of *directory* is a client configuration"""
+    return not name.startswith('.') and not name.endswith('~') and \
+        os.path.isfile(os.path.join(directory, name))
+
+
+class Inotify(object):
+    """Minimal inotify binding using :mod:`ctypes`"""
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.ctypes = ctypes
+
+    def add_watch(self, path, mask=WATCHED):
+        if not isinstance(path, bytes):
+            path = path.encode('utf-8')
+        wd = self.libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            raise OSError(self.ctypes.get_errno(), 'inotify_add_watch failed')
+        return wd
+
+    def read(self, timeout=1):
+        """Returns the (mask, name) of the pending events"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as exc:
+            if exc.errno == errno.EAGAIN:
+                return []
+            raise
+        events = []
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            _, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if str is not bytes:
+                name = name.decode('utf-8', 'replace')
+            events.append((mask, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class ClientIndex(object):
+    """The :class:`burpui.misc.parser.watcher.ClientIndex` class keeps the
+    sorted list of the clients of a ``clientconfdir``.
+
+    :param directory: The ``clientconfdir``
+    :type directory: str
+
+    :param method: 'inotify', 'poll' or 'auto' (inotify if available)
+    :type method: str
+
+    :param interval: Number of seconds between two scans when polling
+    :type interval: float
+    """
+
+    def __init__(self, directory, method='auto', interval=5):
+        self.directory = directory
+        self.method = method
+        self.interval = interval
+        self.names = []
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.signature = None
+        self.stopped = False
+        self.inotify = None
+        if method in ['auto', 'inotify']:
+            try:
+                self.inotify = Inotify()
+                self.inotify.add_watch(directory)
+            except (OSError, AttributeError):
+                if self.inotify:
+                    self.inotify.close()
+                    self.inotify = None
+                if method == 'inotify':
+                    raise
+        self.scan()
+        self.thread = threading.Thread(target=self.run, name='bui-clients-{}'.format(directory))
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def mode(self):
+        return 'inotify' if self.inotify else 'poll'
+
+    def entries(self, prefix=None):
+        """Returns the clients (with their configuration file) whose name
+        starts with *prefix*"""
+        if prefix:
+            names = self.names
+            start = bisect.bisect_left(names, prefix)
+            end = bisect.bisect_left(names, prefix + u'\uffff', start)
+            return [{'name': x, 'value': os.path.join(self.directory, x)} for x in names[start:end]]
+        snapshot = self.snapshot
+        if snapshot is None:
+            snapshot = self.snapshot = [{'name': x, 'value': os.path.join(self.directory, x)} for x in self.names]
+        return snapshot
+
+    def scan(self):
+        """Full scan of the directory"""
+        try:
+            self.signature = os.stat(self.directory).st_mtime
+            names = sorted(x for x in os.listdir(self.directory) if is_client(self.directory, x))
+        except OSError:
+            names = []
+        with self.lock:
+            removed = set(self.names) - set(names)
+            self.names = names
+            self.snapshot = None
+        for name in removed:
+            self.changed(name)
+
+    def add(self, name):
+        with self.lock:
+            idx = bisect.bisect_left(self.names, name)
+            if idx < len(self.names) and self.names[idx] == name:
+                return
+            # copy on write so the readers never see a list being modified
+            self.names = self.names[:idx] + [name] + self.names[idx:]
+            self.snapshot = None
+
+    def remove(self, name):
+        with self.lock:
+            idx = bisect.bisect_left(self.names, name)
+            if idx < len(self.names) and self.names[idx] == name:
+                self.names = self.names[:idx] + self.names[idx + 1:]
+                self.snapshot = None
+        self.changed(name)
+
+    def changed(self, name):
+        """Let the listeners know the configuration of a client changed"""
+        path = os.path.join(self.directory, name)
+        for listener in list(self.listeners):
+            listener(path)
+
+    def handle(self, mask, name):
+        """Update the index from an inotify event"""
+        if mask & IN_Q_OVERFLOW:
+            self.scan()
+        elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+            # the directory is gone, we keep an eye on it by polling
+            self.inotify.close()
+            self.inotify = None
+            self.scan()
+        elif not name or mask & IN_ISDIR:
+            return
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self.remove(name)
+        elif mask & (IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE):
+            if is_client(self.directory, name):
+                self.add(name)
+            if mask & (IN_MOVED_TO | IN_CLOSE_WRITE):
+                self.changed(name)
+
+    def poll(self):
+        """Scan the directory again if its content changed"""
+        try:
+            signature = os.stat(self.directory).st_mtime
+        except OSError:
+            signature = None
+        if signature != self.signature:
+            self.scan()
+
+    def run(self):
+        while not self.stopped:
+            try:
+                if self.inotify:
+                    for (mask, name) in self.inotify.read(self.interval):
+                        self.handle(mask, name)
+                        if not self.inotify:
+                            break
+                else:
+                    time.sleep(self.interval)
+                    self.poll()
+            except Exception:
+                # never let the index die, fall back to polling
+                if self.inotify:
+                    self.inotify.close()
+                    self.inotify = None
+                time.sleep(self.interval)
+
+    def stop(self):
+        self.stopped = True
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+
+# the parsers of a process share the index of a directory
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def watch(directory, method='auto', interval=5):
+    """Returns the :class:`burpui.misc.parser.watcher.ClientIndex` of
+    *directory*, shared by every parser of the process"""
+    with _indexes_lock:
+        index = _indexes.get(directory)
+        if index is None or index.stopped:
+            index = _indexes[directory] = ClientIndex(directory, method, interval)
+        return index
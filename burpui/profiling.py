@@ -0,0 +1,201 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.profiling
+    :platform: Unix
+    :synopsis: Burp-UI profiling module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+A request can be profiled with :mod:`cProfile`, either because an
+administrator asked for it with the ``X-Profile`` header or because it was
+picked by the sampling rate. The profile is written in the configured
+directory as a ``.prof`` file named after the endpoint and the duration of
+the request, ready for :mod:`pstats` or any compatible viewer.
+
+When the server profiles a request, the agents profile their part of it too.
+
+Only one request is profiled at a time per process: the other requests are
+served as usual. Keep in mind that under gevent, the greenlets running at the
+same time as the profiled request show up in its profile.
+"""
+import os
+import re
+import time
+import random
+import cProfile
+import threading
+
+HEADER = 'X-Profile'
+
+
+class Profile(object):
+    """A running profile"""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        return time.time() - self.start
+
+
+class Profiler(object):
+    """The :class:`burpui.profiling.Profiler` class decides which requests
+    are profiled and writes their profile.
+
+    :param directory: Directory receiving the profiles (profiling is disabled
+                      if missing)
+    :type directory: str
+
+    :param sampling: Ratio of the requests to profile (between 0 and 1)
+    :type sampling: float
+
+    :param keep: Maximum number of profiles kept in the directory
+    :type keep: int
+
+    :param logger: Logging function (see
+                   :func:`burpui.misc.backend.interface.BUIbackend._logger`)
+    :type logger: callable
+    """
+
+    def __init__(self, directory=None, sampling=0, keep=100, logger=None):
+        self.directory = None
+        self.sampling = 0
+        self.keep = keep
+        self.logger = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.configure(directory, sampling, keep, logger)
+
+    def configure(self, directory=None, sampling=None, keep=None, logger=None):
+        if logger is not None:
+            self.logger = logger
+        if sampling is not None:
+            self.sampling = max(0.0, min(1.0, float(sampling or 0)))
+        if keep is not None:
+            self.keep = keep
+        self.directory = directory or None
+        if self.directory and not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError as exc:
+                self._log('error', "Unable to create the profiles directory '{}': {}".format(self.directory, str(exc)))
+                self.directory = None
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    @property
+    def current(self):
+        """The profile of the current request if any"""
+        return getattr(self.local, 'profile', None)
+
+    def _log(self, level, msg):
+        if self.logger:
+            self.logger(level, msg)
+
+    def start(self, name, force=False):
+        """Start profiling the current request if it was asked for or picked
+        by the sampling rate.
+
+        :param name: Name of the request (the endpoint)
+        :type name: str
+
+        :param force: Profile the request whatever the sampling rate
+        :type force: bool
+
+        :returns: The :class:`burpui.profiling.Profile` or None
+        """
+        if not self.directory or self.current:
+            return None
+        if not force and (not self.sampling or random.random() >= self.sampling):
+            return None
+        # a single profile at a time
+        if not self.lock.acquire(False):
+            return None
+        try:
+            self.local.profile = Profile(name)
+        except Exception:
+            self.lock.release()
+            raise
+        return self.local.profile
+
+    def stop(self):
+        """Stop profiling the current request and write its profile.
+
+        :returns: The path of the profile or None
+        """
+        prof = self.current
+        if not prof:
+            return None
+        self.local.profile = None
+        try:
+            duration = prof.stop()
+        finally:
+            self.lock.release()
+        name = '{}-{}-{}ms-{}.prof'.format(
+            time.strftime('%Y%m%d-%H%M%S', time.localtime(prof.start)),
+            re.sub(r'[^\w.-]+', '_', prof.name or 'unknown').strip('_'),
+            int(duration * 1000),
+            os.getpid()
+        )
+        path = os.path.join(self.directory, name)
+        try:
+            prof.profile.dump_stats(path)
+        except (IOError, OSError) as exc:
+            self._log('error', "Unable to write the profile '{}': {}".format(path, str(exc)))
+            return None
+        self._log('info', 'profile of {} ({:.3f}s): {}'.format(prof.name, duration, path))
+        self._cleanup()
+        return path
+
+    def _cleanup(self):
+        """Remove the oldest profiles"""
+        if not self.keep:
+            return
+        try:
+            profiles = [os.path.join(self.directory, x) for x in os.listdir(self.directory) if x.endswith('.prof')]
+            if len(profiles) <= self.keep:
+                return
+            profiles.sort(key=os.path.getmtime)
+            for path in profiles[:-self.keep]:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def init_app(self, app):
+        """Profile the requests of a :class:`burpui.server.BUIServer`"""
+        from flask import request, g
+        from flask.ext.login import current_user
+
+        def allowed():
+            """The header is honoured for the administrators only"""
+            acl = getattr(app, 'acl', None)
+            return not acl or acl.is_admin(current_user.get_id())
+
+        @app.before_request
+        def start_profile():
+            if not self.enabled:
+                return
+            force = bool(request.headers.get(HEADER)) and allowed()
+            g.profile_forced = force
+            self.start(request.endpoint or request.path, force)
+
+        @app.after_request
+        def stop_profile(response):
+            path = self.stop()
+            if path and getattr(g, 'profile_forced', False):
+                response.headers[HEADER] = os.path.basename(path)
+            return response
+
+        @app.teardown_request
+        def end_profile(exc):
+            # the request failed before reaching after_request
+            self.stop()
+
+
+profiler = Profiler()
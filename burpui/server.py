@@ -30,6 +30,15 @@ g_auth = 'basic'
 g_acl = ''
 g_storage = ''
 g_redis = ''
+g_jobsdir = '/tmp/bui-jobs'
+g_jobsttl = '3600'
+g_serverjobs = '2'
+g_userjobs = '1'
+g_cachesize = '64'
+g_sampling = '0'
+g_slow = '1'
+g_profiledir = ''
+g_profilekeep = '100'
 
 
 class BUIServer(Flask):
@@ -57,7 +66,8 @@ class BUIServer(Flask):
         """
         global g_refresh, g_port, g_bind, g_ssl, g_sslcert, g_sslkey, \
             g_version, g_auth, g_standalone, g_acl, g_liverefresh, g_storage, \
-            g_redis
+            g_redis, g_jobsdir, g_jobsttl, g_serverjobs, g_userjobs, g_cachesize, \
+            g_sampling, g_slow, g_profiledir, g_profilekeep
         self.sslcontext = None
         if not conf:
             conf = self.config['CFG']
@@ -71,7 +81,10 @@ class BUIServer(Flask):
             'sslkey': g_sslkey, 'version': g_version, 'auth': g_auth,
             'standalone': g_standalone, 'acl': g_acl,
             'liverefresh': g_liverefresh, 'storage': g_storage,
-            'redis': g_redis
+            'redis': g_redis, 'tmpdir': g_jobsdir, 'ttl': g_jobsttl,
+            'serverjobs': g_serverjobs, 'userjobs': g_userjobs,
+            'maxsize': g_cachesize, 'sampling': g_sampling, 'slow': g_slow,
+            'directory': g_profiledir, 'keep': g_profilekeep
         }
         config = ConfigParser.ConfigParser(self.defaults)
         with open(conf) as fp:
@@ -178,6 +191,83 @@ class BUIServer(Flask):
                     'Production'
                 )
 
+                # Restoration jobs options
+                self.jobsdir = self._safe_config_get(
+                    config.get,
+                    'tmpdir',
+                    'Restore'
+                )
+                self.jobsttl = self._safe_config_get(
+                    config.getint,
+                    'ttl',
+                    'Restore',
+                    cast=int
+                )
+                self.serverjobs = self._safe_config_get(
+                    config.getint,
+                    'serverjobs',
+                    'Restore',
+                    cast=int
+                )
+                self.userjobs = self._safe_config_get(
+                    config.getint,
+                    'userjobs',
+                    'Restore',
+                    cast=int
+                )
+
+                # Cache options
+                self.cachesize = self._safe_config_get(
+                    config.getint,
+                    'maxsize',
+                    'Cache',
+                    cast=int
+                )
+                self.cachettl = {}
+                if config.has_section('Cache'):
+                    for key in config.options('Cache'):
+                        if key in self.defaults:
+                            continue
+                        try:
+                            self.cachettl[key] = config.getint('Cache', key)
+                        except ValueError:
+                            self.logger.warning(
+                                'Invalid cache timeout for \'{}\''.format(key)
+                            )
+
+                # Tracing options
+                self.sampling = self._safe_config_get(
+                    config.getfloat,
+                    'sampling',
+                    'Tracing',
+                    cast=float
+                )
+                self.slow = self._safe_config_get(
+                    config.getfloat,
+                    'slow',
+                    'Tracing',
+                    cast=float
+                )
+
+                # Profiling options
+                self.profiledir = self._safe_config_get(
+                    config.get,
+                    'directory',
+                    'Profiling'
+                )
+                self.profilesampling = self._safe_config_get(
+                    config.getfloat,
+                    'sampling',
+                    'Profiling',
+                    cast=float
+                )
+                self.profilekeep = self._safe_config_get(
+                    config.getint,
+                    'keep',
+                    'Profiling',
+                    cast=int
+                )
+
             except ConfigParser.NoOptionError as e:
                 self.logger.error(str(e))
 
@@ -219,6 +309,29 @@ class BUIServer(Flask):
             )
             sys.exit(2)
 
+        from .metrics import instrument_backend
+        instrument_backend(self.cli)
+
+        from .tracing import tracer
+        tracer.configure(self.sampling, self.slow, self.cli._logger)
+
+        from .profiling import profiler
+        profiler.configure(
+            self.profiledir,
+            self.profilesampling,
+            self.profilekeep,
+            self.cli._logger
+        )
+
+        from .jobs import RestoreJobs
+        self.jobs = RestoreJobs(
+            self,
+            self.jobsdir or g_jobsdir,
+            self.jobsttl,
+            self.serverjobs,
+            self.userjobs
+        )
+
         self.init = True
 
     def _safe_config_get(self, callback, key, sect='Global', cast=None):
@@ -270,7 +383,9 @@ class BUIServer(Flask):
                 host=self.bind,
                 port=self.port,
                 debug=self.config['DEBUG'],
-                ssl_context=self.sslcontext
+                ssl_context=self.sslcontext,
+                threaded=True
             )
         else:
-            self.run(host=self.bind, port=self.port, debug=self.config['DEBUG'])
+            # the live-monitor streams hold their connection open
+            self.run(host=self.bind, port=self.port, debug=self.config['DEBUG'], threaded=True)
@@ -0,0 +1,146 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.slowlog
+    :platform: Unix
+    :synopsis: Burp-UI slow queries log module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+The burp status queries taking longer than a threshold are written to a
+dedicated log along with the size of the answer, the time spent parsing it
+and the function that sent the query. They are also aggregated per query
+shape so the most expensive kind of queries can be spotted at a glance.
+"""
+import os
+import sys
+import logging
+import threading
+
+from logging.handlers import RotatingFileHandler
+
+from .metrics import query_shape
+
+# the frames of these modules are skipped when looking for the caller
+WRAPPERS = ['burpui.metrics', 'burpui.tracing', __name__]
+
+
+def find_caller():
+    """Returns the function that sent the status query"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name != 'status' and frame.f_globals.get('__name__') not in WRAPPERS:
+            return '{}.{}:{}'.format(
+                frame.f_globals.get('__name__'),
+                code.co_name,
+                frame.f_lineno
+            )
+        frame = frame.f_back
+    return None
+
+
+class SlowLog(object):
+    """The :class:`burpui.slowlog.SlowLog` class records the slow status
+    queries.
+
+    :param threshold: Queries taking longer than this number of seconds are
+                      recorded
+    :type threshold: float
+
+    :param path: Path of the dedicated log file (the queries are only
+                 aggregated if missing)
+    :type path: str
+
+    :param name: Name of the logger
+    :type name: str
+    """
+    # size and number of the rotated log files
+    max_bytes = 1024 * 1024 * 10
+    backup_count = 5
+
+    def __init__(self, threshold=1, path=None, name='burpui.slowlog'):
+        self.threshold = threshold
+        self.path = path
+        self.lock = threading.Lock()
+        # shape -> [count, seconds, max seconds, bytes, last query]
+        self.queries = {}
+        self.logger = None
+        if path:
+            self.logger = logging.getLogger(name)
+            self.logger.propagate = False
+            self.logger.setLevel(logging.INFO)
+            if not any(getattr(x, 'baseFilename', None) == os.path.abspath(path) for x in self.logger.handlers):
+                handler = RotatingFileHandler(path, maxBytes=self.max_bytes, backupCount=self.backup_count)
+                handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s'))
+                self.logger.addHandler(handler)
+
+    def record(self, query, size, duration, parse):
+        """Record a query if it is slow.
+
+        :param query: The status query
+        :type query: str
+
+        :param size: Size of the answer in bytes
+        :type size: int
+
+        :param duration: Time spent in the query (in seconds)
+        :type duration: float
+
+        :param parse: Part of the duration spent parsing the answer
+        :type parse: float
+        """
+        if duration < self.threshold:
+            return
+        shape = query_shape(query)
+        query = query.strip()
+        with self.lock:
+            stats = self.queries.get(shape)
+            if stats is None:
+                stats = self.queries[shape] = [0, 0.0, 0.0, 0, None]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+            stats[3] += size
+            stats[4] = query
+        if self.logger:
+            self.logger.info(
+                '%.3fs query=%r bytes=%d parse=%.3fs caller=%s',
+                duration,
+                query,
+                size,
+                parse,
+                find_caller()
+            )
+
+    def summary(self):
+        """Returns the slow queries aggregated per shape, the most expensive
+        first"""
+        with self.lock:
+            items = [(k, list(v)) for (k, v) in self.queries.items()]
+        ret = []
+        for (shape, (count, seconds, longest, size, last)) in items:
+            ret.append({
+                'shape': shape,
+                'count': count,
+                'seconds': round(seconds, 3),
+                'max': round(longest, 3),
+                'bytes': size,
+                'last': last,
+            })
+        return sorted(ret, key=lambda x: x['seconds'], reverse=True)
+
+
+# the backends of a process share their slow queries log
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def open_slowlog(threshold=1, path=None):
+    """Returns the :class:`burpui.slowlog.SlowLog` recording in *path*,
+    shared by every backend of the process"""
+    key = (threshold, os.path.abspath(path) if path else None)
+    with _shared_lock:
+        slowlog = _shared.get(key)
+        if slowlog is None:
+            slowlog = _shared[key] = SlowLog(threshold, path)
+        return slowlog
@@ -22,7 +22,7 @@ var __date = {
 
 /***
  * _clients: function that retrieve up-to-date informations from the burp server
- * JSON format:
+ * JSON format (the 'clients' part of the response):
  * [
  *   {
  *     "last": "2014-05-12 19:40:02",
@@ -45,9 +45,10 @@ var __date = {
 var _clients_table = $('#table-clients').dataTable( {
 	responsive: true,
 	ajax: {
-		url: '{{ url_for("api.clients_stats", server=server) }}',
+		url: '{{ url_for("api.clients_changes", server=server) }}',
 		dataSrc: function (data) {
-			return data;
+			_clients_version = data.version;
+			return data.clients;
 		},
 		error: myFail,
 	},
@@ -78,11 +79,42 @@ var _clients_table = $('#table-clients').dataTable( {
 	]
 });
 var first = true;
+var _clients_version = undefined;
 
+/***
+ * Only the clients that changed since the last refresh are sent by the server
+ * so we update the matching rows instead of reloading the whole table
+ */
 var _clients = function() {
 	if (first) {
 		first = false;
-	} else {
-		_clients_table.api().ajax.reload( null, false );
+		return;
 	}
+	$.getJSON('{{ url_for("api.clients_changes", server=server) }}', {since: _clients_version}).done(function(data) {
+		var table = _clients_table.api();
+		if (data.full) {
+			table.clear();
+			table.rows.add(data.clients);
+		} else {
+			$.each(data.clients, function(i, c) {
+				var indexes = table.rows(function(idx, d, node) {
+					return d.name == c.name;
+				}).indexes();
+				if (indexes.length > 0) {
+					$.each(indexes, function(j, idx) {
+						table.row(idx).data(c);
+					});
+				} else {
+					table.row.add(c);
+				}
+			});
+			if (data.removed.length > 0) {
+				table.rows(function(idx, d, node) {
+					return $.inArray(d.name, data.removed) != -1;
+				}).remove();
+			}
+		}
+		table.draw(false);
+		_clients_version = data.version;
+	}).fail(myFail);
 };
@@ -2,16 +2,21 @@
 {% if config.STANDALONE -%}
 	{% if cname -%}
 var counters = '{{ url_for("api.counters", name=cname) }}';
+var stream = '{{ url_for("api.live_stream", name=cname) }}';
 	{% else -%}
 var counters = '{{ url_for("api.live") }}';
+var stream = '{{ url_for("api.live_stream") }}';
 	{% endif -%}
 {% else -%}
 	{% if cname -%}
 var counters = '{{ url_for("api.counters", name=cname, server=server) }}';
+var stream = '{{ url_for("api.live_stream", name=cname, server=server) }}';
 	{% elif server -%}
 var counters = '{{ url_for("api.live", server=server) }}';
+var stream = '{{ url_for("api.live_stream", server=server) }}';
 	{% else -%}
 var counters = '{{ url_for("api.live") }}';
+var stream = '{{ url_for("api.live_stream") }}';
 	{% endif -%}
 {% endif -%}
 
@@ -42,27 +47,37 @@ app.filter('bytes_human', [function() {
 app.controller('LiveCtrl', function($scope, $http, $interval) {
 	$scope.clients = [];
 	var timer;
+	var source;
 
 	$scope.stopTimer = function() {
-		if (angular.isDefined(stop)) {
-			$interval.cancel(stop);
-			stop = undefined;
+		if (angular.isDefined(timer)) {
+			$interval.cancel(timer);
+			timer = undefined;
+		}
+		if (angular.isDefined(source)) {
+			source.close();
+			source = undefined;
+		}
+	};
+
+	$scope.update = function(data) {
+		if (angular.isArray(data)) {
+			$scope.clients = data;
+		} else {
+			$scope.clients = [];
+			$scope.clients.push(data);
+		}
+		if ($scope.clients.length == 0) {
+			$scope.stopTimer();
+			$http.post('{{ url_for("api.alert") }}', {'message': 'No more backup running'});
+			document.location = '{{ url_for("view.home") }}';
 		}
 	};
 
 	$scope.load = function() {
 		$http.get(counters)
 		.success(function(data, status, headers, config) {
-			if (angular.isArray(data)) {
-				$scope.clients = data;
-			} else {
-				$scope.clients = [];
-				$scope.clients.push(data);
-			}
-			if ($scope.clients.length == 0) {
-				$http.post('{{ url_for("api.alert") }}', {'message': 'No more backup running'});
-				document.location = '{{ url_for("view.home") }}';
-			}
+			$scope.update(data);
 		})
 		.error(function(data, status, headers, config) {
 			$scope.stopTimer();
@@ -78,9 +93,32 @@ app.controller('LiveCtrl', function($scope, $http, $interval) {
 		$scope.load();
 	};
 
-	timer = $interval(function() {
+	$scope.poll = function() {
+		timer = $interval(function() {
+			$scope.load();
+		}, {{ config.LIVEREFRESH * 1000 }});
 		$scope.load();
-	}, {{ config.LIVEREFRESH * 1000 }});
+	};
 
-	$scope.load();
+	/***
+	 * The server pushes the counters as soon as they are sampled. We only fall
+	 * back to polling when the browser does not support Server-Sent Events or
+	 * when the stream cannot be established.
+	 */
+	if (window.EventSource) {
+		source = new EventSource(stream);
+		source.onmessage = function(e) {
+			$scope.$apply(function() {
+				$scope.update(JSON.parse(e.data));
+			});
+		};
+		source.onerror = function(e) {
+			if (source && source.readyState == EventSource.CLOSED) {
+				source = undefined;
+				$scope.poll();
+			}
+		};
+	} else {
+		$scope.poll();
+	}
 });
@@ -6,21 +6,28 @@
 
 /***
  * _servers: function that retrieve up-to-date informations from the burp server
+ * Every server is summarized by the server in a single request: servers that
+ * did not answer in time are shown as warnings, unreachable ones as dangers.
  *  The JSON is then parsed into a table
  */
+var __server_status = {
+	'timeout': 'warning',
+	'error': 'danger',
+};
+
 var _servers_table = $('#table-servers').dataTable( {
 	responsive: true,
 	ajax: {
-		url: '{{ url_for("api.servers_stats") }}',
+		url: '{{ url_for("api.summary") }}',
 		dataSrc: function (data) {
-			return data;
+			return data.servers;
 		},
 		error: myFail,
 	},
 	destroy: true,
 	rowCallback: function( row, data ) {
-		if (!data.alive) {
-			row.className += ' danger';
+		if (__server_status[data.status] != undefined) {
+			row.className += ' '+__server_status[data.status];
 		}
 		row.className += ' clickable';
 	},
@@ -33,13 +40,35 @@ var _servers_table = $('#table-servers').dataTable( {
 				return '<a href="'+href+'" style="color: inherit; text-decoration: inherit;">'+data.name+'</a>';
 			}
 		},
-		{ data: 'clients' },
+		{ data: null, render: function ( data, type, row ) {
+				if (data.clients == null) {
+					return '-';
+				}
+				return data.clients;
+			}
+		},
+		{ data: null, render: function ( data, type, row ) {
+				if (data.running == null) {
+					return '-';
+				}
+				return data.running.length;
+			}
+		},
+		{ data: null, render: function ( data, type, row ) {
+				if (data.crashed == null) {
+					return '-';
+				}
+				return data.crashed.length;
+			}
+		},
 		{ data: null, render: function (data, type, row ) {
 				glyph = 'glyphicon-ok';
-				if (!data.alive) {
+				if (data.status == 'timeout') {
+					glyph = 'glyphicon-time';
+				} else if (!data.alive) {
 					glyph = 'glyphicon-remove';
 				}
-				return '<span class="glyphicon '+glyph+'"></span>';
+				return '<span class="glyphicon '+glyph+'" title="'+(data.error || '')+'"></span>';
 			}
 		}
 	]
@@ -0,0 +1,185 @@
+# -*- coding: utf8 -*-
+"""
+.. module:: burpui.tracing
+    :platform: Unix
+    :synopsis: Burp-UI tracing module.
+
+.. moduleauthor:: Ziirish <ziirish@ziirish.info>
+
+A trace follows a request from the moment it enters ``Burp-UI`` to the moment
+the answer is sent back. It is made of spans recording the time spent in the
+backend calls, the status queries, the agents and the subprocesses.
+
+The trace id is sent to the agents along with the requests so their own
+spans can be matched with the ones of the server.
+
+When a request is not traced, opening a span only costs a thread-local lookup.
+"""
+import time
+import uuid
+import random
+import threading
+
+
+class Span(object):
+    """Context manager recording a span of the current trace"""
+    __slots__ = ('trace', 'name', 'detail', 'start')
+
+    def __init__(self, trace, name, detail=None):
+        self.trace = trace
+        self.name = name
+        self.detail = detail
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        self.trace.depth += 1
+        return self
+
+    def __exit__(self, *args):
+        self.trace.depth -= 1
+        self.trace.add(self.name, self.start, time.time() - self.start, self.detail)
+        return False
+
+
+class NoSpan(object):
+    """Span used when the current request is not traced"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NOSPAN = NoSpan()
+
+
+class Trace(object):
+    """The spans of a request
+
+    :param tid: Trace id
+    :type tid: str
+
+    :param name: What is traced (the request path for instance)
+    :type name: str
+
+    :param start: When the request started (defaults to now)
+    :type start: float
+    """
+
+    def __init__(self, tid=None, name=None, start=None):
+        self.id = tid or uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = start or time.time()
+        self.duration = None
+        self.depth = 0
+        # (name, start offset, duration, depth, detail) in order of completion
+        self.spans = []
+
+    def add(self, name, start, duration, detail=None):
+        """Record a span that already happened"""
+        self.spans.append((name, start - self.start, duration, self.depth, detail))
+
+    def finish(self):
+        self.duration = time.time() - self.start
+
+    def breakdown(self):
+        """Returns the spans ordered by start time"""
+        return sorted(self.spans, key=lambda x: (x[1], x[3]))
+
+    def format(self):
+        """Human readable breakdown of the trace"""
+        lines = ['trace {} {}: {:.1f}ms'.format(self.id, self.name or '', (self.duration or 0) * 1000)]
+        for (name, offset, duration, depth, detail) in self.breakdown():
+            lines.append('{}+{:.1f}ms {:.1f}ms {}{}'.format(
+                '  ' * (depth + 1),
+                offset * 1000,
+                duration * 1000,
+                name,
+                ' ({})'.format(detail) if detail else ''
+            ))
+        return '\n'.join(lines)
+
+    def server_timing(self):
+        """Value of a ``Server-Timing`` header describing the spans"""
+        ret = []
+        for (i, (name, _, duration, _, detail)) in enumerate(self.breakdown()):
+            desc = name if not detail else '{} {}'.format(name, detail)
+            ret.append('s{};desc="{}";dur={:.1f}'.format(
+                i,
+                desc.replace('"', "'").replace('\n', ' ')[:64],
+                duration * 1000
+            ))
+        return ', '.join(ret)
+
+
+class Tracer(object):
+    """The :class:`burpui.tracing.Tracer` class keeps track of the trace of
+    the current thread (or greenlet when running under gunicorn).
+
+    :param sampling: Fraction of the requests to trace (0 disables tracing)
+    :type sampling: float
+
+    :param slow: Traces longer than this number of seconds are logged
+    :type slow: float
+
+    :param logger: Callable used to log the slow traces
+    :type logger: callable
+    """
+
+    def __init__(self, sampling=0, slow=1, logger=None):
+        self.local = threading.local()
+        self.configure(sampling, slow, logger)
+
+    def configure(self, sampling=0, slow=1, logger=None):
+        self.sampling = sampling or 0
+        self.slow = slow
+        self.logger = logger
+
+    @property
+    def current(self):
+        """The trace of the current request if any"""
+        return getattr(self.local, 'trace', None)
+
+    def begin(self, tid=None, name=None, force=False, start=None):
+        """Start tracing the current request if it is sampled.
+
+        :param tid: Id of the trace (generated if missing)
+        :type tid: str
+
+        :param force: Trace the request whatever the sampling rate
+        :type force: bool
+
+        :param start: When the request started (defaults to now)
+        :type start: float
+
+        :returns: The new trace or None
+        """
+        trace = None
+        if force or (self.sampling and random.random() < self.sampling):
+            trace = Trace(tid, name, start)
+        self.local.trace = trace
+        return trace
+
+    def end(self):
+        """Stop tracing the current request and log it if it is slow"""
+        trace = self.current
+        if trace is None:
+            return None
+        self.local.trace = None
+        trace.finish()
+        if self.logger and self.slow is not None and trace.duration >= self.slow:
+            self.logger('debug', 'slow ' + trace.format())
+        return trace
+
+    def span(self, name, detail=None):
+        """Returns a context manager recording a span in the current trace"""
+        trace = getattr(self.local, 'trace', None)
+        if trace is None:
+            return NOSPAN
+        return Span(trace, name, detail)
+
+
+tracer = Tracer()
@@ -7,14 +7,28 @@
 .. moduleauthor:: Ziirish <ziirish@ziirish.info>
 
 """
+import os
+import bz2
+import json
+import atexit
+import shutil
+import hashlib
+import tempfile
+import threading
 import math
+import stat
+import time
+import zlib
 import string
+import struct
 import sys
 import zipfile
 import tarfile
 import logging
 
-from inspect import currentframe, getouterframes
+from collections import OrderedDict
+
+from .exceptions import BUIserverException
 
 if sys.version_info >= (3, 0):
     long = int  # pragma: no cover
@@ -71,102 +85,634 @@ class human_readable(long):
         return "{0:{1}}".format(t, width) if width != "" else t
 
 
-if sys.version_info >= (3, 0):  # pragma: no cover
-    class BUIlogger(logging.Logger):
-        padding = 0
-        """Logger class for more convenience"""
-        def makeRecord(self, name, level, fn, lno, msg, args, exc_info, func=None, extra=None, sinfo=None):
-            """
-            Try to guess where was call the function
-            """
-            cf = currentframe()
-            caller = getouterframes(cf)
-            cpt = 0
-            size = len(caller)
-            me = __file__
-            if me.endswith('.pyc'):
-                me = me[:-1]
-            # It's easy to get the _logger parent function because it's the
-            # following frame
-            while cpt < size - 1:
-                (_, filename, _, function_name, _, _) = caller[cpt]
-                if function_name == '_logger' and filename == me:
-                    cpt += 1
-                    break
-                cpt += 1
-            cpt += self.padding
-            (frame, filename, line_number, function_name, lines, index) = caller[cpt]
-            return super(BUIlogger, self).makeRecord(name, level, filename, line_number, msg, args, exc_info, func=function_name, extra=extra, sinfo=sinfo)
-else:
-    class BUIlogger(logging.Logger):
-        padding = 0
-        """Logger class for more convenience"""
-        def makeRecord(self, name, level, fn, lno, msg, args, exc_info, func=None, extra=None):
-            """Try to guess where was call the function"""
-            cf = currentframe()
-            caller = getouterframes(cf)
-            cpt = 0
-            size = len(caller)
-            me = __file__
-            if me.endswith('.pyc'):
-                me = me[:-1]
-            # It's easy to get the _logger parent function because it's the
-            # following frame
-            while cpt < size - 1:
-                (_, filename, _, function_name, _, _) = caller[cpt]
-                if function_name == '_logger' and filename == me:
-                    cpt += 1
-                    break
-                cpt += 1
-            cpt += self.padding
-            (frame, filename, line_number, function_name, lines, index) = caller[cpt]
-            return super(BUIlogger, self).makeRecord(name, level, filename, line_number, msg, args, exc_info, func=function_name, extra=extra)
-
-
 class BUIlogging(object):
     logger = None
-    monkey = None
     padding = 0
     """Provides a generic logging method for all modules"""
     def _logger(self, level, msg, *args):
         """generic logging method so that the logging is backend-independent"""
-        if self.logger and self.logger.getEffectiveLevel() <= logging.getLevelName(level.upper()):
-            sav = None
-            if not self.monkey:
-                self.monkey = BUIlogger(__name__)
-            # bui-agent overrides the _logger function so we add a padding offset
-            self.monkey.padding = self.padding
-            # dynamically monkey-patch the makeRecord function
-            sav = self.logger.makeRecord
-            self.logger.makeRecord = self.monkey.makeRecord
-            self.logger.log(logging.getLevelName(level.upper()), msg, *args)
-            self.logger.makeRecord = sav
-
-
-class BUIcompress():
-    """Provides a context to generate any kind of archive supported by burp-ui"""
-    def __init__(self, name, archive):  # pragma: no cover
-        self.name = name
-        self.archive = archive
+        if not self.logger:
+            return
+        lvl = logging.getLevelName(level.upper())
+        if not self.logger.isEnabledFor(lvl):
+            return
+        # the record is attributed to the caller of this method. bui-agent
+        # overrides the _logger function so we add a padding offset
+        try:
+            frame = sys._getframe(1 + self.padding)
+            code = frame.f_code
+            caller = (code.co_filename, frame.f_lineno, code.co_name)
+        except ValueError:  # pragma: no cover
+            caller = ('(unknown file)', 0, '(unknown function)')
+        # build the record ourselves rather than patching the shared logger
+        record = self.logger.makeRecord(
+            self.logger.name, lvl, caller[0], caller[1], msg, args, None,
+            func=caller[2]
+        )
+        self.logger.handle(record)
+
+
+# the frames of a streamed archive whose length has this bit set carry the
+# number of files archived so far instead of a chunk of the archive
+FRAME_PROGRESS = 1 << 63
+
+
+class BUIprogress(object):
+    """Iterates over the chunks of an archive while keeping track of the
+    progress of its generation.
+
+    :param func: Function returning the generator of chunks. It receives the
+                 :class:`burpui.utils.BUIprogress` instance so it can update
+                 the ``files`` counter
+    :type func: callable
+
+    :param cleanup: Function called once the archive is complete, failed or
+                    is closed. Unlike the ``finally`` clause of a generator, it
+                    also runs when the archive is closed before its first
+                    chunk is read
+    :type cleanup: callable
+    """
+    def __init__(self, func, cleanup=None):
+        self.files = 0
+        self.bytes = 0
+        self.cleanup = cleanup
+        self.iterator = func(self)
 
-    def __enter__(self):
-        self.arch = None
-        if self.archive == 'zip':
-            self.arch = zipfile.ZipFile(self.name, mode='w', compression=zipfile.ZIP_DEFLATED)
-        elif self.archive == 'tar.gz':
-            self.arch = tarfile.open(self.name, 'w:gz')
-        elif self.archive == 'tar.bz2':
-            self.arch = tarfile.open(self.name, 'w:bz2')
+    def __iter__(self):
         return self
 
-    def __exit__(self, type, value, traceback):
-        self.arch.close()
+    def __next__(self):
+        try:
+            chunk = next(self.iterator)
+        except Exception:
+            # StopIteration included
+            self._cleanup()
+            raise
+        self.bytes += len(chunk)
+        return chunk
+
+    next = __next__
+
+    def close(self):
+        try:
+            if hasattr(self.iterator, 'close'):
+                self.iterator.close()
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        cleanup, self.cleanup = self.cleanup, None
+        if cleanup:
+            cleanup()
+
+
+class BUIarchive(object):
+    """An archive stored by :class:`burpui.utils.BUIarchives`.
+
+    The archive is written by the request that generates it while any number
+    of identical requests may read it at the same time.
+
+    :param path: Path of the archive
+    :type path: str
+    """
+    # seconds without progress after which an unfinished archive is
+    # considered abandoned by the request that generates it
+    timeout = 3600
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.files = 0
+        self.done = False
+        self.failed = False
+        self.updated = time.time()
+        self.cond = threading.Condition()
+        self.fileobj = open(path, 'wb')
+
+    @property
+    def abandoned(self):
+        return not self.done and time.time() - self.updated > self.timeout
+
+    def write(self, chunk):
+        self.fileobj.write(chunk)
+        self.fileobj.flush()
+        with self.cond:
+            self.size += len(chunk)
+            self.updated = time.time()
+            self.cond.notify_all()
+
+    def finish(self, failed=False):
+        self.fileobj.close()
+        with self.cond:
+            self.done = True
+            self.failed = failed
+            self.cond.notify_all()
+
+    def follow(self, progress=None, chunk=65536):
+        """Returns the chunks of the archive as soon as they are written
+
+        :param progress: Progress to update
+        :type progress: :class:`burpui.utils.BUIprogress`
+        """
+        try:
+            # the file may be evicted while we read it but we keep our handle
+            fileobj = open(self.path, 'rb')
+        except IOError:
+            raise BUIserverException('The restoration of the original request failed')
+        with fileobj:
+            while True:
+                data = fileobj.read(chunk)
+                if progress is not None:
+                    progress.files = self.files
+                if data:
+                    yield data
+                    continue
+                with self.cond:
+                    if self.failed:
+                        raise BUIserverException('The restoration of the original request failed')
+                    if self.abandoned:
+                        raise BUIserverException('The restoration of the original request was abandoned')
+                    if self.done and fileobj.tell() >= self.size:
+                        break
+                    if fileobj.tell() >= self.size:
+                        self.cond.wait(1)
+
+
+class BUIarchives(object):
+    """Size-bounded LRU store of the restoration archives.
+
+    Identical restorations share the same archive: the first request generates
+    it, the next ones read it while it is being written and once it is
+    finished.
+
+    :param tmpdir: Prefix of the directory where to store the archives
+    :type tmpdir: str
+
+    :param maxsize: Maximum size in bytes of the stored archives
+    :type maxsize: int
+    """
+    def __init__(self, tmpdir='/tmp/bui', maxsize=0):
+        self.tmpdir = tmpdir
+        self.maxsize = maxsize
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.directory = None
+
+    @staticmethod
+    def key(name, backup, files, strip, archive):
+        """Build a key that does not depend on the order of the selected files"""
+        try:
+            flist = json.loads(files)
+            selection = sorted(set(
+                (x['key'], bool(x.get('folder'))) for x in flist['restore']
+            ))
+        except (ValueError, TypeError, KeyError):
+            selection = files
+        try:
+            strip = int(strip or 0)
+        except ValueError:
+            pass
+        data = json.dumps([name, str(backup), selection, strip, archive])
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Returns the archive stored under *key*. If there is no such
+        archive, a new one is created that the caller has to fill.
+
+        :returns: A tuple with the archive and whether the caller owns it
+        """
+        with self.lock:
+            if self.directory is None:
+                # every process has its own directory
+                self.directory = tempfile.mkdtemp(prefix=self.tmpdir)
+                atexit.register(shutil.rmtree, self.directory, True)
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry.abandoned:
+                # the followers give up, the caller generates it again
+                entry.finish(failed=True)
+                self.entries[key] = entry
+                self._remove(key)
+            elif entry is not None:
+                self.entries[key] = entry
+                return entry, False
+            entry = BUIarchive(os.path.join(self.directory, key))
+            self.entries[key] = entry
+            return entry, True
+
+    def commit(self, entry):
+        """The archive is complete, make room for it"""
+        entry.finish()
+        with self.lock:
+            self.size += entry.size
+            for key in list(self.entries.keys()):
+                if self.size <= self.maxsize:
+                    break
+                old = self.entries[key]
+                if not old.done:
+                    continue
+                self._remove(key)
+
+    def discard(self, entry):
+        """The generation of the archive failed"""
+        entry.finish(failed=True)
+        with self.lock:
+            for key, old in list(self.entries.items()):
+                if old is entry:
+                    self._remove(key)
+                    break
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        if entry.done and not entry.failed:
+            self.size -= entry.size
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def open_archives(tmpdir='/tmp/bui', maxsize=0):
+    """Returns the :class:`burpui.utils.BUIarchives` storing in *tmpdir*,
+    shared by every backend of the process"""
+    key = (tmpdir, maxsize)
+    with _archives_lock:
+        archives = _archives.get(key)
+        if archives is None:
+            archives = _archives[key] = BUIarchives(tmpdir, maxsize)
+        return archives
+
+
+# extensions of files that are already compressed
+COMPRESSED_EXTENSIONS = frozenset([
+    '7z', 'apk', 'avi', 'bz2', 'cab', 'deb', 'docx', 'flac', 'gif', 'gz',
+    'jar', 'jpeg', 'jpg', 'lz', 'lz4', 'lzma', 'm4a', 'mkv', 'mov', 'mp3',
+    'mp4', 'odp', 'ods', 'odt', 'ogg', 'png', 'pptx', 'qcow2', 'rar', 'rpm',
+    'tbz2', 'tgz', 'txz', 'vmdk', 'webm', 'webp', 'xlsx', 'xz', 'zip', 'zst',
+])
+
+
+def is_incompressible(path, sample=65536, ratio=0.9):
+    """Guess whether a file is worth compressing. Files with a well-known
+    compressed format are not, otherwise a few samples of the file (beginning,
+    middle and end) are quickly compressed to estimate the gain.
+
+    :param path: Path of the file
+    :type path: str
+
+    :param sample: Number of bytes to test
+    :type sample: int
+
+    :param ratio: Minimal ratio of compressed/original size under which the
+                  file is considered as compressible
+    :type ratio: float
+
+    :returns: True if the file should be stored without compression
+    """
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    if ext in COMPRESSED_EXTENSIONS:
+        return True
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as fileobj:
+            if size <= sample:
+                data = fileobj.read()
+            else:
+                part = sample // 3
+                data = b''
+                for pos in [0, (size - part) // 2, size - part]:
+                    fileobj.seek(pos)
+                    data += fileobj.read(part)
+    except (IOError, OSError):
+        return False
+    # not worth the guess
+    if len(data) < 512:
+        return False
+    return len(zlib.compress(data, 1)) > len(data) * ratio
+
+
+class BUIstream(object):
+    """Generates an archive on the fly.
+
+    The archive is never written on disk: every call returns a generator of
+    chunks that can be sent right away to the client.
+
+    Example::
+
+        arch = BUIstream('zip')
+        for path, arcname in files:
+            for chunk in arch.add(path, arcname):
+                send(chunk)
+        for chunk in arch.close():
+            send(chunk)
+
+    The ``zip`` format compresses every file on its own so the files that are
+    already compressed or that do not seem compressible are stored as is. The
+    ``zip-stored`` format never compresses the files and the ``tar`` format
+    is not compressed at all.
+
+    :param archive: Format of the archive (zip, zip-stored, tar, tar.gz or
+                    tar.bz2)
+    :type archive: str
+
+    :param chunk: Size of the generated chunks
+    :type chunk: int
+
+    :param level: Compression level from 0 (no compression) to 9 (best
+                  compression). Defaults to 6 for zip and to 9 for tar.gz and
+                  tar.bz2
+    :type level: int
+    """
+    # supported formats
+    formats = ['zip', 'zip-stored', 'tar', 'tar.gz', 'tar.bz2']
+    # we use a zip64 entry when the compressed data may not fit on 32 bits
+    zip64_limit = (1 << 31) - 1
+
+    def __init__(self, archive='zip', chunk=65536, level=None):
+        if archive not in self.formats:
+            raise ValueError('Unsupported archive format: {}'.format(archive))
+        self.archive = archive
+        self.chunk = chunk
+        self.level = level
+        self.offset = 0
+        self.entries = []
+        self.buf = []
+        self.buflen = 0
+        self.compressor = None
+        if level is None:
+            level = 9
+        if archive == 'tar.gz':
+            # wbits = 16 + MAX_WBITS means a gzip header and trailer
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif archive == 'tar.bz2':
+            self.compressor = bz2.BZ2Compressor(max(1, min(level, 9)))
+
+    def _write(self, data):
+        """Buffer the raw archive data"""
+        # offset within the uncompressed archive
+        self.offset += len(data)
+        if self.compressor:
+            data = self.compressor.compress(data)
+        if data:
+            self.buf.append(data)
+            self.buflen += len(data)
+
+    def _flush(self, force=False):
+        """Returns the buffered data once there is enough of it"""
+        if not self.buflen or (not force and self.buflen < self.chunk):
+            return None
+        data = b''.join(self.buf)
+        self.buf = []
+        self.buflen = 0
+        return data
+
+    def add(self, path, arcname):
+        """Add a file to the archive.
+
+        :param path: Path of the file to add
+        :type path: str
+
+        :param arcname: Name of the file within the archive
+        :type arcname: str
+
+        :returns: A generator of chunks
+        """
+        if self.archive in ['zip', 'zip-stored']:
+            gen = self._zip_add(path, arcname)
+        else:
+            gen = self._tar_add(path, arcname)
+        for _ in gen:
+            data = self._flush()
+            if data:
+                yield data
+
+    def close(self):
+        """Finalize the archive.
+
+        :returns: A generator of chunks
+        """
+        if self.archive in ['zip', 'zip-stored']:
+            self._zip_close()
+        else:
+            self._tar_close()
+        if self.compressor:
+            data = self.compressor.flush()
+            if data:
+                self.buf.append(data)
+                self.buflen += len(data)
+        data = self._flush(True)
+        if data:
+            yield data
+
+    def _read(self, fileobj):
+        """Read the file chunk by chunk"""
+        while True:
+            data = fileobj.read(self.chunk)
+            if not data:
+                break
+            yield data
+
+    def _zip_add(self, path, arcname):
+        st = os.stat(path)
+        if isinstance(arcname, bytes):
+            arcname = arcname.decode('utf-8')
+        name = arcname.encode('utf-8')
+        mtime = time.localtime(st.st_mtime)
+        if mtime[0] < 1980:
+            mtime = (1980, 1, 1, 0, 0, 0)
+        dosdate = (mtime[0] - 1980) << 9 | mtime[1] << 5 | mtime[2]
+        dostime = mtime[3] << 11 | mtime[4] << 5 | (mtime[5] // 2)
+        if self.archive == 'zip-stored' or self.level == 0 or is_incompressible(path):
+            gen = self._zip_stored(path, name, st, dostime, dosdate)
+        else:
+            gen = self._zip_deflated(path, name, st, dostime, dosdate)
+        for _ in gen:
+            yield
+
+    def _zip_stored(self, path, name, st, dostime, dosdate):
+        # The data is not altered so we know the sizes in advance. Computing
+        # the crc first only costs a read of the file and saves us a data
+        # descriptor (that some tools do not like with stored entries)
+        crc = 0
+        with open(path, 'rb') as fileobj:
+            for data in self._read(fileobj):
+                crc = zlib.crc32(data, crc)
+        crc &= 0xffffffff
+        size = st.st_size
+        # bit 11: utf-8 file name
+        flags = 0x800
+        version = 20
+        extra = b''
+        header_size = size
+        if size > 0xfffffffe:
+            version = 45
+            extra = struct.pack('<HHQQ', 1, 16, size, size)
+            header_size = 0xffffffff
+        offset = self.offset
+        self._write(struct.pack(
+            '<4s2B4HL2L2H',
+            b'PK\x03\x04', version, 0, flags, zipfile.ZIP_STORED,
+            dostime, dosdate, crc, header_size, header_size, len(name), len(extra)
+        ) + name + extra)
+        yield
+
+        written = 0
+        with open(path, 'rb') as fileobj:
+            for data in self._read(fileobj):
+                # never write more than what the header announced
+                data = data[:size - written]
+                written += len(data)
+                self._write(data)
+                yield
+                if written >= size:
+                    break
+        if written < size:
+            # the file shrunk while we were reading it
+            self._write(b'\0' * (size - written))
+        self.entries.append((
+            name, version, flags, zipfile.ZIP_STORED, dostime, dosdate, crc,
+            size, size, st.st_mode, offset
+        ))
+        yield
+
+    def _zip_deflated(self, path, name, st, dostime, dosdate):
+        # bit 3: sizes and crc follow the data, bit 11: utf-8 file name
+        flags = 0x08 | 0x800
+        zip64 = st.st_size > self.zip64_limit
+        version = 45 if zip64 else 20
+        extra = b''
+        size = 0
+        if zip64:
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            size = 0xffffffff
+        offset = self.offset
+        self._write(struct.pack(
+            '<4s2B4HL2L2H',
+            b'PK\x03\x04', version, 0, flags, zipfile.ZIP_DEFLATED,
+            dostime, dosdate, 0, size, size, len(name), len(extra)
+        ) + name + extra)
+        yield
+
+        crc = 0
+        file_size = 0
+        compress_size = 0
+        level = self.level if self.level is not None else zlib.Z_DEFAULT_COMPRESSION
+        comp = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        with open(path, 'rb') as fileobj:
+            for data in self._read(fileobj):
+                file_size += len(data)
+                crc = zlib.crc32(data, crc)
+                data = comp.compress(data)
+                compress_size += len(data)
+                self._write(data)
+                yield
+        data = comp.flush()
+        compress_size += len(data)
+        crc &= 0xffffffff
+        if zip64:
+            data += struct.pack('<4sLQQ', b'PK\x07\x08', crc, compress_size, file_size)
+        else:
+            data += struct.pack('<4sLLL', b'PK\x07\x08', crc, compress_size, file_size)
+        self._write(data)
+        self.entries.append((
+            name, version, flags, zipfile.ZIP_DEFLATED, dostime, dosdate, crc,
+            compress_size, file_size, st.st_mode, offset
+        ))
+        yield
+
+    def _zip_close(self):
+        start = self.offset
+        for (name, version, flags, method, dostime, dosdate, crc, compress_size, file_size, mode, offset) in self.entries:
+            extra = []
+            if file_size > 0xfffffffe or compress_size > 0xfffffffe:
+                extra += [file_size, compress_size]
+                file_size = compress_size = 0xffffffff
+            if offset > 0xfffffffe:
+                extra.append(offset)
+                offset = 0xffffffff
+            if extra:
+                version = 45
+                extra = struct.pack('<HH' + 'Q' * len(extra), 1, 8 * len(extra), *extra)
+            else:
+                extra = b''
+            self._write(struct.pack(
+                '<4s4B4HL2L5H2L',
+                b'PK\x01\x02', version, 3, version, 0, flags,
+                method, dostime, dosdate, crc, compress_size,
+                file_size, len(name), len(extra), 0, 0, 0,
+                (mode & 0xffff) << 16, offset
+            ) + name + extra)
+        count = len(self.entries)
+        size = self.offset - start
+        if count > 0xfffe or size > 0xfffffffe or start > 0xfffffffe:
+            end64 = self.offset
+            self._write(struct.pack(
+                '<4sQ2H2L4Q', b'PK\x06\x06', 44, 45, 45, 0, 0,
+                count, count, size, start
+            ))
+            self._write(struct.pack('<4sLQL', b'PK\x06\x07', 0, end64, 1))
+        self._write(struct.pack(
+            '<4s4H2LH', b'PK\x05\x06', 0, 0,
+            min(count, 0xffff), min(count, 0xffff),
+            min(size, 0xffffffff), min(start, 0xffffffff), 0
+        ))
+
+    def _tar_add(self, path, arcname):
+        st = os.lstat(path)
+        info = tarfile.TarInfo(arcname)
+        info.mtime = st.st_mtime
+        info.mode = stat.S_IMODE(st.st_mode)
+        info.uid = st.st_uid
+        info.gid = st.st_gid
+        try:
+            import pwd
+            info.uname = pwd.getpwuid(st.st_uid)[0]
+        except (ImportError, KeyError):
+            pass
+        try:
+            import grp
+            info.gname = grp.getgrgid(st.st_gid)[0]
+        except (ImportError, KeyError):
+            pass
+        if stat.S_ISLNK(st.st_mode):
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.readlink(path)
+            info.size = 0
+        else:
+            info.size = st.st_size
+        self._write(info.tobuf(tarfile.GNU_FORMAT, 'utf-8'))
+        yield
+        if not info.size:
+            return
+        written = 0
+        with open(path, 'rb') as fileobj:
+            for data in self._read(fileobj):
+                # never write more than what the header announced
+                data = data[:info.size - written]
+                written += len(data)
+                self._write(data)
+                yield
+                if written >= info.size:
+                    break
+        if written < info.size:
+            # the file shrunk while we were reading it
+            self._write(tarfile.NUL * (info.size - written))
+        remainder = info.size % tarfile.BLOCKSIZE
+        if remainder:
+            self._write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+        yield
 
-    def append(self, path, arcname):
-        if self.archive == 'zip':
-            self.arch.write(path, arcname)
-        elif self.archive in ['tar.gz', 'tar.bz2']:
-            self.arch.add(path, arcname=arcname, recursive=False)
+    def _tar_close(self):
+        # end of archive marker
+        self._write(tarfile.NUL * (tarfile.BLOCKSIZE * 2))
+        # tar archives are made of records
+        remainder = self.offset % tarfile.RECORDSIZE
+        if remainder:
+            self._write(tarfile.NUL * (tarfile.RECORDSIZE - remainder))
 
 
 def basic_login_from_request(request, app):
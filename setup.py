@@ -210,6 +210,7 @@ setup(
         (os.path.join(contrib, 'debian'), ['contrib/debian/init.sh']),
         (os.path.join(contrib, 'gunicorn.d'), ['contrib/gunicorn.d/burp-ui']),
     ],
+    python_requires='>=2.7, !=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*, !=3.4.*',
     install_requires=requires,
     extras_require={
         'ldap_authentication': ['ldap3'],
@@ -227,7 +228,7 @@ setup(
         'Operating System :: POSIX :: Linux',
         'Programming Language :: Python',
         'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3.5',
         'Topic :: System :: Archiving :: Backup',
         'Topic :: System :: Monitoring',
     ],
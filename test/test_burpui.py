@@ -177,6 +177,197 @@ class BurpuiAPITestCase(TestCase):
         response = self.client.get(url_for('api.running_backup'))
         self.assertEquals(response.json, dict(running=False))
 
+    def test_running_etag(self):
+        response = self.client.get(url_for('api.running_backup'))
+        etag = response.headers.get('ETag')
+        self.assertTrue(etag)
+        response = self.client.get(url_for('api.running_backup'), headers={'If-None-Match': etag})
+        self.assertStatus(response, 304)
+        response = self.client.get(url_for('api.running_backup'), headers={'If-None-Match': '"nope"'})
+        self.assertEquals(response.json, dict(running=False))
+
+    def test_counters_single_query(self):
+        from burpui.api import api
+        queries = []
+
+        def status(query='\n', agent=None):
+            queries.append(query)
+            if query == '\n':
+                return ['toto\t2\tr\t2\t0', 'tata\t2\ti\t0']
+            if query == 'c:toto\n':
+                return ['toto\t2\tr\t2\t12/0/0/0/12']
+            return []
+
+        self.bui.cli.status = status
+        with self.bui.app_context():
+            api.cache.clear()
+        # the first request builds the shared index of running clients
+        response = self.client.get(url_for('api.counters', name='toto'))
+        self.assert200(response)
+        self.assertEquals(response.json['counters']['Total'], [12, 0, 0, 0, 12])
+        # then following a client only costs the query of its counters
+        del queries[:]
+        response = self.client.get(url_for('api.counters', name='toto'))
+        self.assert200(response)
+        self.assertEquals(queries, ['c:toto\n'])
+        # and clients that are not running do not cost anything
+        del queries[:]
+        response = self.client.get(url_for('api.counters', name='tata'))
+        self.assert404(response)
+        self.assertEquals(queries, [])
+
+    def test_summary(self):
+        import time
+        from burpui.api import api
+
+        def status(query='\n', agent=None):
+            if query == '\n':
+                return ['toto\t2\tr\t2\t0', 'tata\t2\ti\t0', 'titi\t2\tc\t0']
+            return ['toto\t2\tr\t2\t12/0/0/0/12']
+
+        self.bui.cli.status = status
+        with self.bui.app_context():
+            api.cache.clear()
+        response = self.client.get(url_for('api.summary'))
+        self.assert200(response)
+        self.assertTrue(response.json['complete'])
+        server = response.json['servers'][0]
+        self.assertEquals(server['status'], 'ok')
+        self.assertEquals(server['clients'], 3)
+        self.assertEquals(server['running'], ['toto'])
+        self.assertEquals(server['crashed'], ['titi'])
+        self.assertEquals(response.json['totals']['ages']['never'], 2)
+        self.assertEquals(response.json['totals']['ages']['day'], 1)
+
+        def slow(query='\n', agent=None):
+            time.sleep(1)
+            return []
+
+        self.bui.cli.status = slow
+        with self.bui.app_context():
+            api.cache.clear()
+        # partial results are returned once the deadline is over
+        response = self.client.get(url_for('api.summary', timeout=0.2))
+        self.assert200(response)
+        self.assertFalse(response.json['complete'])
+        self.assertEquals(response.json['servers'][0]['status'], 'timeout')
+        self.assertEquals(response.json['totals']['clients'], 0)
+
+    def test_metrics(self):
+        self.client.get(url_for('api.clients_stats'))
+        response = self.client.get(url_for('api.metrics'))
+        self.assert200(response)
+        self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+        body = response.data.decode('utf-8')
+        self.assertIn('burpui_api_request_seconds_bucket{endpoint="api.clients_stats",le="+Inf"}', body)
+        self.assertIn('burpui_backend_errors_total{method="get_all_clients"}', body)
+        response = self.client.get(url_for('api.metrics', server='nope'))
+        self.assert404(response)
+
+    def test_slow_queries(self):
+        response = self.client.get(url_for('api.slow_queries'))
+        self.assert200(response)
+        self.assertEqual(json.loads(response.data.decode('utf-8')), {'threshold': 1.0, 'queries': []})
+
+    def test_trace_header(self):
+        response = self.client.get(url_for('api.clients_stats'), headers={'X-Trace-Id': 'abcd'})
+        self.assertNotIn('X-Trace-Id', response.headers)
+        self.bui.debug = True
+        try:
+            response = self.client.get(url_for('api.clients_stats'), headers={'X-Trace-Id': 'abcd'})
+        finally:
+            self.bui.debug = False
+        self.assertEqual(response.headers['X-Trace-Id'], 'abcd')
+        self.assertIn('desc="backend.get_all_clients"', response.headers['Server-Timing'])
+
+    def test_profile_header(self):
+        import shutil
+        from burpui.profiling import profiler
+
+        response = self.client.get(url_for('api.about'), headers={'X-Profile': '1'})
+        self.assertNotIn('X-Profile', response.headers)
+        tmpdir = tempfile.mkdtemp()
+        profiler.configure(tmpdir)
+        try:
+            response = self.client.get(url_for('api.about'), headers={'X-Profile': '1'})
+            self.assertEqual(os.listdir(tmpdir), [response.headers['X-Profile']])
+            self.assertIn('api.about', response.headers['X-Profile'])
+            # a failing request is profiled too
+            response = self.client.get(url_for('api.clients_stats'), headers={'X-Profile': '1'})
+            self.assert500(response)
+            self.assertEqual(len(os.listdir(tmpdir)), 2)
+            self.assertIsNone(profiler.current)
+        finally:
+            profiler.configure(None)
+            shutil.rmtree(tmpdir)
+
+    def test_clients_list(self):
+        import shutil
+        from burpui.misc.parser.burp1 import Parser
+
+        tmpdir = tempfile.mkdtemp()
+        conf = os.path.join(tmpdir, 'burp-server.conf')
+        with open(conf, 'w') as fileobj:
+            fileobj.write('clientconfdir = {}\n'.format(os.path.join(tmpdir, 'clientconfdir')))
+        os.makedirs(os.path.join(tmpdir, 'clientconfdir'))
+        for name in ['web-1', 'web-2', 'db-1']:
+            with open(os.path.join(tmpdir, 'clientconfdir', name), 'w') as fileobj:
+                fileobj.write('password = {}\n'.format(name))
+        parser = self.bui.cli.parser
+        self.bui.cli.parser = Parser(None, conf)
+        try:
+            response = self.client.get(url_for('api.clients_list'))
+            self.assert200(response)
+            result = json.loads(response.data.decode('utf-8'))['result']
+            self.assertEqual(sorted(x['name'] for x in result), ['db-1', 'web-1', 'web-2'])
+            response = self.client.get(url_for('api.clients_list', prefix='web'))
+            result = json.loads(response.data.decode('utf-8'))['result']
+            self.assertEqual(sorted(x['name'] for x in result), ['web-1', 'web-2'])
+            response = self.client.put(url_for('api.new_client'), data={'newclient': 'web-1'})
+            self.assertEqual(response.status_code, 409)
+            response = self.client.put(url_for('api.new_client'), data={'newclient': 'web-3'})
+            self.assertEqual(response.status_code, 201)
+            self.assertTrue(os.path.isfile(os.path.join(tmpdir, 'clientconfdir', 'web-3')))
+        finally:
+            self.bui.cli.parser = parser
+            shutil.rmtree(tmpdir)
+
+    def test_patch_clients(self):
+        import shutil
+        from burpui.misc.parser.burp1 import Parser
+
+        tmpdir = tempfile.mkdtemp()
+        conf = os.path.join(tmpdir, 'burp-server.conf')
+        with open(conf, 'w') as fileobj:
+            fileobj.write('clientconfdir = {}\n'.format(os.path.join(tmpdir, 'clientconfdir')))
+        os.makedirs(os.path.join(tmpdir, 'clientconfdir'))
+        for name in ['web-1', 'web-2', 'db-1']:
+            with open(os.path.join(tmpdir, 'clientconfdir', name), 'w') as fileobj:
+                fileobj.write('password = {}\n'.format(name))
+        parser = self.bui.cli.parser
+        self.bui.cli.parser = Parser(None, conf)
+        try:
+            response = self.client.post(
+                url_for('api.clients_settings'),
+                data=json.dumps({'pattern': 'web-*', 'patch': {'protocol': 'many'}}),
+                content_type='application/json'
+            )
+            self.assert400(response)
+            response = self.client.post(
+                url_for('api.clients_settings'),
+                data=json.dumps({'pattern': 'web-*', 'patch': {'keep': ['7', '4']}}),
+                content_type='application/json'
+            )
+            self.assert200(response)
+            results = json.loads(response.data.decode('utf-8'))['results']
+            self.assertEqual([x['name'] for x in results[0]['clients']], ['web-1', 'web-2'])
+            self.assertEqual([x['notif'][0] for x in results[0]['clients']], [0, 0])
+            with open(os.path.join(tmpdir, 'clientconfdir', 'db-1')) as fileobj:
+                self.assertNotIn('keep', fileobj.read())
+        finally:
+            self.bui.cli.parser = parser
+            shutil.rmtree(tmpdir)
+
     def test_client_tree(self):
         response = self.client.get(url_for('api.client_tree', name='toto', backup=1))
         self.assertEquals(json.loads(response.data.decode('utf-8'))['message'], u'Cannot contact burp server at 127.0.0.1:9999')
@@ -341,6 +532,1405 @@ class BurpuiTestInit(TestCase):
         self.assertRaises(ImportError, BUIinit, conf3, False, None, False, unittest=True)
 
 
+
+class BurpuiAgentHealthTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 8\n')
+
+    def tearDown(self):
+        print ('\nTest 8 Finished!\n')
+
+    def test_circuit_breaker(self):
+        from burpui.misc.backend.multi import AgentHealth
+        health = AgentHealth(failures=2, retry=3600, probe=0)
+        self.assertTrue(health.allow())
+        health.failure('timed out')
+        self.assertEqual(health.state, AgentHealth.CLOSED)
+        health.failure('timed out')
+        self.assertEqual(health.state, AgentHealth.OPEN)
+        self.assertFalse(health.allow())
+        # once the retry delay is elapsed, a single trial is let through
+        health.opened -= 3600
+        self.assertTrue(health.allow())
+        self.assertEqual(health.state, AgentHealth.HALF_OPEN)
+        self.assertFalse(health.allow())
+        health.failure('timed out')
+        self.assertEqual(health.state, AgentHealth.OPEN)
+        health.opened -= 3600
+        self.assertTrue(health.allow())
+        health.success(0.01)
+        self.assertEqual(health.state, AgentHealth.CLOSED)
+        self.assertEqual(health.to_dict()['failures'], 0)
+        self.assertEqual(health.to_dict()['latency'], 10.0)
+
+    def test_last_known_answers(self):
+        from burpui.misc.backend.multi import AgentHealth
+        health = AgentHealth()
+        health.max_known = 2
+        health.remember('a', '[1]')
+        health.remember('b', '[2]')
+        health.remember('c', '[3]')
+        self.assertIsNone(health.recall('a'))
+        self.assertEqual(health.recall('c'), '[3]')
+
+    def test_agent_worker_locks(self):
+        import struct
+        import threading
+        from burpui.agent import AgentTCPHandler
+
+        class Request(object):
+            """Sends a 'RE' request once *ready* is set"""
+            def __init__(self, ready):
+                self.ready = ready
+                self.sent = False
+
+            def setsockopt(self, *args):
+                pass
+
+            def recv(self, length):
+                if not self.sent:
+                    self.sent = True
+                    return struct.pack('!Q', 2)
+                self.ready.wait()
+                return b'RE'
+
+            def close(self):
+                pass
+
+        class Agent(object):
+            password = 'password'
+
+            def _logger(self, *args):
+                pass
+
+        class Server(object):
+            locks = [threading.Lock(), threading.Lock()]
+            clients = ['worker1', 'worker2']
+            agent = Agent()
+
+        server = Server()
+        first = threading.Event()
+        second = threading.Event()
+        second.set()
+        slow = threading.Thread(target=AgentTCPHandler, args=(Request(first), ('::1', 0), server))
+        slow.daemon = True
+        slow.start()
+        # a second request must get the other worker while the first one runs
+        fast = threading.Thread(target=AgentTCPHandler, args=(Request(second), ('::1', 0), server))
+        fast.daemon = True
+        fast.start()
+        fast.join(5)
+        busy = fast.is_alive()
+        first.set()
+        slow.join(5)
+        fast.join(5)
+        self.assertFalse(busy)
+        # every worker is free again
+        for lock in server.locks:
+            self.assertTrue(lock.acquire(False))
+
+
+class BurpuiArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 9\n')
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = {}
+        for name, data in [('text.txt', b'burp-ui ' * 4096),
+                           ('random.bin', os.urandom(70000)),
+                           ('empty', b'')]:
+            path = os.path.join(self.tmpdir, name)
+            with open(path, 'wb') as fileobj:
+                fileobj.write(data)
+            self.files[name] = path
+
+    def tearDown(self):
+        print ('\nTest 9 Finished!\n')
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def generate(self, archive, level=None):
+        from burpui.utils import BUIstream
+        arch = BUIstream(archive, level=level)
+        data = b''
+        for name in sorted(self.files):
+            for chunk in arch.add(self.files[name], name):
+                data += chunk
+        for chunk in arch.close():
+            data += chunk
+        return data
+
+    def test_archive_formats(self):
+        import io
+        import tarfile
+        import zipfile
+        for archive in ['zip', 'zip-stored']:
+            zfh = zipfile.ZipFile(io.BytesIO(self.generate(archive)))
+            self.assertIsNone(zfh.testzip())
+            for name, path in self.files.items():
+                with open(path, 'rb') as fileobj:
+                    self.assertEqual(zfh.read(name), fileobj.read())
+        for archive in ['tar', 'tar.gz', 'tar.bz2']:
+            tfh = tarfile.open(fileobj=io.BytesIO(self.generate(archive, 1)))
+            for name, path in self.files.items():
+                with open(path, 'rb') as fileobj:
+                    self.assertEqual(tfh.extractfile(name).read(), fileobj.read())
+
+    def test_incompressible_entries_are_stored(self):
+        import io
+        import zipfile
+        zfh = zipfile.ZipFile(io.BytesIO(self.generate('zip')))
+        self.assertEqual(zfh.getinfo('text.txt').compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(zfh.getinfo('random.bin').compress_type, zipfile.ZIP_STORED)
+        zfh = zipfile.ZipFile(io.BytesIO(self.generate('zip-stored')))
+        self.assertEqual(zfh.getinfo('text.txt').compress_type, zipfile.ZIP_STORED)
+
+    def test_archives_cache(self):
+        from burpui.utils import BUIarchives
+        store = BUIarchives(os.path.join(self.tmpdir, 'cache'), 25)
+        key = store.key('client', 1, '{"restore":[{"folder":true,"key":"/etc"},{"folder":false,"key":"/a"}]}', '0', 'zip')
+        self.assertEqual(key, store.key('client', '1', '{"restore":[{"folder":false,"key":"/a"},{"folder":true,"key":"/etc"}]}', 0, 'zip'))
+        self.assertNotEqual(key, store.key('client', 1, '{"restore":[{"folder":true,"key":"/etc"}]}', 0, 'zip'))
+        entry, owner = store.get(key)
+        self.assertTrue(owner)
+        entry.write(b'a' * 10)
+        # an identical request joins the running one
+        same, owner = store.get(key)
+        self.assertFalse(owner)
+        reader = same.follow()
+        self.assertEqual(next(reader), b'a' * 10)
+        entry.write(b'b' * 10)
+        store.commit(entry)
+        self.assertEqual(b''.join(reader), b'b' * 10)
+        other, _ = store.get('other')
+        other.write(b'c' * 10)
+        store.commit(other)
+        # the least recently used archive is evicted
+        entry, owner = store.get(key)
+        self.assertTrue(owner)
+        store.discard(entry)
+        self.assertFalse(store.get('other')[1])
+        self.assertEqual(store.size, 10)
+
+    def test_archives_abandoned(self):
+        from burpui.exceptions import BUIserverException
+        from burpui.utils import BUIarchive, open_archives
+        prefix = os.path.join(self.tmpdir, 'cache')
+        store = open_archives(prefix, 25)
+        # every backend of the process shares the same store
+        self.assertIs(store, open_archives(prefix, 25))
+        self.assertIsNot(store, open_archives(prefix, 50))
+        entry, owner = store.get('key')
+        entry.write(b'a' * 10)
+        reader = store.get('key')[0].follow()
+        self.assertEqual(next(reader), b'a' * 10)
+        # the request generating the archive stopped making progress
+        entry.updated -= BUIarchive.timeout + 1
+        self.assertRaises(BUIserverException, next, reader)
+        # and the next identical request generates it again
+        again, owner = store.get('key')
+        self.assertTrue(owner)
+        self.assertIsNot(again, entry)
+        again.write(b'b' * 10)
+        store.commit(again)
+        self.assertEqual(b''.join(store.get('key')[0].follow()), b'b' * 10)
+        # the archive is discarded when its generation is closed before being read
+        from burpui.misc.backend.burp1 import Burp
+        cli = Burp(dummy=True)
+        cli.archives = store
+        cli.compression = None
+        cli.stripbin = '/bin/false'
+
+        def prepare(*args):
+            restored = tempfile.mkdtemp(dir=self.tmpdir)
+            with open(os.path.join(restored, 'file'), 'wb') as fileobj:
+                fileobj.write(b'burp-ui')
+            return restored, None
+
+        cli._prepare_restore = prepare
+        stream, _ = cli.restore_stream('client', 1, '{}', archive='tar')
+        follower, _ = cli.restore_stream('client', 1, '{}', archive='tar')
+        stream.close()
+        self.assertRaises(BUIserverException, list, follower)
+        stream, _ = cli.restore_stream('client', 1, '{}', archive='tar')
+        self.assertTrue(b''.join(stream))
+
+    def test_stream_cleanup(self):
+        import io
+        import tarfile
+        from burpui.metrics import track_restore
+        from burpui.misc.backend.burp1 import Burp
+        cli = Burp(dummy=True)
+        cli.archives = None
+        cli.compression = None
+        cli.stripbin = '/bin/false'
+        restored = os.path.join(self.tmpdir, 'restored')
+
+        def prepare(*args):
+            os.makedirs(restored)
+            with open(os.path.join(restored, 'file'), 'wb') as fileobj:
+                fileobj.write(b'burp-ui')
+            return restored, None
+
+        cli._prepare_restore = prepare
+        # the restored files are removed even if the stream is never read
+        stream, err = cli.restore_stream('client', 1, '{}', archive='tar')
+        self.assertIsNone(err)
+        self.assertTrue(os.path.isdir(restored))
+        stream.close()
+        self.assertFalse(os.path.exists(restored))
+        stream, _ = cli.restore_stream('client', 1, '{}', archive='tar')
+        track_restore(stream, 'stream').close()
+        self.assertFalse(os.path.exists(restored))
+        # and once the archive is complete
+        stream, _ = cli.restore_stream('client', 1, '{}', archive='tar')
+        data = b''.join(track_restore(stream, 'stream'))
+        self.assertFalse(os.path.exists(restored))
+        self.assertEqual(tarfile.open(fileobj=io.BytesIO(data)).extractfile('file').read(), b'burp-ui')
+        self.assertEqual(stream.files, 1)
+
+    def test_agent_frames(self):
+        import socket
+        import struct
+        from burpui.misc.backend.multi import NClient
+        from burpui.utils import BUIprogress, FRAME_PROGRESS
+
+        class FakeApp(object):
+            logger = __import__('logging').getLogger('test')
+
+        cli = NClient(FakeApp(), 'localhost', 10000, 'password', False, 5)
+        agent, sock = socket.socketpair()
+        try:
+            for frame in [struct.pack('!Q', FRAME_PROGRESS | 2), struct.pack('!Q', 3) + b'abc',
+                          struct.pack('!Q', FRAME_PROGRESS | 5), struct.pack('!Q', 4) + b'defg',
+                          struct.pack('!Q', 0)]:
+                agent.sendall(frame)
+            stream = BUIprogress(lambda progress: cli._recv_frames(sock, progress), lambda: cli._release(sock))
+            self.assertEqual(next(stream), b'abc')
+            self.assertEqual(stream.files, 2)
+            self.assertEqual(list(stream), [b'defg'])
+            # the files archived by the agent are reported, not the frames
+            self.assertEqual(stream.files, 5)
+            self.assertEqual(stream.bytes, 7)
+            # the connection is released once the archive is complete
+            self.assertEqual(agent.recv(10), struct.pack('!Q', 2) + b'RE')
+        finally:
+            agent.close()
+            sock.close()
+
+
+class BurpuiRestoreJobsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 10\n')
+        from burpui.jobs import RestoreJobs
+        from burpui.utils import BUIprogress
+
+        def stream(progress):
+            for i in range(3):
+                progress.files += 1
+                yield b'x' * 10
+
+        class FakeCli(object):
+            def restore_stream(self, *args):
+                return BUIprogress(stream), None
+
+            def _logger(self, *args):
+                pass
+
+        class FakeApp(object):
+            cli = FakeCli()
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.jobs = RestoreJobs(FakeApp(), self.tmpdir, 3600, 2, 1)
+
+    def tearDown(self):
+        print ('\nTest 10 Finished!\n')
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def wait(self, jid):
+        import time
+        for _ in range(100):
+            job = self.jobs.get(jid)
+            if job['phase'] not in self.jobs.running:
+                return job
+            time.sleep(0.05)
+        return job
+
+    def test_restore_job(self):
+        job, err = self.jobs.create('toto', 'client', 1, '{}', 0, 'zip', None, None)
+        self.assertIsNone(err)
+        job = self.wait(job['id'])
+        self.assertEqual(job['phase'], 'done')
+        self.assertEqual(job['files'], 3)
+        self.assertEqual(job['bytes'], 30)
+        with open(self.jobs.archive(job['id']), 'rb') as fileobj:
+            self.assertEqual(fileobj.read(), b'x' * 30)
+        self.assertEqual([x['id'] for x in self.jobs.list('toto')], [job['id']])
+        self.assertEqual(self.jobs.list('tata'), [])
+        self.assertTrue(self.jobs.cancel(job['id']))
+        self.assertIsNone(self.jobs.get(job['id']))
+
+    def test_restore_jobs_limits(self):
+        import time
+        job, err = self.jobs.create('toto', 'client', 1, '{}', 0, 'zip', None, None)
+        job = self.wait(job['id'])
+        # pretend the job is still running
+        job['phase'] = 'restoring'
+        self.jobs._write(job)
+        _, err = self.jobs.create('toto', 'client', 2, '{}', 0, 'zip', None, None)
+        self.assertIsNotNone(err)
+        job2, err = self.jobs.create('tata', 'client', 2, '{}', 0, 'zip', None, None)
+        self.assertIsNone(err)
+        # finished jobs are removed once the ttl is reached
+        self.wait(job2['id'])
+        self.jobs.ttl = 0
+        time.sleep(0.01)
+        self.assertEqual(self.jobs.list(), [])
+
+    def test_restore_job_long_running(self):
+        import time
+        import threading
+        from burpui.utils import BUIprogress
+
+        release = threading.Event()
+
+        def stream(progress):
+            yield b'x'
+
+        def restore_stream(*args):
+            # burp reports nothing while it restores the files
+            release.wait(5)
+            return BUIprogress(stream), None
+
+        self.jobs.app.cli.restore_stream = restore_stream
+        self.jobs.ttl = 0.5
+        self.jobs.heartbeat = 0.1
+        job, err = self.jobs.create('toto', 'client', 1, '{}', 0, 'zip', None, None)
+        self.assertIsNone(err)
+        time.sleep(1)
+        # the running job outlives the ttl
+        self.assertEqual([x['id'] for x in self.jobs.list()], [job['id']])
+        self.assertEqual(self.jobs.get(job['id'])['phase'], 'restoring')
+        release.set()
+        self.assertEqual(self.wait(job['id'])['phase'], 'done')
+
+class BurpuiCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 11\n')
+
+    def tearDown(self):
+        print ('\nTest 11 Finished!\n')
+
+    def test_memory_cache(self):
+        import time
+        from burpui.cache import MemoryCache
+        cache = MemoryCache(maxsize=300)
+        cache.set('a', 'x' * 100)
+        cache.set('b', 'y' * 100)
+        self.assertEqual(cache.get('a'), 'x' * 100)
+        # 'b' is now the least recently used entry
+        cache.set('c', 'z' * 100)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 'z' * 100)
+        self.assertLessEqual(cache.size, 300)
+        # entries larger than the cache are never stored
+        self.assertFalse(cache.set('d', 'w' * 1000))
+        cache.set('e', 'v', timeout=1)
+        self.assertTrue(cache.has('e'))
+        time.sleep(1.1)
+        self.assertIsNone(cache.get('e'))
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+
+    def test_backup_events(self):
+        from burpui.misc.backend.burp1 import Burp
+        cli = Burp(dummy=True)
+        cli._logger = lambda *args: None
+        events = []
+        cli.add_listener(lambda started, finished, agent: events.append((started, finished, agent)))
+        cli._observe_running(['toto'])
+        cli._observe_running(['toto'])
+        self.assertEqual(events, [])
+        cli._observe_running(['toto', 'tata'])
+        cli._observe_running(['tata'])
+        self.assertEqual(events, [(['tata'], [], None), ([], ['toto'], None)])
+
+    def test_shared_backend_cache(self):
+        from burpui.api import ApiWrapper
+        from burpui.cache import MemoryCache
+
+        class FakeCli(object):
+            calls = 0
+
+            def get_all_clients(self, agent=None):
+                self.calls += 1
+                return [{'name': 'toto'}, {'name': 'tata'}]
+
+        class FakeBui(object):
+            cli = FakeCli()
+            cachettl = {'disabled': 0}
+
+        class FakeApi(object):
+            bui = FakeBui()
+            cache = MemoryCache()
+
+        call = getattr(ApiWrapper.call, '__func__', ApiWrapper.call)
+        fake = FakeApi()
+        # every user gets the same raw result
+        for _ in range(3):
+            self.assertEqual(len(call(fake, 'clients_stats', 1800, 'get_all_clients', agent='srv1')), 2)
+        self.assertEqual(fake.bui.cli.calls, 1)
+        call(fake, 'clients_stats', 1800, 'get_all_clients', agent='srv2')
+        self.assertEqual(fake.bui.cli.calls, 2)
+        call(fake, 'disabled', 1800, 'get_all_clients', agent='srv1')
+        self.assertEqual(fake.bui.cli.calls, 3)
+
+    def test_clients_changes(self):
+        from burpui.misc.backend.burp1 import Burp
+        cli = Burp(dummy=True)
+        clients = [
+            {'name': 'toto', 'state': 'idle', 'last': 'never'},
+            {'name': 'tata', 'state': 'idle', 'last': 'never'},
+        ]
+        cli._record_changes(clients)
+        res = cli.get_changes()
+        self.assertTrue(res['full'])
+        self.assertEqual(sorted(x['name'] for x in res['clients']), ['tata', 'toto'])
+        version = res['version']
+        # nothing changed
+        cli._record_changes(clients)
+        res = cli.get_changes(version)
+        self.assertFalse(res['full'])
+        self.assertEqual(res['clients'], [])
+        self.assertEqual(res['version'], version)
+        # only the changed client is returned
+        clients[0] = {'name': 'toto', 'state': 'running', 'phase': 'backup', 'percent': 12, 'last': 'never'}
+        cli._record_changes(clients)
+        res = cli.get_changes(version)
+        self.assertEqual([x['name'] for x in res['clients']], ['toto'])
+        self.assertEqual(res['clients'][0]['percent'], 12)
+        version = res['version']
+        # removed clients are reported
+        cli._record_changes(clients[:1])
+        res = cli.get_changes(version)
+        self.assertEqual(res['clients'], [])
+        self.assertEqual(res['removed'], ['tata'])
+        # unknown versions get the whole list
+        res = cli.get_changes(res['version'] + 42)
+        self.assertTrue(res['full'])
+        self.assertEqual([x['name'] for x in res['clients']], ['toto'])
+
+    def test_clients_changes_shared(self):
+        from burpui.misc.backend.burp1 import Burp
+        # the agent (and the API) may use any backend of the pool
+        cli1 = Burp(dummy=True)
+        cli2 = Burp(dummy=True)
+        cli1.port = cli2.port = 4242
+        clients = [{'name': 'toto', 'state': 'idle', 'last': 'never'}]
+        cli1._record_changes(clients)
+        version = cli2.get_changes()['version']
+        clients.append({'name': 'tata', 'state': 'idle', 'last': 'never'})
+        cli1._record_changes(clients)
+        res = cli2.get_changes(version)
+        self.assertFalse(res['full'])
+        self.assertEqual([x['name'] for x in res['clients']], ['tata'])
+        res = cli1.get_changes(res['version'])
+        self.assertFalse(res['full'])
+        self.assertEqual(res['clients'], [])
+        # other servers have their own change log
+        cli2.port = 4243
+        cli2._record_changes(clients[:1])
+        self.assertEqual([x['name'] for x in cli1.get_changes(version)['clients']], ['tata'])
+        # the versions of another process (or another change log) are unknown
+        cli3 = Burp(dummy=True)
+        cli3.port = 4244
+        cli3._record_changes(clients)
+        res = cli3.get_changes(cli1.get_changes()['version'])
+        self.assertTrue(res['full'])
+        self.assertEqual(sorted(x['name'] for x in res['clients']), ['tata', 'toto'])
+
+
+class BurpuiLiveSamplerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 12\n')
+
+    def tearDown(self):
+        print ('\nTest 12 Finished!\n')
+
+    def test_single_sampler(self):
+        import time
+        from burpui.live import LiveSampler
+        calls = []
+
+        def sample():
+            calls.append(1)
+            return [{'client': 'toto', 'agent': None, 'counters': {'percent': len(calls)}}]
+
+        sampler = LiveSampler(sample, interval=10)
+        subs = [sampler.subscribe() for _ in range(5)]
+        # every viewer gets the same sample
+        for sub in subs:
+            self.assertEqual(sub.get(timeout=5)[0]['counters']['percent'], 1)
+        self.assertEqual(len(calls), 1)
+        for sub in subs:
+            sampler.unsubscribe(sub)
+        # the sampler stops with the last viewer
+        for _ in range(50):
+            if sampler.thread is None:
+                break
+            time.sleep(0.1)
+        self.assertIsNone(sampler.thread)
+        self.assertEqual(len(calls), 1)
+
+    def test_serialized_status(self):
+        import shutil
+        import threading
+        from burpui.misc.backend.burp2 import Burp
+        tmpdir = tempfile.mkdtemp()
+        try:
+            # fake monitor answering every query with its own text
+            burpbin = os.path.join(tmpdir, 'burp')
+            with open(burpbin, 'w') as fileobj:
+                fileobj.write('#!/bin/sh\n'
+                              '[ "$1" = "-v" ] && echo burp-2.0.40 && exit 0\n'
+                              'while read query; do sleep 0.05; echo "{\\"query\\": \\"$query\\"}"; done\n')
+            os.chmod(burpbin, 0o755)
+            conf = os.path.join(tmpdir, 'burpui.cfg')
+            with open(conf, 'w') as fileobj:
+                fileobj.write('[Burp2]\nburpbin = {}\narchivecache = 0\nslowquery = 0\n'.format(burpbin))
+            cli = Burp(conf=conf)
+            cli._kill_burp()
+            answers = {}
+            spawned = []
+            spawn = cli._spawn_burp
+
+            def count():
+                spawned.append(1)
+                spawn()
+
+            def query(name):
+                answers[name] = cli.status('c:{}'.format(name))
+
+            cli._spawn_burp = count
+            # the live monitor and the requests of a threaded server share
+            # the same process
+            threads = [threading.Thread(target=query, args=('client{}'.format(x),)) for x in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            cli._kill_burp()
+            self.assertEqual(len(spawned), 1)
+            self.assertEqual(answers, dict(('client{}'.format(x), {'query': 'c:client{}'.format(x)}) for x in range(5)))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class BurpuiMetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 13\n')
+
+    def tearDown(self):
+        print ('\nTest 13 Finished!\n')
+
+    def test_registry(self):
+        from burpui.metrics import Registry
+        registry = Registry()
+        registry.declare('test_seconds', 'histogram', 'Test histogram', (0.1, 1))
+        registry.declare('test_total', 'counter', 'Test counter')
+        registry.declare('test_gauge', 'gauge', 'Test gauge')
+        registry.gauge('test_gauge', lambda: 3)
+        registry.observe('test_seconds', 0.05, {'method': 'a'})
+        registry.observe('test_seconds', 0.5, {'method': 'a'})
+        registry.observe('test_seconds', 5, {'method': 'a'})
+        registry.inc('test_total', {'code': 200})
+        registry.inc('test_total', {'code': 200})
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{method="a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{method="a",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{method="a",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{method="a"} 3', lines)
+        self.assertIn('test_total{code="200"} 2', lines)
+        self.assertIn('test_gauge 3', lines)
+
+    def test_status_queries(self):
+        from burpui.metrics import registry, instrument_backend, query_shape
+        from burpui.misc.backend.burp1 import Burp
+        self.assertEqual(query_shape('\n'), 'summary')
+        self.assertEqual(query_shape('c:toto:b:3:l:backup\n'), 'c:*:b:*:l:*')
+
+        def count():
+            hist = registry.values['burpui_status_query_seconds'].get((('query', 'c:*'),))
+            return hist.count if hist else 0
+
+        before = count()
+        cli = Burp(dummy=True)
+        cli.status = lambda query='\n', agent=None: []
+        instrument_backend(cli)
+        cli.status('c:toto\n')
+        cli.status('c:tata\n')
+        self.assertEqual(count(), before + 2)
+        self.assertIn('burpui_status_query_seconds_count{query="c:*"}', registry.render())
+
+    def test_slow_queries(self):
+        from burpui.slowlog import SlowLog
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'slow.log')
+            slowlog = SlowLog(0.5, path, name='burpui.test.slowlog')
+            slowlog.record('c:toto\n', 10, 0.1, 0.01)
+            slowlog.record('c:toto:b:1\n', 100, 1, 0.2)
+            slowlog.record('c:tata:b:2\n', 300, 2, 0.3)
+            slowlog.record('c:tata\n', 10, 0.6, 0.1)
+            summary = slowlog.summary()
+            self.assertEqual([x['shape'] for x in summary], ['c:*:b:*', 'c:*'])
+            self.assertEqual(summary[0]['count'], 2)
+            self.assertEqual(summary[0]['seconds'], 3)
+            self.assertEqual(summary[0]['max'], 2)
+            self.assertEqual(summary[0]['bytes'], 400)
+            self.assertEqual(summary[0]['last'], 'c:tata:b:2')
+            for handler in slowlog.logger.handlers:
+                handler.flush()
+            with open(path) as log:
+                lines = log.readlines()
+            self.assertEqual(len(lines), 3)
+            self.assertIn("bytes=100 parse=0.200s", lines[0])
+            self.assertIn("test_burpui.test_slow_queries", lines[0])
+        finally:
+            for handler in slowlog.logger.handlers:
+                handler.close()
+            slowlog.logger.handlers = []
+            import shutil
+            shutil.rmtree(tmp)
+
+    def test_slow_queries_shared(self):
+        from burpui.slowlog import SlowLog, open_slowlog
+        tmp = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(tmp)
+            # every backend of the process records in the same log
+            slowlog = open_slowlog(0.5, 'slow.log')
+            self.assertIs(open_slowlog(0.5, os.path.join(tmp, 'slow.log')), slowlog)
+            self.assertIsNot(open_slowlog(0.5), slowlog)
+            slowlog.record('c:toto\n', 10, 1, 0.1)
+            self.assertEqual(open_slowlog(0.5, 'slow.log').summary()[0]['count'], 1)
+            # a relative path is not opened twice
+            SlowLog(0.5, 'slow.log')
+            self.assertEqual(len(slowlog.logger.handlers), 1)
+        finally:
+            os.chdir(cwd)
+            for handler in slowlog.logger.handlers:
+                handler.close()
+            slowlog.logger.handlers = []
+            import shutil
+            shutil.rmtree(tmp)
+
+
+class BurpuiTracingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 14\n')
+
+    def tearDown(self):
+        print ('\nTest 14 Finished!\n')
+
+    def test_disabled(self):
+        from burpui.tracing import Tracer, NOSPAN
+        tracer = Tracer(sampling=0)
+        self.assertIsNone(tracer.begin())
+        self.assertIs(tracer.span('status'), NOSPAN)
+        self.assertIsNone(tracer.end())
+
+    def test_breakdown(self):
+        from burpui.tracing import Tracer
+        logs = []
+        tracer = Tracer(sampling=0, slow=0, logger=lambda lvl, msg: logs.append((lvl, msg)))
+        trace = tracer.begin('abcd', '/api/clients.json', force=True)
+        with tracer.span('backend.get_all_clients'):
+            with tracer.span('status', 'c:*'):
+                pass
+        self.assertIs(tracer.end(), trace)
+        self.assertIsNone(tracer.current)
+        self.assertEqual([x[0] for x in trace.breakdown()], ['backend.get_all_clients', 'status'])
+        self.assertEqual([x[3] for x in trace.breakdown()], [0, 1])
+        self.assertEqual(len(logs), 1)
+        self.assertEqual(logs[0][0], 'debug')
+        self.assertIn('trace abcd /api/clients.json', logs[0][1])
+        self.assertIn('status (c:*)', logs[0][1])
+        self.assertIn('s1;desc="status c:*"', trace.server_timing())
+
+    def test_agent_envelope(self):
+        from burpui.tracing import tracer
+        from burpui.misc.backend.multi import NClient
+
+        class FakeApp(object):
+            logger = __import__('logging').getLogger('test')
+
+        sent = []
+
+        class FakeSocket(object):
+            def sendall(self, data):
+                sent.append(data)
+
+            def recv(self, length):
+                return b''
+
+        from burpui.metrics import registry
+
+        def count():
+            hist = registry.values['burpui_agent_request_seconds'].get((('agent', 'agent1'), ('func', 'get_all_clients')))
+            return hist.count if hist else 0
+
+        before = count()
+        cli = NClient(FakeApp(), 'localhost', 10000, 'password', False, 5, name='agent1')
+        cli.connected = True
+        cli.sock = FakeSocket()
+        cli.conn = lambda restarted=False: None
+        tracer.begin('abcd', force=True)
+        try:
+            cli.do_command({'func': 'get_all_clients', 'args': None})
+        finally:
+            trace = tracer.end()
+        self.assertEqual(json.loads(sent[1].decode('utf-8'))['trace'], 'abcd')
+        # the requests are timed whatever greenlet sends them
+        self.assertEqual(count(), before + 1)
+        self.assertEqual([x[0] for x in trace.breakdown()], ['agent.get_all_clients'])
+
+
+class BurpuiLoggingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 15\n')
+
+    def tearDown(self):
+        print ('\nTest 15 Finished!\n')
+
+    def test_caller(self):
+        import logging
+        from burpui.utils import BUIlogging
+
+        records = []
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                records.append(record)
+
+        class Wrapper(BUIlogging):
+            padding = 1
+
+            def _logger(self, level, msg, *args):
+                super(Wrapper, self)._logger(level, msg, *args)
+
+        logger = logging.getLogger('burpui.test.logging')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(Handler())
+        makeRecord = logger.makeRecord
+        log = BUIlogging()
+        log.logger = logger
+        log._logger('debug', 'filtered')
+        log._logger('info', 'hello %s', 'world')
+        wrapper = Wrapper()
+        wrapper.logger = logger
+        wrapper._logger('warning', 'padded')
+        self.assertEqual([x.getMessage() for x in records], ['hello world', 'padded'])
+        for record in records:
+            self.assertEqual(record.funcName, 'test_caller')
+            self.assertEqual(os.path.basename(record.pathname), os.path.basename(__file__).replace('.pyc', '.py'))
+        self.assertEqual(records[1].levelname, 'WARNING')
+        # the shared logger is left untouched
+        self.assertEqual(logger.makeRecord, makeRecord)
+
+
+class BurpuiCaptureTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 16\n')
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+        print ('\nTest 16 Finished!\n')
+
+    def test_anonymise(self):
+        from burpui.capture import Anonymiser
+
+        anon = Anonymiser()
+        clients = anon.burp1('\n', [u'alice\t1\ti\t3 0 1475000000', u'bob\t1\tr\t2\t0\t/home/bob'])
+        self.assertEqual(clients, [u'client1\t1\ti\t3 0 1475000000', u'client2\t1\tr\t2\t0\t/f1/f2'])
+        tree = anon.burp1('c:alice:b:3:p:/home', [
+            u'-list begin-',
+            u'drwxr-xr-x 1 0 0 4096 2016-01-01 10:00:00 bob',
+            u'-rw-r--r-- 1 0 0 42 2016-01-01 10:00:00 notes of alice.txt',
+            u'-list end-',
+        ])
+        self.assertEqual(tree[1], u'drwxr-xr-x 1 0 0 4096 2016-01-01 10:00:00 f2')
+        self.assertEqual(tree[2], u'-rw-r--r-- 1 0 0 42 2016-01-01 10:00:00 f3.txt')
+        # the queries are anonymised the same way so the tree remains browsable
+        self.assertEqual(anon.query('c:alice:b:3:p:/home/bob\n'), 'c:client1:b:3:p:/f1/f2\n')
+        self.assertEqual(anon.burp1('c:bob:b:3:f:log.gz', [u'bob: backup done']), [u'client2: backup done'])
+        doc = json.loads(anon.burp2('{"clients": [{"name": "alice", "backups": [{"browse": {"directory": "/home/bob", "entries": [{"name": "bob"}]}}]}]}'))
+        self.assertEqual(doc['clients'][0]['name'], 'client1')
+        self.assertEqual(doc['clients'][0]['backups'][0]['browse'], {'directory': '/f1/f2', 'entries': [{'name': 'f2'}]})
+
+    def test_replay(self):
+        from burpui.capture import Capture, Replay
+
+        path = os.path.join(self.tmpdir, 'capture.gz')
+        capture = Capture(path, 2, info={'server_version': '2.0.54'})
+        capture.record('c:\n', '{"clients": []}', capture.start, 0.5)
+        capture.record('c:\n', '{"clients": [{"name": "toto"}]}', capture.start + 1, 0.5)
+        # an interrupted capture can still be replayed
+        replay = Replay(path, 0)
+        self.assertEqual(replay.backend, 2)
+        self.assertEqual(replay.header['server_version'], '2.0.54')
+        self.assertEqual(replay.answer('c:'), '{"clients": []}')
+        self.assertEqual(replay.answer('c:\n'), '{"clients": [{"name": "toto"}]}')
+        self.assertEqual(replay.answer('c:\n'), '{"clients": []}')
+        self.assertEqual(replay.answer('c:toto\n'), None)
+        capture.close()
+        with open(path, 'wb') as fileobj:
+            fileobj.write(b'garbage')
+        self.assertRaises(ValueError, Replay, path)
+
+    def test_burp1_replay(self):
+        from burpui.capture import Capture
+        from burpui.misc.backend.burp1 import Burp
+
+        path = os.path.join(self.tmpdir, 'capture.gz')
+        capture = Capture(path, 1, info={'server_version': '1.4.40'})
+        capture.record('\n', [u'toto\t1\ti\t3 0 1475000000'], capture.start, 0.1)
+        capture.close()
+        conf = os.path.join(self.tmpdir, 'burpui.cfg')
+        with open(conf, 'w') as fileobj:
+            fileobj.write('[Burp1]\nbhost: 127.0.0.1\nbport: 9999\nbconfcli: /dev/null\nbconfsrv: /dev/null\ntmpdir: {}\nreplay: {}\nreplayspeed: 0\n'.format(self.tmpdir, path))
+        cli = Burp(conf=conf)
+        self.assertEqual(cli.get_server_version(), '1.4.40')
+        self.assertEqual([x['name'] for x in cli.get_all_clients()], ['toto'])
+        self.assertEqual(cli.get_client('titi'), [])
+
+
+class BurpuiProfilingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 17\n')
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+        print ('\nTest 17 Finished!\n')
+
+    def test_profile(self):
+        import pstats
+        from burpui.profiling import Profiler
+
+        profiler = Profiler()
+        self.assertIsNone(profiler.start('disabled', force=True))
+        profiler.configure(self.tmpdir, keep=2)
+        self.assertIsNone(profiler.start('not sampled'))
+        self.assertIsNotNone(profiler.start('api/clients stats', force=True))
+        # a single profile at a time
+        self.assertIsNone(profiler.start('nested', force=True))
+        sorted(range(1000))
+        path = profiler.stop()
+        self.assertEqual(os.path.basename(path).split('-')[2], 'api_clients_stats')
+        self.assertTrue(pstats.Stats(path).total_calls > 0)
+        self.assertIsNone(profiler.stop())
+        profiler.configure(self.tmpdir, sampling=1, keep=2)
+        for name in ['first', 'second', 'third']:
+            profiler.start(name)
+            profiler.stop()
+        # only the most recent profiles are kept
+        self.assertEqual(len(os.listdir(self.tmpdir)), 2)
+
+
+class BurpuiParseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 18\n')
+        self.tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmpdir, 'clientconfdir'))
+        os.makedirs(os.path.join(self.tmpdir, 'inc', 'a'))
+        self.conf = os.path.join(self.tmpdir, 'burp-server.conf')
+        with open(self.conf, 'w') as conf:
+            conf.write('directory = /var/spool/burp\nclientconfdir = clientconfdir\n. inc/*/*.conf\nkeep = 7\nkeep = 4\n')
+        with open(os.path.join(self.tmpdir, 'clientconfdir', 'toto'), 'w') as conf:
+            conf.write('password = toto\n')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+        print ('\nTest 18 Finished!\n')
+
+    def test_cache(self):
+        from werkzeug.datastructures import MultiDict
+        from burpui.misc.parser.burp1 import Parser
+
+        parser = Parser(None, self.conf)
+        reads = []
+        readfile = parser._readfile
+
+        def counting(*args, **kwargs):
+            reads.append(args[0])
+            return readfile(*args, **kwargs)
+        parser._readfile = counting
+
+        res = parser.read_server_conf()
+        parser.list_clients()
+        self.assertEqual(reads, [])
+        self.assertEqual(res['multi'], [{'name': 'keep', 'value': ['7', '4']}])
+        self.assertEqual(res['includes_ext'], [])
+        self.assertEqual(parser.workingdir, '/var/spool/burp')
+        # a new match of the include glob, even in a new directory
+        os.makedirs(os.path.join(self.tmpdir, 'inc', 'b'))
+        with open(os.path.join(self.tmpdir, 'inc', 'b', 'b.conf'), 'w'):
+            pass
+        res = parser.read_server_conf()
+        self.assertEqual([x['name'] for x in res['includes_ext']], [os.path.join(self.tmpdir, 'inc', 'b', 'b.conf')])
+        self.assertEqual(len(reads), 1)
+
+        self.assertEqual(parser.read_client_conf('toto')['common'], [{'name': 'password', 'value': 'toto'}])
+        parser.read_client_conf('toto')
+        self.assertEqual(len(reads), 2)
+        data = MultiDict([('password', 'titi')])
+        self.assertEqual(parser.store_client_conf(data, 'toto'), [[0, 'Configuration successfully saved.']])
+        self.assertEqual(len(reads), 3)
+        # the store updated the cache
+        self.assertEqual(parser.read_client_conf('toto')['common'], [{'name': 'password', 'value': 'titi'}])
+        self.assertEqual(len(reads), 3)
+
+    def test_tokenizer(self):
+        from burpui.misc.parser.burp1 import Parser
+
+        parser = Parser(None, self.conf)
+        lines = [
+            '  # comment',
+            'include = /home',
+            'exclude=/home/tmp',
+            'hardlinked_archive = 1',
+            'include = /etc',
+            'max_children = 3',
+            'password = toto',
+            'keep = 7',
+        ]
+        dic, boolean, multi, integer, includes, _ = parser._parse_lines(lines, 'srv')
+        self.assertEqual(dic, [{'name': 'password', 'value': 'toto'}])
+        self.assertEqual(boolean, [{'name': 'hardlinked_archive', 'value': True}])
+        self.assertEqual(integer, [{'name': 'max_children', 'value': 3}])
+        self.assertEqual(multi, [
+            {'name': 'include', 'value': ['/home', '/etc']},
+            {'name': 'exclude', 'value': ['/home/tmp']},
+            {'name': 'keep', 'value': ['7']},
+        ])
+        self.assertEqual(includes, [])
+        # the server-only keys are plain strings in the client configurations
+        dic, _, _, integer, _, _ = parser._parse_lines(lines, 'cli')
+        self.assertEqual(integer, [])
+        self.assertIn({'name': 'max_children', 'value': '3'}, dic)
+
+
+class BurpuiClientIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 19\n')
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ['alpha', 'beta', 'betamax', '.hidden', 'old~']:
+            with open(os.path.join(self.tmpdir, name), 'w') as conf:
+                conf.write('password = {}\n'.format(name))
+        self.indexes = []
+
+    def tearDown(self):
+        import shutil
+        for index in self.indexes:
+            index.stop()
+        shutil.rmtree(self.tmpdir)
+        print ('\nTest 19 Finished!\n')
+
+    def wait(self, index, names):
+        import time
+        for _ in range(100):
+            if [x['name'] for x in index.entries()] == names:
+                break
+            time.sleep(0.05)
+        self.assertEqual([x['name'] for x in index.entries()], names)
+
+    def check(self, method):
+        from burpui.misc.parser.watcher import ClientIndex
+
+        index = ClientIndex(self.tmpdir, method, 0.1)
+        self.indexes.append(index)
+        changed = []
+        index.listeners.append(changed.append)
+        self.wait(index, ['alpha', 'beta', 'betamax'])
+        self.assertEqual(index.entries('bet'), [
+            {'name': 'beta', 'value': os.path.join(self.tmpdir, 'beta')},
+            {'name': 'betamax', 'value': os.path.join(self.tmpdir, 'betamax')},
+        ])
+        self.assertEqual(index.entries('gamma'), [])
+        with open(os.path.join(self.tmpdir, 'gamma'), 'w'):
+            pass
+        os.rename(os.path.join(self.tmpdir, 'alpha'), os.path.join(self.tmpdir, 'delta'))
+        os.unlink(os.path.join(self.tmpdir, 'betamax'))
+        self.wait(index, ['beta', 'delta', 'gamma'])
+        self.assertIn(os.path.join(self.tmpdir, 'alpha'), changed)
+        self.assertIn(os.path.join(self.tmpdir, 'betamax'), changed)
+        return index
+
+    def test_poll(self):
+        self.assertEqual(self.check('poll').mode, 'poll')
+
+    def test_inotify(self):
+        from burpui.misc.parser.watcher import Inotify
+        try:
+            Inotify().close()
+        except (OSError, AttributeError):
+            self.skipTest('inotify is not available')
+        index = self.check('inotify')
+        self.assertEqual(index.mode, 'inotify')
+        # the parsed configuration of a modified client is dropped
+        changed = []
+        index.listeners.append(changed.append)
+        with open(os.path.join(self.tmpdir, 'beta'), 'w') as conf:
+            conf.write('password = changed\n')
+        self.wait(index, ['beta', 'delta', 'gamma'])
+        import time
+        for _ in range(100):
+            if changed:
+                break
+            time.sleep(0.05)
+        self.assertEqual(changed, [os.path.join(self.tmpdir, 'beta')])
+
+    def test_parser(self):
+        from werkzeug.datastructures import MultiDict
+        from burpui.misc.parser.burp1 import Parser
+
+        conf = os.path.join(self.tmpdir, '.burp-server.conf')
+        with open(conf, 'w') as fileobj:
+            fileobj.write('clientconfdir = {}\n'.format(self.tmpdir))
+        parser = Parser(None, conf)
+        parser.watch('poll', 0.1)
+        self.assertEqual([x['name'] for x in parser.list_clients('b')], ['beta', 'betamax'])
+        self.indexes.append(parser.index)
+        # a new client is known as soon as it is stored
+        self.assertEqual(parser.store_client_conf(MultiDict(), 'bravo'), [[0, 'Configuration successfully saved.']])
+        self.assertEqual([x['name'] for x in parser.list_clients('b')], ['beta', 'betamax', 'bravo'])
+        self.assertEqual(parser.remove_client('beta')[0], 0)
+        self.assertEqual([x['name'] for x in parser.list_clients('b')], ['betamax', 'bravo'])
+
+
+class BurpuiPatchClientsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 20\n')
+        self.tmpdir = tempfile.mkdtemp()
+        self.clientconfdir = os.path.join(self.tmpdir, 'clientconfdir')
+        os.makedirs(self.clientconfdir)
+        self.conf = os.path.join(self.tmpdir, 'burp-server.conf')
+        with open(self.conf, 'w') as conf:
+            conf.write('clientconfdir = clientconfdir\n')
+        self.write('alpha', '# alpha\npassword = alpha\ninclude = /home\ninclude = /etc\nclient_can_delete = 0\n')
+        self.write('alpine', 'password = alpine\nkeep = 7\n')
+        self.write('beta', 'password = beta\n')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+        print ('\nTest 20 Finished!\n')
+
+    def write(self, name, content):
+        with open(os.path.join(self.clientconfdir, name), 'w') as conf:
+            conf.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.clientconfdir, name)) as conf:
+            return conf.read()
+
+    def test_patch(self):
+        from burpui.misc.parser.burp1 import Parser
+
+        parser = Parser(None, self.conf)
+        res = parser.patch_clients('al*', {'include': ['/srv'], 'client_can_delete': True, 'keep': None, 'protocol': '1'})
+        self.assertEqual(res, [
+            {'name': 'alpha', 'notif': [0, "'alpha' successfully updated"]},
+            {'name': 'alpine', 'notif': [0, "'alpine' successfully updated"]},
+        ])
+        self.assertEqual(self.read('alpha'), '# alpha\npassword = alpha\ninclude = /srv\nclient_can_delete = 1\nprotocol = 1\n')
+        self.assertEqual(self.read('alpine'), 'password = alpine\n#keep = 7\nclient_can_delete = 1\ninclude = /srv\nprotocol = 1\n')
+        self.assertEqual(self.read('beta'), 'password = beta\n')
+        # the previous versions are kept and never listed as clients
+        self.assertTrue(os.path.isfile(os.path.join(self.clientconfdir, 'alpha.bui.init.back~')))
+        self.assertEqual(sorted(x['name'] for x in parser.list_clients()), ['alpha', 'alpine', 'beta'])
+        # the parse cache does not serve the former content
+        self.assertIn({'name': 'include', 'value': ['/srv']}, parser.read_client_conf('alpha')['multi'])
+        res = parser.patch_clients('alpha', {'include': '/srv'})
+        self.assertEqual(res[0]['notif'][0], 3)
+
+    def test_invalid(self):
+        from burpui.misc.parser.burp1 import Parser
+        from burpui.exceptions import BUIserverException
+
+        parser = Parser(None, self.conf)
+        for patch in [{}, {'unknown': '1'}, {'protocol': 'x'}, {'client_can_delete': 'maybe'}, {'max_children': '3'},
+                      {'password': 'a\nkeep = 1'}, {'password': ['a', 'b']}]:
+            self.assertRaises(BUIserverException, parser.patch_clients, '*', patch)
+        # nothing was written
+        self.assertEqual(self.read('beta'), 'password = beta\n')
+        self.assertEqual(parser.patch_clients('gamma*', {'password': 'x'}), [])
+
+
+class BurpuiVssStripTestCase(unittest.TestCase):
+
+    # fake vss_strip: the files starting with "VSS" embed headers
+    STRIPBIN = """#!/bin/sh
+echo "$@" >> "$(dirname "$0")/calls"
+if [ "$1" = "-p" ]; then
+    head -c 3 "$3" | grep -q VSS && echo "headers found"
+    exit 0
+fi
+head -c 3 "$2" | grep -q VSS || exit 1
+tail -c +4 "$2" > "$4"
+"""
+
+    def setUp(self):
+        print ('\nBegin Test 21\n')
+        self.tmpdir = tempfile.mkdtemp()
+        self.restored = os.path.join(self.tmpdir, 'restored')
+        os.makedirs(os.path.join(self.restored, 'sub'))
+        self.stripbin = os.path.join(self.tmpdir, 'vss_strip')
+        with open(self.stripbin, 'w') as fileobj:
+            fileobj.write(self.STRIPBIN)
+        os.chmod(self.stripbin, 0o755)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+        print ('\nTest 21 Finished!\n')
+
+    def backend(self):
+        from burpui.misc.backend.burp1 import Burp
+
+        conf = os.path.join(self.tmpdir, 'burpui.cfg')
+        with open(conf, 'w') as fileobj:
+            fileobj.write('[Burp1]\nbhost: 127.0.0.1\nbport: 9999\nbconfcli: /dev/null\nbconfsrv: /dev/null\ntmpdir: {}\nstripbin: {}\nstripworkers: 3\nstripbatch: 2\n'.format(self.tmpdir, self.stripbin))
+        cli = Burp(conf=conf)
+        self.assertEqual(cli.stripbin, self.stripbin)
+        self.assertEqual((cli.strip_workers, cli.strip_batch), (3, 2))
+        return cli
+
+    def write(self, name, content):
+        with open(os.path.join(self.restored, name), 'w') as fileobj:
+            fileobj.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.restored, name)) as fileobj:
+            return fileobj.read()
+
+    def calls(self):
+        with open(os.path.join(self.tmpdir, 'calls')) as fileobj:
+            return fileobj.read().splitlines()
+
+    def test_strip(self):
+        names = ['f{}'.format(x) for x in range(6)] + [os.path.join('sub', 'f6')]
+        for name in names:
+            self.write(name, 'VSS' + name)
+        files = list(self.backend()._restored_files(self.restored))
+        self.assertEqual(sorted(x[1] for x in files), sorted(names))
+        for name in names:
+            self.assertEqual(self.read(name), name)
+        # one detection, then one vss_strip per file whatever the batches
+        calls = self.calls()
+        self.assertEqual(len([x for x in calls if x.startswith('-p ')]), 1)
+        self.assertEqual(len([x for x in calls if x.startswith('-i ')]), len(names))
+        self.assertFalse([x for x in os.listdir(self.restored) if x.endswith('.tmp')])
+
+    def test_no_headers(self):
+        for name in ['f0', 'f1', 'f2']:
+            self.write(name, name)
+        files = list(self.backend()._restored_files(self.restored))
+        self.assertEqual(sorted(x[1] for x in files), ['f0', 'f1', 'f2'])
+        # the detection found nothing so no file is stripped
+        self.assertEqual([x.split()[0] for x in self.calls()], ['-p'])
+        self.assertEqual(self.read('f1'), 'f1')
+
+    def test_failure_disables_stripping(self):
+        cli = self.backend()
+        cli.strip_workers = 1
+        names = ['f{}'.format(x) for x in range(6)]
+        for name in names:
+            self.write(name, 'VSS' + name)
+        # the files are stripped in the order they are walked
+        order = [x for x in os.listdir(self.restored) if x in names]
+        self.write(order[1], 'plain')
+        files = list(cli._restored_files(self.restored))
+        self.assertEqual(sorted(x[1] for x in files), sorted(names))
+        # once vss_strip fails on a file, the next ones are left untouched
+        self.assertEqual(len([x for x in self.calls() if x.startswith('-i ')]), 2)
+        self.assertEqual(self.read(order[0]), order[0])
+        self.assertEqual(self.read(order[1]), 'plain')
+        for name in order[2:]:
+            self.assertEqual(self.read(name), 'VSS' + name)
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'the asyncio agent requires python >= 3.5')
+class BurpuiAsyncAgentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print ('\nBegin Test 22\n')
+        import asyncio
+        from burpui.async_agent import AsyncAgentServer
+        from burpui.exceptions import BUIserverException
+        from burpui.utils import BUIprogress
+
+        class FakeAgent(object):
+            threads = 1
+            vers = 1
+            logger = None
+            conf = None
+            password = 'secret'
+
+            def _logger(self, *args):
+                pass
+
+        test = self
+
+        class FakeHandler(object):
+            def get_all_clients(self, agent=None):
+                return [{'name': 'toto'}]
+
+            def get_client(self, name=None, backup=None, agent=None):
+                return [{'name': name, 'backup': backup}]
+
+            def is_backup_running(self, name=None, agent=None):
+                raise BUIserverException('Unknown client {}'.format(name))
+
+            def restore_stream(self, **args):
+                def stream(progress):
+                    for chunk in [b'abc', b'defg']:
+                        # the handler is not given to another request
+                        test.idle.append(test.server.pool.qsize())
+                        progress.files += 2
+                        yield chunk
+                return BUIprogress(stream), None
+
+        self.idle = []
+        self.server = AsyncAgentServer(FakeAgent())
+        self.server.clients = [FakeHandler()]
+        asyncio.set_event_loop(self.server.loop)
+
+    def tearDown(self):
+        import asyncio
+        self.server.executor.shutdown()
+        self.server.loop.close()
+        asyncio.set_event_loop(None)
+        print ('\nTest 22 Finished!\n')
+
+    def exchange(self, *requests):
+        """Send the requests on a connection and returns the answers"""
+        import asyncio
+        import struct
+
+        class FakeWriter(object):
+            data = b''
+            closed = False
+
+            def write(self, data):
+                self.data += data
+
+            def drain(self):
+                return asyncio.sleep(0)
+
+            def get_extra_info(self, name):
+                return None
+
+            def close(self):
+                self.closed = True
+
+        self.server.pool = asyncio.Queue()
+        for cli in self.server.clients:
+            self.server.pool.put_nowait(cli)
+        reader = asyncio.StreamReader()
+        for req in requests:
+            if not isinstance(req, bytes):
+                req = json.dumps(dict(req, password=req.get('password', 'secret'))).encode('utf-8')
+            reader.feed_data(struct.pack('!Q', len(req)) + req)
+        reader.feed_eof()
+        writer = FakeWriter()
+        self.server.loop.run_until_complete(self.server.handle(reader, writer))
+        self.assertTrue(writer.closed)
+        # every handler is back in the pool
+        self.assertEqual(self.server.pool.qsize(), len(self.server.clients))
+        return writer.data
+
+    def answer(self, data):
+        import struct
+        length, = struct.unpack('!Q', data[2:10])
+        return data[:2], data[10:10 + length].decode('utf-8'), data[10 + length:]
+
+    def test_answers(self):
+        data = self.exchange(
+            {'func': 'get_all_clients', 'args': None},
+            {'func': 'is_backup_running', 'args': {'name': 'tata'}},
+            {'func': 'get_all_clients', 'args': None},
+            b'RE',
+            {'func': 'get_all_clients', 'args': None},
+        )
+        code, res, data = self.answer(data)
+        self.assertEqual((code, json.loads(res)), (b'OK', [{'name': 'toto'}]))
+        # the errors are sent back and the connection is kept
+        code, res, data = self.answer(data)
+        self.assertEqual((code, res), (b'ER', 'Unknown client tata'))
+        code, res, data = self.answer(data)
+        self.assertEqual(code, b'OK')
+        # nothing is answered once the client released the connection
+        self.assertEqual(data, b'')
+
+    def test_refused(self):
+        self.assertEqual(self.exchange({'func': 'get_all_clients', 'args': None, 'password': 'wrong'}), b'KO')
+        self.assertEqual(self.exchange({'func': 'unknown', 'args': None}, {'func': 'get_all_clients', 'args': None}), b'KO')
+
+    def test_pickled(self):
+        import pickle
+        from base64 import b64encode
+        args = b64encode(pickle.dumps({'name': 'toto', 'backup': 3}, 2)).decode('utf-8')
+        code, res, _ = self.answer(self.exchange({'func': 'get_client', 'args': args, 'pickled': True}))
+        self.assertEqual((code, json.loads(res)), (b'OK', [{'name': 'toto', 'backup': 3}]))
+
+    def test_stream(self):
+        import struct
+        from burpui.utils import FRAME_PROGRESS
+        data = self.exchange({'func': 'restore_stream', 'args': {'name': 'toto'}}, {'func': 'get_all_clients', 'args': None})
+        self.assertEqual(data[:4], b'OKOK')
+        data = data[4:]
+        chunks = []
+        files = []
+        while True:
+            length, = struct.unpack('!Q', data[:8])
+            if not length:
+                break
+            if length & FRAME_PROGRESS:
+                files.append(length & ~FRAME_PROGRESS)
+                data = data[8:]
+                continue
+            chunks.append(data[8:8 + length])
+            data = data[8 + length:]
+        self.assertEqual(chunks, [b'abc', b'defg'])
+        # the number of archived files is sent along the chunks
+        self.assertEqual(files, [2, 4])
+        # nothing is read after the archive
+        self.assertEqual(data[8:], b'')
+        self.assertEqual(self.idle, [0, 0])
+
+
 #class BurpuiAPILoginTestCase(TestCase):
 #
 #    def setUp(self):